@@ -1,5 +1,6 @@
 const String baseUrl = 'https://senainventario.axchisan.com';
 const String loginEndpoint = '/api/auth/login';
+const String refreshEndpoint = '/api/auth/refresh';
 const String registerEndpoint = '/api/auth/register';
 const String getUserEndpoint = '/api/auth/me';
 const String usersEndpoint = '/api/users/';
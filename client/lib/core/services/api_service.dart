@@ -9,7 +9,7 @@ class ApiService {
 
   ApiService({AuthProvider? authProvider}) : _authProvider = authProvider;
 
-  Future<Map<String, dynamic>> post(String endpoint, Map<String, dynamic> data) async {
+  Map<String, String> _headers() {
     final headers = {
       'Content-Type': 'application/json',
     };
@@ -17,15 +17,31 @@ class ApiService {
     if (_authProvider?.token != null) {
       headers['Authorization'] = 'Bearer ${_authProvider!.token}';
     }
+    return headers;
+  }
 
+  /// Envía la petición y, ante un 401 con sesión iniciada, renueva el access
+  /// token con el refresh token y la reintenta una sola vez.
+  Future<http.Response> _send(Future<http.Response> Function(Map<String, String> headers) request) async {
+    final response = await request(_headers());
+    final authProvider = _authProvider;
+    if (response.statusCode == 401 && authProvider != null && authProvider.token != null) {
+      if (await authProvider.refreshSession()) {
+        return request(_headers());
+      }
+    }
+    return response;
+  }
+
+  Future<Map<String, dynamic>> post(String endpoint, Map<String, dynamic> data) async {
     final uri = Uri.parse('$baseUrl$endpoint');
     
     try {
-      final response = await _client.post(
+      final response = await _send((headers) => _client.post(
         uri,
         headers: headers,
         body: json.encode(data),
-      );
+      ));
 
       return _handleResponse(response, 'POST', endpoint);
     } catch (e) {
@@ -34,14 +50,6 @@ class ApiService {
   }
 
   Future<dynamic> get(String endpoint, {Map<String, String>? queryParams}) async {
-    final headers = {
-      'Content-Type': 'application/json',
-    };
-
-    if (_authProvider?.token != null) {
-      headers['Authorization'] = 'Bearer ${_authProvider!.token}';
-    }
-
     Map<String, String> finalQueryParams = queryParams ?? {};
     
     // For admin_general role, add system-wide access parameter
@@ -53,10 +61,10 @@ class ApiService {
     final uri = Uri.parse('$baseUrl$endpoint').replace(queryParameters: finalQueryParams.isNotEmpty ? finalQueryParams : null);
     
     try {
-      final response = await _client.get(
+      final response = await _send((headers) => _client.get(
         uri,
         headers: headers,
-      );
+      ));
 
       return _handleGetResponse(response, endpoint);
     } catch (e) {
@@ -65,14 +73,6 @@ class ApiService {
   }
 
   Future<Map<String, dynamic>> getSingle(String endpoint) async {
-    final headers = {
-      'Content-Type': 'application/json',
-    };
-
-    if (_authProvider?.token != null) {
-      headers['Authorization'] = 'Bearer ${_authProvider!.token}';
-    }
-
     Map<String, String> queryParams = {};
     if (_authProvider?.currentUser?.role == 'admin_general') {
       queryParams['system_wide'] = 'true';
@@ -84,10 +84,10 @@ class ApiService {
     );
     
     try {
-      final response = await _client.get(
+      final response = await _send((headers) => _client.get(
         uri,
         headers: headers,
-      );
+      ));
 
       return _handleSingleResponse(response, endpoint);
     } catch (e) {
@@ -96,21 +96,13 @@ class ApiService {
   }
 
   Future<Map<String, dynamic>> delete(String endpoint) async {
-    final headers = {
-      'Content-Type': 'application/json',
-    };
-
-    if (_authProvider?.token != null) {
-      headers['Authorization'] = 'Bearer ${_authProvider!.token}';
-    }
-
     final uri = Uri.parse('$baseUrl$endpoint');
     
     try {
-      final response = await _client.delete(
+      final response = await _send((headers) => _client.delete(
         uri,
         headers: headers,
-      );
+      ));
 
       return _handleResponse(response, 'DELETE', endpoint);
     } catch (e) {
@@ -119,22 +111,14 @@ class ApiService {
   }
 
   Future<Map<String, dynamic>> put(String endpoint, Map<String, dynamic> data) async {
-    final headers = {
-      'Content-Type': 'application/json',
-    };
-
-    if (_authProvider?.token != null) {
-      headers['Authorization'] = 'Bearer ${_authProvider!.token}';
-    }
-
     final uri = Uri.parse('$baseUrl$endpoint');
     
     try {
-      final response = await _client.put(
+      final response = await _send((headers) => _client.put(
         uri,
         headers: headers,
         body: json.encode(data),
-      );
+      ));
 
       return _handleResponse(response, 'PUT', endpoint);
     } catch (e) {
@@ -485,14 +469,6 @@ class ApiService {
   }
 
   Future<dynamic> getSystemWide(String endpoint, {Map<String, String>? queryParams}) async {
-    final headers = {
-      'Content-Type': 'application/json',
-    };
-
-    if (_authProvider?.token != null) {
-      headers['Authorization'] = 'Bearer ${_authProvider!.token}';
-    }
-
     Map<String, String> finalQueryParams = queryParams ?? {};
     finalQueryParams['system_wide'] = 'true';
     finalQueryParams['all_environments'] = 'true';
@@ -500,10 +476,10 @@ class ApiService {
     final uri = Uri.parse('$baseUrl$endpoint').replace(queryParameters: finalQueryParams);
     
     try {
-      final response = await _client.get(
+      final response = await _send((headers) => _client.get(
         uri,
         headers: headers,
-      );
+      ));
 
       if (response.statusCode == 200) {
         final responseBody = response.body;
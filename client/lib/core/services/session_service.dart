@@ -7,18 +7,23 @@ class SessionService {
   static const String _kRoleKey = 'user_role';
   static const String _kUserKey = 'user_data';
   static const String _kExpiresAtKey = 'token_expires_at';
+  static const String _kRefreshTokenKey = 'refresh_token';
 
   static Future<void> saveSession({
     required String token,
     required String role,
     required Map<String, dynamic> user,
     required int expiresAt,
+    String? refreshToken,
   }) async {
     final prefs = await SharedPreferences.getInstance();
     await prefs.setString(_kTokenKey, token);
     await prefs.setString(_kRoleKey, role);
     await prefs.setString(_kUserKey, jsonEncode(user));
     await prefs.setInt(_kExpiresAtKey, expiresAt);
+    if (refreshToken != null) {
+      await prefs.setString(_kRefreshTokenKey, refreshToken);
+    }
   }
 
   static Future<void> clear() async {
@@ -27,6 +32,7 @@ class SessionService {
     await prefs.remove(_kRoleKey);
     await prefs.remove(_kUserKey);
     await prefs.remove(_kExpiresAtKey);
+    await prefs.remove(_kRefreshTokenKey);
   }
 
   static Future<bool> hasValidSession() async {
@@ -36,12 +42,20 @@ class SessionService {
 
     final isExpired = JwtDecoder.isExpired(token);
     if (isExpired) {
+      // Con refresh token la sesión se puede renovar; no se borra todavía
+      final refreshToken = prefs.getString(_kRefreshTokenKey);
+      if (refreshToken != null && refreshToken.isNotEmpty) return false;
       await clear();
       return false;
     }
     return true;
   }
 
+  static Future<String?> getRefreshToken() async {
+    final prefs = await SharedPreferences.getInstance();
+    return prefs.getString(_kRefreshTokenKey);
+  }
+
   static Future<String?> getRole() async {
     final prefs = await SharedPreferences.getInstance();
     return prefs.getString(_kRoleKey);
@@ -9,6 +9,8 @@ import '../../data/models/user_model.dart';
 class AuthProvider extends ChangeNotifier {
   UserModel? _currentUser;
   String? _token;
+  String? _refreshToken;
+  Future<bool>? _refreshing;
   bool _isAuthenticated = false;
   bool _isLoading = false;
   String? _errorMessage;
@@ -39,6 +41,7 @@ class AuthProvider extends ChangeNotifier {
         final data = jsonDecode(response.body);
         if (data.containsKey('access_token') && data.containsKey('user')) {
           _token = data['access_token'];
+          _refreshToken = data['refresh_token'];
           _currentUser = UserModel.fromJson(data['user'] as Map<String, dynamic>);
           _isAuthenticated = true;
 
@@ -48,6 +51,7 @@ class AuthProvider extends ChangeNotifier {
             role: _currentUser!.role ?? 'unknown',
             user: data['user'] as Map<String, dynamic>,
             expiresAt: expiresAt,
+            refreshToken: _refreshToken,
           );
         } else {
           _errorMessage = 'Respuesta del servidor inválida.';
@@ -108,12 +112,66 @@ class AuthProvider extends ChangeNotifier {
     await SessionService.clear();
     _currentUser = null;
     _token = null;
+    _refreshToken = null;
     _isAuthenticated = false;
     notifyListeners();
   }
 
+  /// Renueva el access token con el refresh token (que el servidor rota).
+  /// Las llamadas concurrentes comparten la misma renovación. Si falla, cierra la sesión.
+  Future<bool> refreshSession() {
+    return _refreshing ??= _refreshSession().whenComplete(() => _refreshing = null);
+  }
+
+  Future<bool> _refreshSession() async {
+    final refreshToken = _refreshToken ?? await SessionService.getRefreshToken();
+    if (refreshToken == null || refreshToken.isEmpty) {
+      await logout();
+      return false;
+    }
+
+    try {
+      final response = await http.post(
+        Uri.parse('$baseUrl$refreshEndpoint'),
+        headers: {'Content-Type': 'application/json'},
+        body: jsonEncode({'refresh_token': refreshToken}),
+      );
+
+      if (response.statusCode == 200) {
+        final data = jsonDecode(response.body);
+        _token = data['access_token'];
+        _refreshToken = data['refresh_token'] ?? refreshToken;
+        _currentUser = UserModel.fromJson(data['user'] as Map<String, dynamic>);
+        _isAuthenticated = true;
+
+        final expiresAt = JwtDecoder.decode(_token!)['exp'] * 1000;
+        await SessionService.saveSession(
+          token: _token!,
+          role: _currentUser!.role ?? 'unknown',
+          user: data['user'] as Map<String, dynamic>,
+          expiresAt: expiresAt,
+          refreshToken: _refreshToken,
+        );
+        notifyListeners();
+        return true;
+      }
+    } catch (e) {
+      // Sin conexión: se conserva la sesión guardada para reintentar después
+      return false;
+    }
+
+    await logout();
+    return false;
+  }
+
   Future<bool> checkSession() async {
     try {
+      final storedToken = await SessionService.getAccessToken();
+      if (storedToken != null && storedToken.isNotEmpty && JwtDecoder.isExpired(storedToken)) {
+        // Access token vencido: se renueva con el refresh token antes de validar la sesión
+        await refreshSession();
+      }
+
       final hasValidSession = await SessionService.hasValidSession();
       if (hasValidSession) {
         final token = await SessionService.getAccessToken();
@@ -129,6 +187,7 @@ class AuthProvider extends ChangeNotifier {
             final updatedUserData = jsonDecode(response.body);
             _currentUser = UserModel.fromJson(updatedUserData);
             _token = token;
+            _refreshToken = await SessionService.getRefreshToken();
             _isAuthenticated = true;
 
             final expiresAt = JwtDecoder.decode(token)['exp'] * 1000;
@@ -8,9 +8,63 @@ class Settings(BaseSettings):
     DATABASE_NAME: str
     DATABASE_URL: str | None = None 
 
+    # Pool de conexiones (aplica al motor síncrono y al asíncrono)
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_TIMEOUT: float = 30
+    DATABASE_POOL_RECYCLE: int = 1800
+    DATABASE_POOL_PRE_PING: bool = True
+    DATABASE_POOL_SLOW_CHECKOUT: float = 0.5
+    DATABASE_POOL_LOG_INTERVAL: int = 0  # segundos; 0 desactiva el log periódico
+
+    # Réplica de lectura opcional para dashboards, reportes y auditoría
+    DATABASE_REPLICA_URL: str | None = None
+    DATABASE_REPLICA_STICKY_SECONDS: float = 5
+    DATABASE_REPLICA_RETRY_SECONDS: float = 30
+
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
-    ACCESS_TOKEN_EXPIRE: int = 30
+    # 30 días mientras haya builds del cliente sin renovación por /api/auth/refresh;
+    # bajarlo (p. ej. a 30) cuando todas las versiones instaladas la soporten
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 43200
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    SESSION_REVOCATION_SYNC_INTERVAL: float = 15
+    PRINCIPAL_CACHE_SIZE: int = 1024
+    PRINCIPAL_CACHE_TTL: float = 60
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_PENDING: int = 64
+    # Costo de argon2id; calibrar con `python -m scripts.calibrate_argon2`
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536  # KiB
+    ARGON2_PARALLELISM: int = 4
+    TOKEN_VERSION_SYNC_INTERVAL: float = 30
+    AUDIT_MAX_BODY_BYTES: int = 16384  # máximo del cuerpo de la request que se copia al log
+    AUDIT_STORE_BODIES: bool = False
+    AUDIT_STORED_BODY_BYTES: int = 2048
+    AUDIT_COMPRESS_BODIES: bool = True
+    # Escritura por lotes de auditoría
+    AUDIT_BATCH_SIZE: int = 500
+    AUDIT_FLUSH_INTERVAL: float = 1.0
+    AUDIT_QUEUE_SIZE: int = 10000
+    AUDIT_ENQUEUE_TIMEOUT: float = 0.05
+    AUDIT_WRITE_TIMEOUT: float = 2.0
+    # Journal local para eventos que no se pudieron escribir en la BD; una ruta
+    # relativa se resuelve desde server/ y cada worker usa su subdirectorio worker-N
+    AUDIT_JOURNAL_DIR: str = "audit_journal"
+    AUDIT_JOURNAL_SEGMENT_BYTES: int = 16 * 1024 * 1024
+    AUDIT_JOURNAL_REPLAY_INTERVAL: float = 10
+    # Replays fallidos (por causas distintas a una caída de la BD) antes de poner un segmento en cuarentena
+    AUDIT_JOURNAL_MAX_REPLAY_ATTEMPTS: int = 5
+    # Particiones mensuales de audit_logs
+    AUDIT_PARTITION_MONTHS_AHEAD: int = 3
+    AUDIT_PARTITION_MAINTENANCE_INTERVAL: float = 3600
+    AUDIT_RETENTION_DAYS: int = 0  # 0 = sin retención automática
+    # Por debajo de esta estimación el total del listado de auditoría se cuenta exacto
+    AUDIT_EXACT_COUNT_THRESHOLD: int = 10000
+    # Una búsqueda rankea solo las coincidencias más recientes, hasta este máximo
+    AUDIT_SEARCH_MAX_RESULTS: int = 1000
+    # Reconciliación de environment_inventory_counters con inventory_items (0 = desactivada)
+    INVENTORY_COUNTERS_RECONCILE_INTERVAL: float = 3600
     APP_PORT: int = 8001
 
     class Config:
@@ -24,4 +78,12 @@ class Settings(BaseSettings):
             return self.DATABASE_URL
         return f"postgresql+psycopg2://{self.DATABASE_USER}:{self.DATABASE_PASSWORD}@{self.DATABASE_HOST}:{self.DATABASE_PORT}/{self.DATABASE_NAME}"
 
+    @property
+    def constructed_async_database_url(self) -> str:
+        url = self.constructed_database_url
+        for sync_driver in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+            if url.startswith(sync_driver):
+                return "postgresql+asyncpg://" + url[len(sync_driver):]
+        return url
+
 settings = Settings()
\ No newline at end of file
@@ -1,18 +1,129 @@
-from sqlalchemy import create_engine
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from .config import settings
+from .utils.pool_stats import InstrumentedAsyncAdaptedQueuePool, InstrumentedQueuePool
+
+logger = logging.getLogger(__name__)
 
 SQLALCHEMY_DATABASE_URL = settings.constructed_database_url
+SQLALCHEMY_ASYNC_DATABASE_URL = settings.constructed_async_database_url
+
+POOL_OPTIONS = {
+    "pool_size": settings.DATABASE_POOL_SIZE,
+    "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+    "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+    "pool_recycle": settings.DATABASE_POOL_RECYCLE,
+    "pool_pre_ping": settings.DATABASE_POOL_PRE_PING,
+}
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=InstrumentedQueuePool, **POOL_OPTIONS)
+engine.pool.slow_checkout = settings.DATABASE_POOL_SLOW_CHECKOUT
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Motor asíncrono (asyncpg) para las rutas async: no bloquea el event loop
+async_engine = create_async_engine(
+    SQLALCHEMY_ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncAdaptedQueuePool, **POOL_OPTIONS
+)
+async_engine.sync_engine.pool.slow_checkout = settings.DATABASE_POOL_SLOW_CHECKOUT
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+# Réplica de lectura opcional; sin DATABASE_REPLICA_URL las lecturas van al primario
+replica_engine = None
+if settings.DATABASE_REPLICA_URL:
+    replica_engine = create_engine(
+        settings.DATABASE_REPLICA_URL, poolclass=InstrumentedQueuePool, **POOL_OPTIONS
+    )
+    replica_engine.pool.slow_checkout = settings.DATABASE_POOL_SLOW_CHECKOUT
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine or engine)
+
 Base = declarative_base()
 
-def get_db():
+# Read-your-writes: quien escribió hace poco lee del primario hasta que la réplica lo alcance
+_recent_writes: Dict[str, float] = {}
+_recent_writes_lock = threading.Lock()
+_replica_retry_at = 0.0
+
+@event.listens_for(Session, "after_commit")
+def _flag_committed_session(session):
+    session.info["committed"] = True
+
+def _writer_key(request: Request) -> Optional[str]:
+    # Solo principals autenticados: detrás de un proxy todos los clientes comparten
+    # la IP, y una escritura anónima volvería sticky las lecturas de todos
+    return request.headers.get("authorization")
+
+def _mark_recent_write(request: Request) -> None:
+    key = _writer_key(request)
+    if key is None:
+        return
+    now = time.monotonic()
+    with _recent_writes_lock:
+        _recent_writes[key] = now
+        # Purga perezosa de entradas vencidas para acotar el diccionario
+        if len(_recent_writes) > 10000:
+            cutoff = now - settings.DATABASE_REPLICA_STICKY_SECONDS
+            for stale_key in [k for k, t in _recent_writes.items() if t < cutoff]:
+                del _recent_writes[stale_key]
+
+def _wrote_recently(request: Request) -> bool:
+    key = _writer_key(request)
+    if key is None:
+        return False
+    with _recent_writes_lock:
+        written_at = _recent_writes.get(key)
+    return written_at is not None and time.monotonic() - written_at < settings.DATABASE_REPLICA_STICKY_SECONDS
+
+def open_read_session() -> Session:
+    """Sesión de solo lectura sobre la réplica, con respaldo en el primario si no responde"""
+    global _replica_retry_at
+    if replica_engine is None or time.monotonic() < _replica_retry_at:
+        return SessionLocal()
+
+    db = ReadSessionLocal()
+    try:
+        db.connection()
+        return db
+    except DBAPIError as e:
+        db.close()
+        _replica_retry_at = time.monotonic() + settings.DATABASE_REPLICA_RETRY_SECONDS
+        logger.warning("Réplica de lectura no disponible, usando el primario: %s", e)
+        return SessionLocal()
+
+def get_db(request: Request):
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        if db.info.get("committed"):
+            _mark_recent_write(request)
+        db.close()
+
+async def get_async_db(request: Request):
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        finally:
+            if db.info.get("committed"):
+                _mark_recent_write(request)
+
+def get_read_db(request: Request):
+    """Sesión para rutas de solo lectura: réplica si existe y el cliente no escribió hace poco"""
+    db = SessionLocal() if _wrote_recently(request) else open_read_session()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -1,8 +1,16 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import auth, environments, inventory, qr, schedules, users, inventory_checks, supervisor_reviews, inventory_check_items, system_alerts, notifications, maintenance_requests, maintenance_history, stats, loans, alert_settings, reports, audit_logs, feedback
+from .routers import auth, environments, inventory, qr, schedules, users, inventory_checks, supervisor_reviews, inventory_check_items, system_alerts, notifications, maintenance_requests, maintenance_history, stats, loans, alert_settings, reports, audit_logs, feedback, internal
 from .middleware.audit_middleware import AuditMiddleware
 from .config import settings
+from .database import engine, async_engine, replica_engine
+from .utils.pool_stats import log_pool_status_periodically
+from .services.token_versions import sync_token_versions_periodically
+from .services.session_revocations import sync_revoked_sessions_periodically
+from .services.audit_writer import audit_writer
+from .services.audit_partitions import maintain_partitions_periodically
+from .services.inventory_counters import reconcile_inventory_counters_periodically
+import asyncio
 
 app = FastAPI(title="Sistema de Gestión de Inventarios SENA")
 
@@ -37,6 +45,76 @@ app.include_router(alert_settings.router, prefix="/api/alert-settings", tags=["a
 app.include_router(reports.router, prefix="/api/reports", tags=["reports"])
 app.include_router(audit_logs.router, prefix="/api/audit-logs", tags=["audit-logs"])
 app.include_router(feedback.router, prefix="/api/feedback", tags=["feedback"])
+app.include_router(internal.router, prefix="/api/internal", tags=["internal"])
+
+@app.on_event("startup")
+async def start_pool_status_logger():
+    if settings.DATABASE_POOL_LOG_INTERVAL > 0:
+        engines = {"primary": engine, "primary_async": async_engine.sync_engine}
+        if replica_engine is not None:
+            engines["replica"] = replica_engine
+        app.state.pool_logger = asyncio.create_task(
+            log_pool_status_periodically(engines, settings.DATABASE_POOL_LOG_INTERVAL)
+        )
+
+@app.on_event("startup")
+async def start_token_version_sync():
+    app.state.token_version_sync = asyncio.create_task(
+        sync_token_versions_periodically(settings.TOKEN_VERSION_SYNC_INTERVAL)
+    )
+
+@app.on_event("startup")
+async def start_revoked_session_sync():
+    app.state.revoked_session_sync = asyncio.create_task(
+        sync_revoked_sessions_periodically(settings.SESSION_REVOCATION_SYNC_INTERVAL)
+    )
+
+@app.on_event("startup")
+async def start_audit_partition_maintenance():
+    # Crea de antemano las particiones mensuales de audit_logs y aplica la retención automática
+    app.state.audit_partition_maintenance = asyncio.create_task(
+        maintain_partitions_periodically(
+            settings.AUDIT_PARTITION_MAINTENANCE_INTERVAL,
+            settings.AUDIT_PARTITION_MONTHS_AHEAD,
+            settings.AUDIT_RETENTION_DAYS,
+        )
+    )
+
+@app.on_event("startup")
+async def start_inventory_counters_reconciliation():
+    # Corrige la deriva de los contadores por ambiente (escrituras fuera del ORM, SQL manual)
+    if settings.INVENTORY_COUNTERS_RECONCILE_INTERVAL > 0:
+        app.state.inventory_counters_reconciliation = asyncio.create_task(
+            reconcile_inventory_counters_periodically(settings.INVENTORY_COUNTERS_RECONCILE_INTERVAL)
+        )
+
+@app.on_event("startup")
+async def start_audit_writer():
+    audit_writer.start()
+
+# Tareas periódicas creadas al arrancar (atributos de app.state)
+BACKGROUND_TASKS = (
+    "pool_logger",
+    "token_version_sync",
+    "revoked_session_sync",
+    "audit_partition_maintenance",
+    "inventory_counters_reconciliation",
+)
+
+@app.on_event("shutdown")
+async def cancel_background_tasks():
+    tasks = [getattr(app.state, name) for name in BACKGROUND_TASKS if hasattr(app.state, name)]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+@app.on_event("shutdown")
+async def flush_audit_writer():
+    await audit_writer.stop()
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    await async_engine.dispose()
 
 @app.get("/")
 async def root():
@@ -1,22 +1,27 @@
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from typing import Callable, Dict, Any, Optional
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Dict, Any, Optional, Tuple
 import json
 import time
 import uuid
 from datetime import datetime
 
-from ..database import get_db
-from ..models.audit_logs import AuditLog
-from ..models.users import User
+from ..config import settings
+from ..services.audit_writer import audit_writer
+from ..utils.audit_payload import encode_request_body
+from ..utils.audit_severity import classify_severity
+from .audit_routes import AuditRoute, AuditRouteResolver
+from ..services.principal_cache import principal_cache
 from ..utils.security import decode_token
 
-class AuditMiddleware(BaseHTTPMiddleware):
+class AuditMiddleware:
     """
     Middleware para capturar automáticamente todas las operaciones del sistema
     y generar logs de auditoría para trazabilidad completa.
+
+    Es un middleware ASGI puro: copia el cuerpo de la request a medida que el
+    handler lo lee (hasta max_body_bytes) y de la respuesta solo toma el status,
+    sin bufferizarla, así que no rompe las respuestas en streaming.
     """
     
     # Métodos HTTP que requieren auditoría
@@ -58,63 +63,70 @@ class AuditMiddleware(BaseHTTPMiddleware):
         "DELETE_INVENTORY_CHECK": "Se eliminó una verificación de inventario"
     }
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:        
-        # Verificar si el endpoint requiere auditoría
-        should_audit = self._should_audit(request)
-        
-        if not should_audit:
-            return await call_next(request)
-        
-        start_time = time.time()
-        request_data = await self._capture_request_data(request)
-        
-        body = await request.body()
-        
-        async def receive():
-            return {"type": "http.request", "body": body}
-        
-        request._receive = receive
-        
-        # Ejecutar la request
-        response = await call_next(request)
-        
+    def __init__(self, app: ASGIApp, max_body_bytes: Optional[int] = None):
+        self.app = app
+        self.max_body_bytes = settings.AUDIT_MAX_BODY_BYTES if max_body_bytes is None else max_body_bytes
+        self.resolver = AuditRouteResolver(self.EXCLUDE_ENDPOINTS)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Filtro barato antes de ejecutar; las exclusiones se resuelven por ruta al final
+        if scope["type"] != "http" or not self._may_audit(scope["path"], scope["method"]):
+            await self.app(scope, receive, send)
+            return
+
+        if not self.resolver.built and "app" in scope:
+            # Tabla de rutas completa: se construye una sola vez, en el primer request auditable
+            self.resolver.build(scope["app"].routes)
+
+        start_time = time.perf_counter()
+        body = bytearray()
+        body_truncated = False
+        response_info: Dict[str, Any] = {"status_code": 500}
+
+        async def receive_and_capture() -> Message:
+            nonlocal body_truncated
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                room = self.max_body_bytes - len(body)
+                if len(chunk) > room:
+                    body_truncated = True
+                if room > 0:
+                    body.extend(chunk[:room])
+            return message
+
+        async def send_and_capture(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response_info["status_code"] = message["status"]
+            await send(message)
+
         try:
-            await self._create_audit_log_async(
-                request=request,
-                response=response,
-                request_data=request_data,
-                duration=time.time() - start_time
-            )
-        except Exception:
-            pass
-        
-        return response
+            await self.app(scope, receive_and_capture, send_and_capture)
+        finally:
+            # La respuesta ya se envió: el log no agrega latencia al cliente
+            try:
+                # El router dejó la ruta resuelta en el scope
+                route, entity_id = self.resolver.resolve(scope)
+                if route.audited:
+                    request = Request(scope)
+                    await self._create_audit_log_async(
+                        request=request,
+                        route=route,
+                        entity_id=entity_id,
+                        response_info=response_info,
+                        request_data=self._capture_request_data(request, bytes(body), body_truncated),
+                        duration=time.perf_counter() - start_time
+                    )
+            except Exception:
+                pass
 
-    def _should_audit(self, request: Request) -> bool:
-        """Determina si una request debe ser auditada"""
-        path = request.url.path
-        method = request.method
-        
-        # Excluir endpoints específicos
-        if path == "/":  # Exact match for root
-            return False
-            
-        for exclude_path in self.EXCLUDE_ENDPOINTS:
-            if exclude_path != "/" and path.startswith(exclude_path):
-                return False
-        
-        if path.startswith("/api/") and method in self.AUDIT_METHODS:
-            return True
-        
-        if "/api/auth/login" in path:
-            return True
-        
-        return False
+    def _may_audit(self, path: str, method: str) -> bool:
+        """Determina si una request puede requerir auditoría (solo métodos que modifican en /api)"""
+        return method in self.AUDIT_METHODS and path.startswith("/api/")
 
-    async def _capture_request_data(self, request: Request) -> Dict[str, Any]:
-        """Captura datos relevantes de la request"""
+    def _capture_request_data(self, request: Request, body: bytes, body_truncated: bool) -> Dict[str, Any]:
+        """Captura datos relevantes de la request a partir del cuerpo ya copiado"""
         try:
-            body = await request.body()
             request_body = None
             
             if body:
@@ -123,9 +135,11 @@ class AuditMiddleware(BaseHTTPMiddleware):
                     # Filtrar datos sensibles
                     request_body = self._filter_sensitive_data(request_body)
                 except (json.JSONDecodeError, UnicodeDecodeError):
-                    request_body = {"raw_body": body.decode(errors='ignore')[:500]}
+                    # Un JSON truncado no se puede filtrar: no guardar su contenido
+                    if not body_truncated:
+                        request_body = {"raw_body": body.decode(errors='ignore')[:500]}
             
-            return {
+            request_data = {
                 "method": request.method,
                 "path": request.url.path,
                 "query_params": dict(request.query_params),
@@ -133,6 +147,9 @@ class AuditMiddleware(BaseHTTPMiddleware):
                 "client_ip": request.client.host if request.client else "unknown",
                 "user_agent": request.headers.get("user-agent", "")
             }
+            if body_truncated:
+                request_data["body_truncated"] = True
+            return request_data
         except Exception as e:
             return {
                 "error": f"Failed to capture request data: {str(e)}",
@@ -158,83 +175,125 @@ class AuditMiddleware(BaseHTTPMiddleware):
     async def _create_audit_log_async(
         self,
         request: Request,
-        response: Response,
+        route: AuditRoute,
+        entity_id: Optional[str],
+        response_info: Dict[str, Any],
         request_data: Dict[str, Any],
         duration: float
     ):
-        """Crea un registro de auditoría en la base de datos de forma asíncrona"""
+        """Encola el registro de auditoría; el AuditLogWriter lo inserta por lotes"""
+        user_id = None
+        user_info = self._get_user_from_request(request)
+        if user_info:
+            user_id = self._as_uuid(user_info.get("user_id"))
+        
+        action = route.action
+        entity_type = route.entity_type
+        entity_id = self._as_uuid(entity_id)
+        
+        friendly_description = self._get_friendly_description(action, entity_type, request_data)
+        
+        # Formato compacto: los campos consultados van en columnas tipadas y
+        # new_values solo guarda la descripción
+        new_values = {"description": friendly_description}
+        body = request_data.get("body")
+        environment_id, center_id = self._resolve_environment(route, entity_id, request, request_data, user_info)
+        
+        request_body = None
+        if settings.AUDIT_STORE_BODIES and (body or request_data.get("query_params")):
+            request_body = encode_request_body(
+                {"query": request_data.get("query_params") or None, "body": body},
+                settings.AUDIT_STORED_BODY_BYTES,
+                settings.AUDIT_COMPRESS_BODIES,
+            )
+        
+        await audit_writer.submit({
+            "id": uuid.uuid4(),
+            "user_id": user_id,
+            "action": action,
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            # Si falta el centro, el writer lo completa desde el ambiente
+            "environment_id": environment_id,
+            "center_id": center_id,
+            "old_values": None,
+            "new_values": new_values,
+            "method": request.method,
+            "path": route.path,
+            "status_code": response_info["status_code"],
+            "severity": classify_severity(action, response_info["status_code"]),
+            "duration_ms": round(duration * 1000),
+            "request_body": request_body,
+            # Una IP inválida haría fallar todo el lote
+            "ip_address": request.client.host if request.client else None,
+            "user_agent": request.headers.get("user-agent", ""),
+            "session_id": request.headers.get("x-session-id"),
+            # Hora del evento, no la del flush
+            "created_at": datetime.now(),
+        })
+
+    def _resolve_environment(
+        self,
+        route: AuditRoute,
+        entity_id: Optional[uuid.UUID],
+        request: Request,
+        request_data: Dict[str, Any],
+        user_info: Optional[Dict[str, Any]]
+    ) -> Tuple[Optional[uuid.UUID], Optional[uuid.UUID]]:
+        """Ambiente (y centro) del evento: URL, luego query/cuerpo, luego el del usuario autenticado"""
+        candidates = [request.scope.get("path_params", {}).get("environment_id")]
+        if route.entity_type == "environment":
+            candidates.append(entity_id)
+        query_params = request_data.get("query_params") or {}
+        candidates.append(query_params.get("environment_id"))
+        body = request_data.get("body")
+        if isinstance(body, dict):
+            candidates.append(body.get("environment_id"))
+
+        for candidate in candidates:
+            environment_id = self._as_uuid(candidate)
+            if environment_id:
+                # El centro del token solo vale si es el mismo ambiente del usuario
+                if user_info and user_info.get("environment_id") == environment_id:
+                    return environment_id, user_info.get("center_id")
+                return environment_id, None
+
+        if user_info and user_info.get("environment_id"):
+            return user_info["environment_id"], user_info.get("center_id")
+        return None, None
+
+    @staticmethod
+    def _as_uuid(value: Any) -> Optional[uuid.UUID]:
+        if isinstance(value, uuid.UUID):
+            return value
         try:
-            db_gen = get_db()
-            db = next(db_gen)
-            
-            try:
-                user_id = None
-                user_info = await self._get_user_from_request(request, db)
-                if user_info:
-                    user_id = user_info.get("user_id")
-                
-                # Determinar la acción basada en el endpoint y método
-                action = self._determine_action(request.url.path, request.method)
-                
-                # Determinar el tipo de entidad
-                entity_type = self._determine_entity_type(request.url.path)
-                
-                # Extraer ID de entidad si está en la URL
-                entity_id = self._extract_entity_id(request.url.path)
-                
-                friendly_description = self._get_friendly_description(action, entity_type, request_data)
-                
-                audit_log = AuditLog(
-                    user_id=user_id,
-                    action=action,
-                    entity_type=entity_type,
-                    entity_id=entity_id,
-                    old_values=None,
-                    new_values={
-                        "description": friendly_description,
-                        "request": request_data,
-                        "response": {
-                            "status_code": response.status_code,
-                            "headers": dict(response.headers)
-                        },
-                        "duration_seconds": round(duration, 3),
-                        "timestamp": datetime.utcnow().isoformat()
-                    },
-                    ip_address=request.client.host if request.client else "unknown",
-                    user_agent=request.headers.get("user-agent", ""),
-                    session_id=request.headers.get("x-session-id")
-                )
-                
-                db.add(audit_log)
-                db.commit()
-                
-            except Exception:
-                db.rollback()
-                raise
-            finally:
-                db.close()
-                
-        except Exception:
-            pass
+            return uuid.UUID(value) if value else None
+        except (ValueError, TypeError, AttributeError):
+            return None
 
-    async def _get_user_from_request(self, request: Request, db: Session) -> Optional[Dict[str, Any]]:
-        """Extrae información del usuario de la request"""
+    def _get_user_from_request(self, request: Request) -> Optional[Dict[str, Any]]:
+        """Extrae información del usuario de la request sin consultar la base de datos"""
         try:
             # Buscar token en headers
             auth_header = request.headers.get("authorization")
             if auth_header and auth_header.startswith("Bearer "):
                 token = auth_header.split(" ")[1]
+                # get_current_user ya resolvió y cacheó el usuario durante la request
+                user = principal_cache.get(token)
+                if user:
+                    return {
+                        "user_id": str(user.id),
+                        "email": user.email,
+                        "name": f"{user.first_name} {user.last_name}".strip(),
+                        "environment_id": user.environment_id,
+                    }
                 user_data = decode_token(token)
-                if user_data and user_data.get("user_id"):
-                    # Verificar que el usuario existe en la base de datos
-                    user = db.query(User).filter(User.id == user_data["user_id"]).first()
-                    if user:
-                        return {
-                            "user_id": str(user.id),
-                            "email": user.email,
-                            "name": f"{user.first_name} {user.last_name}".strip()
-                        }
-                return user_data
+                if user_data and user_data.get("sub"):
+                    return {
+                        "user_id": user_data["sub"],
+                        "environment_id": self._as_uuid(user_data.get("env")),
+                        "center_id": self._as_uuid(user_data.get("ctr")),
+                    }
         except Exception:
             pass
         
@@ -256,67 +315,3 @@ class AuditMiddleware(BaseHTTPMiddleware):
                     base_message += f": {body['email']}"
         
         return base_message
-
-    def _determine_action(self, path: str, method: str) -> str:
-        """Determina la acción basada en el path y método HTTP"""
-        if "/auth/login" in path:
-            return "LOGIN"
-        elif "/auth/register" in path:
-            return "REGISTER"
-        elif "/auth/logout" in path:
-            return "LOGOUT"
-        
-        # Acción genérica basada en método HTTP y entidad
-        action_map = {
-            "GET": "VIEW",
-            "POST": "CREATE",
-            "PUT": "UPDATE",
-            "PATCH": "UPDATE",
-            "DELETE": "DELETE"
-        }
-        
-        entity = self._determine_entity_type(path).upper()
-        return f"{action_map.get(method, method)}_{entity}"
-
-    def _determine_entity_type(self, path: str) -> str:
-        """Determina el tipo de entidad basado en el path"""
-        if "/inventory-checks" in path:
-            return "inventory_check"
-        elif "/inventory" in path:
-            return "inventory_item"
-        elif "/loans" in path:
-            return "loan"
-        elif "/users" in path:
-            return "user"
-        elif "/maintenance-requests" in path:
-            return "maintenance_request"
-        elif "/maintenance-history" in path:
-            return "maintenance_history"
-        elif "/environments" in path:
-            return "environment"
-        elif "/auth" in path:
-            return "authentication"
-        elif "/supervisor-reviews" in path:
-            return "supervisor_review"
-        elif "/notifications" in path:
-            return "notification"
-        elif "/system-alerts" in path:
-            return "system_alert"
-        else:
-            parts = [p for p in path.split('/') if p and p != 'api']
-            return parts[0] if parts else "unknown"
-
-    def _extract_entity_id(self, path: str) -> Optional[str]:
-        """Extrae el ID de entidad de la URL si está presente"""
-        try:
-            # Buscar UUID en el path (formato: /api/resource/{uuid})
-            parts = path.split('/')
-            for part in parts:
-                if len(part) == 36 and part.count('-') == 4:  # UUID format
-                    return part
-                elif part.isdigit():
-                    return part
-        except Exception:
-            pass
-        
-        return None
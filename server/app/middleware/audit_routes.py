@@ -0,0 +1,107 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi.routing import APIRoute
+
+# Segmento de la URL (después de /api) -> tipo de entidad auditado
+ENTITY_TYPES = {
+    "inventory-checks": "inventory_check",
+    "inventory-check-items": "inventory_check_item",
+    "inventory": "inventory_item",
+    "loans": "loan",
+    "users": "user",
+    "maintenance-requests": "maintenance_request",
+    "maintenance-history": "maintenance_history",
+    "environments": "environment",
+    "auth": "authentication",
+    "supervisor-reviews": "supervisor_review",
+    "notifications": "notification",
+    "system-alerts": "system_alert",
+}
+
+# Acciones de autenticación con nombre propio
+AUTH_ACTIONS = {
+    "login": "LOGIN",
+    "register": "REGISTER",
+    "logout": "LOGOUT",
+}
+
+METHOD_ACTIONS = {
+    "GET": "VIEW",
+    "POST": "CREATE",
+    "PUT": "UPDATE",
+    "PATCH": "UPDATE",
+    "DELETE": "DELETE",
+}
+
+@dataclass(frozen=True)
+class AuditRoute:
+    audited: bool
+    action: str
+    entity_type: str
+    path: str
+    id_param: Optional[str] = None
+
+def _classify(path: str, method: str, excluded_prefixes: Iterable[str], template: bool = True) -> Tuple[bool, str, str]:
+    """
+    (auditado, acción, tipo de entidad) para un path o plantilla de ruta. Un
+    segmento fuera de ENTITY_TYPES se usa tal cual solo en plantillas de rutas
+    declaradas; en un path sin ruta lo elige el cliente y se registra como
+    "unknown" (además de no caber en entity_type/action).
+    """
+    audited = path != "/" and not any(path.startswith(prefix) for prefix in excluded_prefixes)
+
+    parts = [p for p in path.split("/") if p and p != "api"]
+    segment = parts[0] if parts else "unknown"
+    entity_type = ENTITY_TYPES.get(segment, segment if template else "unknown")
+
+    if segment == "auth" and len(parts) > 1 and parts[1] in AUTH_ACTIONS:
+        action = AUTH_ACTIONS[parts[1]]
+    else:
+        action = f"{METHOD_ACTIONS.get(method, method)}_{entity_type.upper()}"
+    return audited, action, entity_type
+
+class AuditRouteResolver:
+    """
+    Resuelve acción, tipo de entidad y parámetro de ID de un request auditado.
+    Se construye una vez desde la tabla de rutas de FastAPI; en cada request se
+    busca en O(1) por la plantilla de la ruta que Starlette dejó en scope["route"].
+    Los paths sin ruta (404) usan una clasificación por segmentos cacheada.
+    """
+
+    def __init__(self, excluded_prefixes: Iterable[str]):
+        self.excluded_prefixes = tuple(excluded_prefixes)
+        self._routes: Dict[Tuple[str, str], AuditRoute] = {}
+        self.built = False
+        self._fallback = lru_cache(maxsize=2048)(self._classify_path)
+
+    def build(self, routes: Iterable) -> None:
+        table: Dict[Tuple[str, str], AuditRoute] = {}
+        for route in routes:
+            if not isinstance(route, APIRoute):
+                continue
+            id_param = next(
+                (name for name in route.param_convertors if name == "id" or name.endswith("_id")),
+                None,
+            )
+            for method in route.methods:
+                audited, action, entity_type = _classify(route.path_format, method, self.excluded_prefixes)
+                table[(route.path_format, method)] = AuditRoute(audited, action, entity_type, route.path_format, id_param)
+        self._routes = table
+        self.built = True
+
+    def resolve(self, scope) -> Tuple[AuditRoute, Optional[str]]:
+        """Devuelve la clasificación y el ID de entidad (si la ruta tiene uno)"""
+        method = scope["method"]
+        route = scope.get("route")
+        if route is not None:
+            entry = self._routes.get((getattr(route, "path_format", None), method))
+            if entry is not None:
+                entity_id = scope.get("path_params", {}).get(entry.id_param) if entry.id_param else None
+                return entry, str(entity_id) if entity_id is not None else None
+        return self._fallback(scope["path"], method), None
+
+    def _classify_path(self, path: str, method: str) -> AuditRoute:
+        audited, action, entity_type = _classify(path, method, self.excluded_prefixes, template=False)
+        return AuditRoute(audited, action, entity_type, path[:255])
@@ -14,4 +14,7 @@ from .alert_settings import AlertSetting
 from .generated_reports import GeneratedReport
 from .feedback import Feedback
 from .audit_logs import AuditLog
-from .user_settings import UserSetting
\ No newline at end of file
+from .user_settings import UserSetting
+from .user_sessions import UserSession
+from .audit_stats_hourly import AuditStatsHourly
+from .environment_inventory_counters import EnvironmentInventoryCounters
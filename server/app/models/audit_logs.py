@@ -1,24 +1,53 @@
-from sqlalchemy import Column, String, Text, TIMESTAMP, ForeignKey
+from sqlalchemy import Column, String, Text, TIMESTAMP, ForeignKey, SmallInteger, Integer, LargeBinary, Index
 from sqlalchemy.dialects.postgresql import UUID, INET, JSONB
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 import uuid
 
 from ..database import Base
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    # Particionada por mes sobre created_at (ver services/audit_partitions.py);
+    # la PK incluye created_at porque PostgreSQL lo exige a las tablas particionadas
+    __table_args__ = (
+        # Paginación keyset por (created_at, id), sola o detrás de cada filtro de igualdad
+        Index("ix_audit_logs_created_at_id", "created_at", "id"),
+        Index("ix_audit_logs_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_audit_logs_entity_type_created_at_id", "entity_type", "created_at", "id"),
+        Index("ix_audit_logs_action_created_at_id", "action", "created_at", "id"),
+        Index("ix_audit_logs_environment_id_created_at_id", "environment_id", "created_at", "id"),
+        Index("ix_audit_logs_center_id_created_at_id", "center_id", "created_at", "id"),
+        # Búsqueda por subcadena (ILIKE '%...%') con pg_trgm
+        Index("ix_audit_logs_action_trgm", "action", postgresql_using="gin", postgresql_ops={"action": "gin_trgm_ops"}),
+        Index("ix_audit_logs_entity_type_trgm", "entity_type", postgresql_using="gin", postgresql_ops={"entity_type": "gin_trgm_ops"}),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"))
     action = Column(String(100), nullable=False)
     entity_type = Column(String(50), nullable=False)
     entity_id = Column(UUID(as_uuid=True))
+    # Dimensiones resueltas al escribir (URL, cuerpo o usuario); sin FK para conservar el historial
+    environment_id = Column(UUID(as_uuid=True))
+    center_id = Column(UUID(as_uuid=True))
     old_values = Column(JSONB)
     new_values = Column(JSONB)
     ip_address = Column(INET)
     user_agent = Column(Text)
     session_id = Column(String(100))
-    created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+    # Campos de la request promovidos desde new_values (formato compacto)
+    method = Column(String(10))
+    path = Column(String(255))  # plantilla de la ruta, p. ej. /api/inventory/{item_id}
+    status_code = Column(SmallInteger)
+    severity = Column(String(10))  # error / warning / success / info, clasificada al escribir
+    duration_ms = Column(Integer)
+    # Cuerpo de la request (JSON, truncado y opcionalmente zlib); solo si AUDIT_STORE_BODIES
+    request_body = deferred(Column(LargeBinary))
+    created_at = Column(TIMESTAMP, primary_key=True, nullable=False, server_default=func.current_timestamp())
 
-    user = relationship("User", back_populates="audit_logs")
\ No newline at end of file
+    user = relationship("User", back_populates="audit_logs")
+
+    # Relevancia en una búsqueda (no es columna; la asigna get_audit_logs_paginated)
+    search_rank = None
\ No newline at end of file
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, String, Integer, BigInteger, TIMESTAMP, Index, text
+from sqlalchemy.dialects.postgresql import UUID
+
+from ..database import Base
+
+# user_id NULL (requests anónimos) se agrupa bajo este valor en la clave única
+ANONYMOUS_USER_KEY = text("COALESCE(user_id, '00000000-0000-0000-0000-000000000000'::uuid)")
+
+class AuditStatsHourly(Base):
+    """Conteo de logs de auditoría por hora, acción, usuario y severidad"""
+    __tablename__ = "audit_stats_hourly"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    hour = Column(TIMESTAMP, nullable=False)
+    action = Column(String(100), nullable=False)
+    # Sin FK: el rollup conserva los conteos aunque el usuario se elimine
+    user_id = Column(UUID(as_uuid=True))
+    severity = Column(String(10), nullable=False)
+    count = Column(Integer, nullable=False, server_default="0")
+
+    __table_args__ = (
+        # Árbitro del upsert incremental
+        Index("ux_audit_stats_hourly_key", "hour", "action", "severity", ANONYMOUS_USER_KEY, unique=True),
+    )
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, ForeignKey, TIMESTAMP
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+
+from ..database import Base
+
+class EnvironmentInventoryCounters(Base):
+    """
+    Totales del inventario por ambiente, mantenidos de forma incremental en la
+    misma transacción que modifica inventory_items (ver services/inventory_counters.py)
+    """
+    __tablename__ = "environment_inventory_counters"
+
+    environment_id = Column(UUID(as_uuid=True), ForeignKey("environments.id", ondelete="CASCADE"), primary_key=True)
+    total_items = Column(Integer, nullable=False, server_default="0")
+    # Ítems por estado (mismos valores que check_status de inventory_items)
+    available_items = Column(Integer, nullable=False, server_default="0")
+    in_use_items = Column(Integer, nullable=False, server_default="0")
+    maintenance_items = Column(Integer, nullable=False, server_default="0")
+    damaged_items = Column(Integer, nullable=False, server_default="0")
+    lost_items = Column(Integer, nullable=False, server_default="0")
+    missing_items = Column(Integer, nullable=False, server_default="0")
+    good_items = Column(Integer, nullable=False, server_default="0")
+    total_quantity = Column(Integer, nullable=False, server_default="0")
+    damaged_quantity = Column(Integer, nullable=False, server_default="0")
+    missing_quantity = Column(Integer, nullable=False, server_default="0")
+    # Unidades en buen estado, como en calculate_verification_totals
+    good_quantity = Column(Integer, nullable=False, server_default="0")
+    updated_at = Column(TIMESTAMP, server_default=func.current_timestamp())
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, String, Text, TIMESTAMP, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID, INET
+from sqlalchemy.sql import func
+import uuid
+
+from ..database import Base
+
+class UserSession(Base):
+    __tablename__ = "user_sessions"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    # sha256 del refresh token; el token en claro solo lo conoce el cliente
+    refresh_token_hash = Column(String(64), nullable=False, unique=True)
+    ip_address = Column(INET)
+    user_agent = Column(Text)
+    created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+    last_used_at = Column(TIMESTAMP)
+    expires_at = Column(TIMESTAMP, nullable=False)
+    revoked_at = Column(TIMESTAMP)
+
+    __table_args__ = (
+        # Carga incremental de revocaciones
+        Index("ix_user_sessions_revoked_at", "revoked_at", postgresql_where=revoked_at.isnot(None)),
+    )
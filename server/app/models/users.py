@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, String, Boolean, TIMESTAMP, CheckConstraint
+from sqlalchemy import Column, ForeignKey, String, Boolean, Integer, TIMESTAMP, CheckConstraint, Computed, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -15,6 +15,8 @@ class User(Base):
     role = Column(String(20), nullable=False)
     first_name = Column(String(100), nullable=False)
     last_name = Column(String(100), nullable=False)
+    # Columna generada para la búsqueda por trigramas (pg_trgm)
+    full_name = Column(String(201), Computed("first_name || ' ' || last_name", persisted=True))
     phone = Column(String(20))
     program = Column(String(100))
     ficha = Column(String(20))
@@ -22,6 +24,8 @@ class User(Base):
     avatar_url = Column(String(500))
     is_active = Column(Boolean, default=True)
     last_login = Column(TIMESTAMP)
+    # Se incrementa cuando cambian los claims del token (rol, ambiente, estado)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
     updated_at = Column(TIMESTAMP, server_default=func.current_timestamp())
 
@@ -31,4 +35,6 @@ class User(Base):
 
     __table_args__ = (
         CheckConstraint("role IN ('student', 'instructor', 'supervisor', 'admin', 'admin_general')", name="check_role"),
+        Index("ix_users_full_name_trgm", "full_name", postgresql_using="gin", postgresql_ops={"full_name": "gin_trgm_ops"}),
+        Index("ix_users_email_trgm", "email", postgresql_using="gin", postgresql_ops={"email": "gin_trgm_ops"}),
     )
\ No newline at end of file
@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
-from sqlalchemy.orm import Session, joinedload
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, joinedload, undefer
 from sqlalchemy import desc, func, and_, or_
 from typing import List, Optional
 from datetime import date, datetime, timedelta
 from uuid import UUID
 
-from ..database import get_db
+from ..database import get_db, get_read_db, open_read_session
 from ..models.audit_logs import AuditLog
 from ..models.users import User
 from ..schemas.audit_log import (
@@ -16,23 +17,40 @@ from ..schemas.audit_log import (
 )
 from ..services.audit_service import AuditService
 from ..routers.auth import get_current_user
+from ..utils.audit_payload import with_request_body
 
 router = APIRouter()
 
+EXPORT_MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
 @router.get("/", response_model=AuditLogListResponse)
-async def get_audit_logs(
+def get_audit_logs(
     page: int = Query(1, ge=1),
     per_page: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    include_total: bool = Query(True),
+    action: Optional[str] = Query(None),
     action_filter: Optional[str] = Query(None),
     user_id: Optional[UUID] = Query(None),
     entity_type: Optional[str] = Query(None),
+    environment_id: Optional[UUID] = Query(None),
+    center_id: Optional[UUID] = Query(None),
     start_date: Optional[date] = Query(None),
     end_date: Optional[date] = Query(None),
     search: Optional[str] = Query(None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    """Get audit logs with filtering and pagination - Admin General only"""
+    """Get audit logs with filtering and pagination - Admin General only
+
+    Pass the returned next_cursor as cursor to get the following page; page is
+    only honored without a cursor. action matches exactly, action_filter as a
+    substring.
+    """
     
     if current_user.role != "admin_general":
         raise HTTPException(
@@ -42,12 +60,18 @@ async def get_audit_logs(
     
     # Preparar filtros
     filters = {}
+    if action:
+        filters['action'] = action
     if action_filter:
-        filters['action'] = action_filter
+        filters['action_contains'] = action_filter
     if user_id:
         filters['user_id'] = user_id
     if entity_type:
         filters['entity_type'] = entity_type
+    if environment_id:
+        filters['environment_id'] = environment_id
+    if center_id:
+        filters['center_id'] = center_id
     if start_date:
         filters['start_date'] = start_date
     if end_date:
@@ -56,12 +80,20 @@ async def get_audit_logs(
         filters['search'] = search
     
     # Obtener logs usando el servicio
-    logs, total = AuditService.get_audit_logs_paginated(
-        db=db,
-        page=page,
-        per_page=per_page,
-        filters=filters
-    )
+    try:
+        logs, total, total_is_estimate, next_cursor = AuditService.get_audit_logs_paginated(
+            db=db,
+            page=page,
+            per_page=per_page,
+            filters=filters,
+            cursor=cursor,
+            include_total=include_total
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid cursor"
+        )
     
     # Construir respuesta con información de usuario
     log_responses = []
@@ -72,21 +104,23 @@ async def get_audit_logs(
             log_data.user_email = log.user.email
         log_responses.append(log_data)
     
-    total_pages = (total + per_page - 1) // per_page
+    total_pages = (total + per_page - 1) // per_page if total is not None else None
     
     return AuditLogListResponse(
         logs=log_responses,
         total=total,
+        total_is_estimate=total_is_estimate,
         page=page,
         per_page=per_page,
-        total_pages=total_pages
+        total_pages=total_pages,
+        next_cursor=next_cursor
     )
 
 @router.get("/stats", response_model=AuditLogStatsResponse)
-async def get_audit_stats(
+def get_audit_stats(
     days: int = Query(30, ge=1, le=365),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get audit statistics - Admin General only"""
     
@@ -110,11 +144,12 @@ async def get_audit_stats(
     )
 
 @router.get("/user/{user_id}/activity")
-async def get_user_activity(
+def get_user_activity(
     user_id: UUID,
     days: int = Query(30, ge=1, le=365),
+    granularity: str = Query("day", pattern="^(hour|day|week)$"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get specific user activity - Admin General only"""
     
@@ -124,15 +159,15 @@ async def get_user_activity(
             detail="Only general administrators can access user activity"
         )
     
-    activity = AuditService.get_user_activity(db=db, user_id=user_id, days=days)
+    activity = AuditService.get_user_activity(db=db, user_id=user_id, days=days, granularity=granularity)
     return activity
 
 @router.get("/entity/{entity_type}/{entity_id}/trail")
-async def get_entity_audit_trail(
+def get_entity_audit_trail(
     entity_type: str,
     entity_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get complete audit trail for a specific entity - Admin General only"""
     
@@ -158,11 +193,50 @@ async def get_entity_audit_trail(
     
     return log_responses
 
+@router.get("/export")
+def export_audit_logs(
+    start_date: date = Query(...),
+    end_date: date = Query(...),
+    format: str = Query("json", pattern="^(json|ndjson|csv)$"),
+    current_user: User = Depends(get_current_user)
+):
+    """Export audit logs in a date range as a stream (json, ndjson or csv) - Admin General only"""
+    
+    if current_user.role != "admin_general":
+        raise HTTPException(
+            status_code=403,
+            detail="Only general administrators can export audit logs"
+        )
+    
+    if end_date < start_date:
+        raise HTTPException(
+            status_code=400,
+            detail="end_date must not be before start_date"
+        )
+    
+    def stream():
+        # Sesión propia: la de Depends se cierra antes de que termine el streaming
+        db = open_read_session()
+        try:
+            yield from AuditService.encode_export(
+                AuditService.export_audit_logs(db=db, start_date=start_date, end_date=end_date),
+                format=format
+            )
+        finally:
+            db.close()
+    
+    filename = f"audit_logs_{start_date.isoformat()}_{end_date.isoformat()}.{format}"
+    return StreamingResponse(
+        stream(),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @router.get("/{log_id}", response_model=AuditLogResponse)
-async def get_audit_log(
+def get_audit_log(
     log_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get a specific audit log by ID - Admin General only"""
     
@@ -172,7 +246,8 @@ async def get_audit_log(
             detail="Only general administrators can access audit logs"
         )
     
-    log = db.query(AuditLog).options(joinedload(AuditLog.user)).filter(
+    # El detalle es el único lugar, junto con la exportación, que carga el cuerpo guardado
+    log = db.query(AuditLog).options(joinedload(AuditLog.user), undefer(AuditLog.request_body)).filter(
         AuditLog.id == log_id
     ).first()
     
@@ -183,6 +258,7 @@ async def get_audit_log(
         )
     
     log_data = AuditLogResponse.from_orm(log)
+    log_data.new_values = with_request_body(log_data.new_values, log.request_body)
     if log.user:
         log_data.user_name = f"{log.user.first_name} {log.user.last_name}"
         log_data.user_email = log.user.email
@@ -190,7 +266,7 @@ async def get_audit_log(
     return log_data
 
 @router.post("/", response_model=AuditLogResponse)
-async def create_audit_log(
+def create_audit_log(
     audit_data: AuditLogCreate,
     request: Request,
     current_user: User = Depends(get_current_user),
@@ -219,7 +295,7 @@ async def create_audit_log(
     return log_data
 
 @router.delete("/cleanup")
-async def cleanup_old_logs(
+def cleanup_old_logs(
     days_to_keep: int = Query(90, ge=30, le=365),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -232,10 +308,13 @@ async def cleanup_old_logs(
             detail="Only general administrators can cleanup audit logs"
         )
     
-    deleted_count = AuditService.cleanup_old_logs(db=db, days_to_keep=days_to_keep)
+    result = AuditService.cleanup_old_logs(db=db, days_to_keep=days_to_keep)
+    deleted_count = result["estimated_rows"]
     
     return {
-        "message": f"Successfully deleted {deleted_count} old audit logs",
+        "message": f"Successfully deleted {len(result['dropped_partitions'])} old audit log partitions (~{deleted_count} logs)",
         "deleted_count": deleted_count,
+        "dropped_partitions": result["dropped_partitions"],
+        "deleted_stats_rows": result["deleted_stats_rows"],
         "days_kept": days_to_keep
     }
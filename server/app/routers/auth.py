@@ -1,13 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
 from datetime import datetime
 from typing import cast
-from ..database import get_db
-from ..schemas.user import LoginRequest, TokenResponse, UserCreate, UserResponse, ProfileUpdateRequest, PasswordChangeRequest
-from ..services.auth_service import authenticate_user
-from ..utils.security import hash_password, verify_password
+from ..database import get_async_db
+from ..schemas.user import LoginRequest, TokenResponse, TokenPrincipal, RefreshTokenRequest, UserCreate, UserResponse, ProfileUpdateRequest, PasswordChangeRequest
+from ..services.auth_service import authenticate_user, refresh_session, revoke_session, revoke_user_sessions
+from ..services.session_revocations import revoked_sessions
+from ..services.principal_cache import principal_cache
+from ..services.token_versions import token_versions, bump_token_version
+from ..utils.security import hash_password_async, verify_password_async, TOKEN_FORMAT
 from ..models.users import User
 from ..config import settings
 import uuid
@@ -18,19 +22,56 @@ router = APIRouter(tags=["auth"])
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 @router.post("/login", response_model=TokenResponse)
-async def login(login_request: LoginRequest, db: Session = Depends(get_db)):
-    return authenticate_user(db, login_request)
+async def login(login_request: LoginRequest, request: Request, db: AsyncSession = Depends(get_async_db)):
+    return await authenticate_user(
+        db,
+        login_request,
+        ip_address=request.client.host if request.client else None,
+        user_agent=request.headers.get("user-agent"),
+    )
+
+@router.post("/refresh", response_model=TokenResponse)
+async def refresh(refresh_request: RefreshTokenRequest, db: AsyncSession = Depends(get_async_db)):
+    """Exchange a refresh token for a new access token (the refresh token is rotated)"""
+    return await refresh_session(db, refresh_request.refresh_token)
+
+@router.post("/logout")
+async def logout(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """Revoke the session of the current access token"""
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido o expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    session_id = payload.get("sid")
+    if session_id:
+        await revoke_session(db, uuid.UUID(session_id))
+    return {"message": "Sesión cerrada exitosamente"}
+
+def _ensure_session_active(payload: dict) -> None:
+    session_id = payload.get("sid")
+    if session_id and session_id in revoked_sessions:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Sesión revocada",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
 
 @router.post("/register", response_model=UserResponse)
-async def register(user_create: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.email == user_create.email).first()
+async def register(user_create: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(User).where(User.email == user_create.email))
+    existing_user = result.scalars().first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="El correo electrónico ya está registrado",
         )
     
-    hashed_password = hash_password(user_create.password)
+    hashed_password = await hash_password_async(user_create.password)
     
     new_user = User(
         email=user_create.email,
@@ -45,13 +86,17 @@ async def register(user_create: UserCreate, db: Session = Depends(get_db)):
         is_active=True
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     return UserResponse.from_orm(new_user)
 
 @router.get("/me")
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    cached_user = principal_cache.get(token)
+    if cached_user is not None:
+        return cached_user
+
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         user_id: str = payload.get("sub")
@@ -68,18 +113,70 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             detail="Token inválido o expirado",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    _ensure_session_active(payload)
 
-    user = db.query(User).filter(User.id == uuid.UUID(user_id)).first()
+    user = await db.get(User, uuid.UUID(user_id))
     if user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado")
     
-    return UserResponse.from_orm(user)
+    current_user = UserResponse.from_orm(user)
+    principal_cache.put(token, current_user, payload.get("exp"))
+    return current_user
+
+async def get_token_principal(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> TokenPrincipal:
+    """
+    Usuario autenticado a partir de los claims del token, para endpoints que solo
+    necesitan rol y ambiente. Solo consulta la BD si el token es de un formato
+    anterior o si su versión quedó obsoleta.
+    """
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido o expirado",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    _ensure_session_active(payload)
+
+    user_id = payload.get("sub")
+    if (
+        payload.get("fmt") == TOKEN_FORMAT
+        and user_id is not None
+        and payload.get("role") is not None
+        and token_versions.is_current(user_id, payload.get("ver", 0))
+    ):
+        principal = TokenPrincipal(
+            id=user_id,
+            role=payload["role"],
+            environment_id=payload.get("env"),
+            center_id=payload.get("ctr"),
+            is_active=bool(payload.get("act")),
+            session_id=payload.get("sid"),
+        )
+    else:
+        user = await get_current_user(token, db)
+        principal = TokenPrincipal(
+            id=user.id,
+            role=user.role,
+            environment_id=user.environment_id,
+            is_active=user.is_active,
+            session_id=payload.get("sid"),
+        )
+
+    if not principal.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="La cuenta de usuario está inactiva",
+        )
+    return principal
 
 @router.put("/me", response_model=UserResponse)
 async def update_current_user_profile(
     profile_data: ProfileUpdateRequest,
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update current user's profile"""
     try:
@@ -98,7 +195,7 @@ async def update_current_user_profile(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    user = db.query(User).filter(User.id == uuid.UUID(user_id)).first()
+    user = await db.get(User, uuid.UUID(user_id))
     if user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado")
     
@@ -108,8 +205,9 @@ async def update_current_user_profile(
         setattr(user, field, value)
     
     user.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    principal_cache.invalidate_user(user.id)
     
     return UserResponse.from_orm(user)
 
@@ -117,7 +215,7 @@ async def update_current_user_profile(
 async def change_password(
     password_data: PasswordChangeRequest,
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Change current user's password"""
     try:
@@ -136,20 +234,25 @@ async def change_password(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    user = db.query(User).filter(User.id == uuid.UUID(user_id)).first()
+    user = await db.get(User, uuid.UUID(user_id))
     if user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado")
     
     # Verify current password
-    if not verify_password(password_data.current_password, user.password_hash):
+    if not await verify_password_async(password_data.current_password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Contraseña actual incorrecta"
         )
     
     # Hash and update new password
-    user.password_hash = hash_password(password_data.new_password)
+    user.password_hash = await hash_password_async(password_data.new_password)
     user.updated_at = datetime.utcnow()
-    db.commit()
+    bump_token_version(user)
+    # Cerrar las demás sesiones: sus refresh tokens dejan de servir
+    current_session_id = payload.get("sid")
+    await revoke_user_sessions(db, user.id, keep_session_id=uuid.UUID(current_session_id) if current_session_id else None)
+    await db.commit()
+    principal_cache.invalidate_user(user.id)
     
     return {"message": "Contraseña actualizada exitosamente"}
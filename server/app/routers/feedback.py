@@ -52,7 +52,7 @@ class FeedbackUpdateRequest(BaseModel):
     priority: Optional[str] = None
 
 @router.post("/", response_model=FeedbackResponse, status_code=status.HTTP_201_CREATED)
-async def create_feedback(
+def create_feedback(
     feedback_data: FeedbackCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -107,7 +107,7 @@ async def create_feedback(
     return new_feedback
 
 @router.get("/", response_model=List[FeedbackResponse])
-async def get_user_feedback(
+def get_user_feedback(
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
     type: Optional[str] = Query(None),
@@ -134,7 +134,7 @@ async def get_user_feedback(
     return feedbacks
 
 @router.get("/all", response_model=List[FeedbackResponse])
-async def get_all_feedback(
+def get_all_feedback(
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
     type: Optional[str] = Query(None),
@@ -174,7 +174,7 @@ async def get_all_feedback(
     return feedbacks
 
 @router.get("/{feedback_id}", response_model=FeedbackResponse)
-async def get_feedback(
+def get_feedback(
     feedback_id: UUID,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -199,7 +199,7 @@ async def get_feedback(
     return feedback
 
 @router.put("/{feedback_id}", response_model=FeedbackResponse)
-async def update_feedback(
+def update_feedback(
     feedback_id: UUID,
     update_data: FeedbackUpdateRequest,
     db: Session = Depends(get_db),
@@ -233,7 +233,7 @@ async def update_feedback(
     return feedback
 
 @router.delete("/{feedback_id}")
-async def delete_feedback(
+def delete_feedback(
     feedback_id: UUID,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from ..database import engine, async_engine, replica_engine
+from ..models.users import User
+from ..routers.auth import get_current_user
+from ..services.audit_writer import audit_writer
+from ..utils.pool_stats import pool_status
+
+router = APIRouter(tags=["internal"])
+
+@router.get("/db-pool")
+def get_db_pool_stats(current_user: User = Depends(get_current_user)):
+    """Connection pool statistics for the database engines (admin_general only)"""
+    if current_user.role != "admin_general":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo el administrador general puede consultar el estado del pool"
+        )
+
+    pools = {
+        "primary": pool_status(engine),
+        "primary_async": pool_status(async_engine.sync_engine),
+    }
+    if replica_engine is not None:
+        pools["replica"] = pool_status(replica_engine)
+    return pools
+
+@router.get("/audit-writer")
+def get_audit_writer_stats(current_user: User = Depends(get_current_user)):
+    """Audit log queue and batch writer counters (admin_general only)"""
+    if current_user.role != "admin_general":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo el administrador general puede consultar el estado de la auditoría"
+        )
+
+    return audit_writer.stats()
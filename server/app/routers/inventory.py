@@ -6,8 +6,9 @@ from uuid import UUID
 from ..database import get_db
 from ..models.inventory_items import InventoryItem
 from ..schemas.inventory_item import InventoryItemCreate, InventoryItemResponse, InventoryItemUpdate, InventoryItemVerificationUpdate
-from ..routers.auth import get_current_user
+from ..routers.auth import get_current_user, get_token_principal
 from ..models.users import User
+from ..schemas.user import TokenPrincipal
 
 router = APIRouter(tags=["inventory"])
 
@@ -18,7 +19,7 @@ def get_inventory_items(
     environment_id: Optional[UUID] = None,
     system_wide: Optional[bool] = False,
     admin_access: Optional[bool] = False,
-    current_user: User = Depends(get_current_user)
+    current_user: TokenPrincipal = Depends(get_token_principal)
 ):
     query = db.query(InventoryItem).filter(InventoryItem.status != "lost")
     
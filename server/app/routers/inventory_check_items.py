@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from uuid import UUID
 from typing import Optional
 
-from ..database import get_db
+from ..database import get_async_db
 from ..models.inventory_check_items import InventoryCheckItem
 from ..models.inventory_items import InventoryItem
 from ..models.users import User
@@ -25,16 +26,17 @@ class InventoryCheckItemCreateRequest(BaseModel):
 @router.post("/", status_code=status.HTTP_201_CREATED)
 async def create_individual_check_item(
     request: InventoryCheckItemCreateRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.role not in ["student", "instructor", "supervisor"]:
         raise HTTPException(status_code=403, detail="Rol no autorizado")
 
-    inventory_item = db.query(InventoryItem).filter(
+    result = await db.execute(select(InventoryItem).where(
         InventoryItem.id == request.item_id,
         InventoryItem.environment_id == request.environment_id
-    ).first()
+    ))
+    inventory_item = result.scalars().first()
     if not inventory_item:
         raise HTTPException(status_code=404, detail="Ítem no encontrado")
 
@@ -50,8 +52,8 @@ async def create_individual_check_item(
         user_id=current_user.id
     )
     db.add(check_item)
-    db.commit()
-    db.refresh(check_item)
+    await db.commit()
+    await db.refresh(check_item)
 
     # Actualizar quantity en InventoryItem
     inventory_item.quantity = request.quantity_found + request.quantity_damaged
@@ -67,6 +69,6 @@ async def create_individual_check_item(
     else:
         inventory_item.status = 'good'
     
-    db.commit()
+    await db.commit()
 
     return {"status": "success", "item_id": check_item.item_id}
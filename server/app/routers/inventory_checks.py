@@ -1,16 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from datetime import datetime, date, time
 from uuid import UUID
 from typing import List, Optional
 import pytz # type: ignore
 
-from ..database import get_db
+from ..database import get_db, get_async_db
 from ..models.inventory_checks import InventoryCheck
 from ..models.inventory_check_items import InventoryCheckItem
 from ..models.environments import Environment
-from ..models.inventory_items import InventoryItem
+from ..models.environment_inventory_counters import EnvironmentInventoryCounters
 from ..models.users import User
 from ..models.schedules import Schedule
 from ..models.notifications import Notification
@@ -47,67 +49,63 @@ class VerificationByScheduleRequest(BaseModel):
     comments: Optional[str] = None
 
 def calculate_verification_totals(environment_id: UUID, db: Session):
-    """Calculate verification totals based on current inventory items in the environment"""
-    inventory_items = db.query(InventoryItem).filter(
-        InventoryItem.environment_id == environment_id
-    ).all()
-    
-    total_items = len(inventory_items)
-    items_good = 0
-    items_damaged = 0
-    items_missing = 0
-    
-    for item in inventory_items:
-        # Calculate based on quantities
-        quantity_damaged = item.quantity_damaged or 0
-        quantity_missing = item.quantity_missing or 0
-        quantity_available = (item.quantity or 1) - quantity_damaged - quantity_missing
-        
-        # Count items based on their status and quantities
-        if quantity_damaged > 0:
-            items_damaged += quantity_damaged
-        if quantity_missing > 0:
-            items_missing += quantity_missing
-        if quantity_available > 0:
-            items_good += quantity_available
-    
+    """Calculate verification totals from the environment's inventory counters (primary-key lookup)"""
+    return _verification_totals(db.execute(_counters_query(environment_id)).first())
+
+async def calculate_verification_totals_async(environment_id: UUID, db: AsyncSession):
+    """Async variant of calculate_verification_totals for AsyncSession handlers"""
+    return _verification_totals((await db.execute(_counters_query(environment_id))).first())
+
+def _counters_query(environment_id: UUID):
+    # Columnas y no la entidad: el upsert de los contadores no pasa por el identity map
+    return select(
+        EnvironmentInventoryCounters.total_items,
+        EnvironmentInventoryCounters.good_quantity,
+        EnvironmentInventoryCounters.damaged_quantity,
+        EnvironmentInventoryCounters.missing_quantity
+    ).where(EnvironmentInventoryCounters.environment_id == environment_id)
+
+def _verification_totals(counters):
+    # Ambiente sin ítems: todavía no tiene fila de contadores
     return {
-        'total_items': total_items,
-        'items_good': items_good,
-        'items_damaged': items_damaged,
-        'items_missing': items_missing
+        'total_items': counters.total_items if counters else 0,
+        'items_good': counters.good_quantity if counters else 0,
+        'items_damaged': counters.damaged_quantity if counters else 0,
+        'items_missing': counters.missing_quantity if counters else 0
     }
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
 async def create_inventory_check(
     request: InventoryCheckCreateRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.role not in ["student", "instructor", "supervisor"]:
         raise HTTPException(status_code=403, detail="Rol no autorizado")
 
-    environment = db.query(Environment).filter(Environment.id == request.environment_id).first()
+    environment = await db.get(Environment, request.environment_id)
     if not environment:
         raise HTTPException(status_code=404, detail="Ambiente no encontrado")
 
-    student = db.query(User).filter(User.id == request.student_id, User.role == "student").first()
+    result = await db.execute(select(User).where(User.id == request.student_id, User.role == "student"))
+    student = result.scalars().first()
     if not student:
         raise HTTPException(status_code=404, detail="Estudiante no encontrado")
 
-    schedule = db.query(Schedule).filter(Schedule.id == request.schedule_id).first()
+    schedule = await db.get(Schedule, request.schedule_id)
     if not schedule:
         raise HTTPException(status_code=404, detail="Horario no encontrado")
 
-    existing_check = db.query(InventoryCheck).filter(
+    result = await db.execute(select(InventoryCheck).where(
         InventoryCheck.environment_id == request.environment_id,
         InventoryCheck.schedule_id == request.schedule_id,
         InventoryCheck.check_date == date.today()
-    ).first()
+    ))
+    existing_check = result.scalars().first()
     if existing_check:
         raise HTTPException(status_code=400, detail="Ya se realizó verificación hoy para este turno")
 
-    totals = calculate_verification_totals(request.environment_id, db)
+    totals = await calculate_verification_totals_async(request.environment_id, db)
 
     colombia_now = get_colombia_time()
     
@@ -126,15 +124,15 @@ async def create_inventory_check(
         student_confirmed_at=colombia_now
     )
     db.add(inventory_check)
-    db.commit()
-    db.refresh(inventory_check)
+    await db.commit()
+    await db.refresh(inventory_check)
 
     # Update status based on verification results
     if totals['items_damaged'] > 0 or totals['items_missing'] > 0:
         inventory_check.status = "issues"
     else:
         inventory_check.status = "instructor_review"
-    db.commit()
+    await db.commit()
 
     # Notify instructor
     notification = Notification(
@@ -146,39 +144,40 @@ async def create_inventory_check(
         priority="medium"
     )
     db.add(notification)
-    db.commit()
+    await db.commit()
 
     return {"status": "success", "check_id": inventory_check.id}
 
 @router.post("/by-schedule", status_code=status.HTTP_201_CREATED)
 async def create_verification_by_schedule(
     request: VerificationByScheduleRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Create or update verification by schedule - allows any role to complete verification steps"""
     if current_user.role not in ["student", "instructor", "supervisor"]:
         raise HTTPException(status_code=403, detail="Rol no autorizado")
 
-    environment = db.query(Environment).filter(Environment.id == request.environment_id).first()
+    environment = await db.get(Environment, request.environment_id)
     if not environment:
         raise HTTPException(status_code=404, detail="Ambiente no encontrado")
 
-    schedule = db.query(Schedule).filter(Schedule.id == request.schedule_id).first()
+    schedule = await db.get(Schedule, request.schedule_id)
     if not schedule:
         raise HTTPException(status_code=404, detail="Horario no encontrado")
 
     colombia_now = get_colombia_time()
 
     # Check if verification already exists for today
-    existing_check = db.query(InventoryCheck).filter(
+    result = await db.execute(select(InventoryCheck).where(
         InventoryCheck.environment_id == request.environment_id,
         InventoryCheck.schedule_id == request.schedule_id,
         InventoryCheck.check_date == date.today()
-    ).first()
+    ))
+    existing_check = result.scalars().first()
 
     if existing_check:
-        totals = calculate_verification_totals(request.environment_id, db)
+        totals = await calculate_verification_totals_async(request.environment_id, db)
         existing_check.total_items = totals['total_items']
         existing_check.items_good = totals['items_good']
         existing_check.items_damaged = totals['items_damaged']
@@ -224,13 +223,13 @@ async def create_verification_by_schedule(
             else:
                 existing_check.status = "issues"
         
-        db.commit()
-        db.refresh(existing_check)
+        await db.commit()
+        await db.refresh(existing_check)
         return {"status": "success", "check_id": existing_check.id, "action": "updated"}
     
     else:
         # Create new verification
-        totals = calculate_verification_totals(request.environment_id, db)
+        totals = await calculate_verification_totals_async(request.environment_id, db)
 
         # Determine initial status and fields based on user role
         initial_status = "student_pending"
@@ -276,8 +275,8 @@ async def create_verification_by_schedule(
             inventory_check.student_confirmed_at = colombia_now
 
         db.add(inventory_check)
-        db.commit()
-        db.refresh(inventory_check)
+        await db.commit()
+        await db.refresh(inventory_check)
 
         # Update final status based on results
         if current_user.role == "supervisor":
@@ -296,7 +295,7 @@ async def create_verification_by_schedule(
             else:
                 inventory_check.status = "instructor_review"
 
-        db.commit()
+        await db.commit()
 
         # Create appropriate notifications
         if current_user.role == "student" and schedule.instructor_id:
@@ -311,7 +310,8 @@ async def create_verification_by_schedule(
             db.add(notification)
         elif current_user.role == "instructor":
             # Notify supervisor if available
-            supervisors = db.query(User).filter(User.role == "supervisor", User.environment_id == request.environment_id).all()
+            result = await db.execute(select(User).where(User.role == "supervisor", User.environment_id == request.environment_id))
+            supervisors = result.scalars().all()
             for supervisor in supervisors:
                 notification = Notification(
                     user_id=supervisor.id,
@@ -323,24 +323,24 @@ async def create_verification_by_schedule(
                 )
                 db.add(notification)
 
-        db.commit()
+        await db.commit()
         return {"status": "success", "check_id": inventory_check.id, "action": "created"}
 
 @router.put("/{check_id}/confirm", response_model=InventoryCheckResponse)
 async def confirm_inventory_check(
     check_id: UUID,
     request: InventoryCheckInstructorConfirmRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     if current_user.role not in ["instructor", "supervisor"]:
         raise HTTPException(status_code=403, detail="Solo instructores y supervisores pueden confirmar verificaciones")
 
-    inventory_check = db.query(InventoryCheck).filter(InventoryCheck.id == check_id).first()
+    inventory_check = await db.get(InventoryCheck, check_id)
     if not inventory_check:
         raise HTTPException(status_code=404, detail="Verificación no encontrada")
 
-    totals = calculate_verification_totals(inventory_check.environment_id, db)
+    totals = await calculate_verification_totals_async(inventory_check.environment_id, db)
     inventory_check.total_items = totals['total_items']
     inventory_check.items_good = totals['items_good']
     inventory_check.items_damaged = totals['items_damaged']
@@ -384,14 +384,15 @@ async def confirm_inventory_check(
         else:
             inventory_check.status = "issues"
 
-    db.commit()
-    db.refresh(inventory_check)
+    await db.commit()
+    await db.refresh(inventory_check)
     
     # Create notifications
     notification_type = "verification_update"
     if current_user.role == "instructor":
         # Notify supervisors
-        supervisors = db.query(User).filter(User.role == "supervisor", User.environment_id == inventory_check.environment_id).all()
+        result = await db.execute(select(User).where(User.role == "supervisor", User.environment_id == inventory_check.environment_id))
+        supervisors = result.scalars().all()
         for supervisor in supervisors:
             notification = Notification(
                 user_id=supervisor.id,
@@ -426,7 +427,7 @@ async def confirm_inventory_check(
             )
             db.add(notification)
     
-    db.commit()
+    await db.commit()
     return inventory_check
 
 
@@ -479,18 +480,18 @@ def get_schedule_stats(
 async def supervisor_approve_check(
     check_id: UUID,
     approval_data: dict,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Supervisor approval endpoint for inventory checks"""
     if current_user.role != "supervisor":
         raise HTTPException(status_code=403, detail="Solo supervisores pueden aprobar verificaciones")
     
-    inventory_check = db.query(InventoryCheck).filter(InventoryCheck.id == check_id).first()
+    inventory_check = await db.get(InventoryCheck, check_id)
     if not inventory_check:
         raise HTTPException(status_code=404, detail="Verificación no encontrada")
     
-    totals = calculate_verification_totals(inventory_check.environment_id, db)
+    totals = await calculate_verification_totals_async(inventory_check.environment_id, db)
     inventory_check.total_items = totals['total_items']
     inventory_check.items_good = totals['items_good']
     inventory_check.items_damaged = totals['items_damaged']
@@ -543,8 +544,8 @@ async def supervisor_approve_check(
         )
         db.add(notification_instructor)
     
-    db.commit()
-    db.refresh(inventory_check)
+    await db.commit()
+    await db.refresh(inventory_check)
     
     return {
         "status": "success",
@@ -557,14 +558,14 @@ async def supervisor_approve_check(
 async def assign_verification_role(
     check_id: UUID,
     role_assignment: dict,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Allow supervisors to assign verification to instructors or take over verification"""
     if current_user.role not in ["supervisor", "admin"]:
         raise HTTPException(status_code=403, detail="Solo supervisores pueden asignar verificaciones")
 
-    inventory_check = db.query(InventoryCheck).filter(InventoryCheck.id == check_id).first()
+    inventory_check = await db.get(InventoryCheck, check_id)
     if not inventory_check:
         raise HTTPException(status_code=404, detail="Verificación no encontrada")
 
@@ -574,7 +575,7 @@ async def assign_verification_role(
     elif target_role == "instructor_assign":
         inventory_check.status = "instructor_review"
 
-    db.commit()
+    await db.commit()
     return {"status": "success", "message": f"Verificación asignada a {target_role}"}
 
 @router.get("/", response_model=List[InventoryCheckResponse])
@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_, func, desc
+from sqlalchemy.orm import joinedload
+from sqlalchemy import select, and_, or_, func, desc
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import date, datetime
 from uuid import UUID
 
-from ..database import get_db
+from ..database import get_async_db
 from ..models.loans import Loan
 from ..models.inventory_items import InventoryItem
 from ..models.environments import Environment
@@ -26,7 +27,7 @@ router = APIRouter()
 async def create_loan(
     loan_data: LoanCreateRegistered | LoanCreateCustom,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new loan request"""
     
@@ -40,7 +41,7 @@ async def create_loan(
     # For instructors, they can only request loans to warehouses in their center
     if current_user.role == "instructor":
         # Get instructor's environment to find their center
-        instructor_env = db.query(Environment).filter(Environment.id == current_user.environment_id).first()
+        instructor_env = await db.get(Environment, current_user.environment_id) if current_user.environment_id else None
         if not instructor_env:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -48,13 +49,14 @@ async def create_loan(
             )
         
         # Verify the target environment is a warehouse in the same center
-        target_environment = db.query(Environment).filter(
+        result = await db.execute(select(Environment).where(
             and_(
                 Environment.id == loan_data.environment_id,
                 Environment.center_id == instructor_env.center_id,
                 Environment.is_warehouse == True
             )
-        ).first()
+        ))
+        target_environment = result.scalars().first()
         
         if not target_environment:
             raise HTTPException(
@@ -63,7 +65,7 @@ async def create_loan(
             )
     else:
         # For admins, just verify environment exists
-        environment = db.query(Environment).filter(Environment.id == loan_data.environment_id).first()
+        environment = await db.get(Environment, loan_data.environment_id)
         if not environment:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -72,7 +74,7 @@ async def create_loan(
     
     # If registered item, verify it exists and is available
     if isinstance(loan_data, LoanCreateRegistered):
-        item = db.query(InventoryItem).filter(InventoryItem.id == loan_data.item_id).first()
+        item = await db.get(InventoryItem, loan_data.item_id)
         if not item:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -93,8 +95,8 @@ async def create_loan(
     
     loan = Loan(**loan_dict)
     db.add(loan)
-    db.commit()
-    db.refresh(loan)
+    await db.commit()
+    await db.refresh(loan)
     
     return await _get_loan_with_details(loan.id, db)
 
@@ -107,47 +109,50 @@ async def get_loans(
     instructor_id: Optional[UUID] = Query(None),
     priority: Optional[str] = Query(None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get loans with filtering and pagination"""
     
-    query = db.query(Loan)
+    query = select(Loan)
     
     if current_user.role == "instructor":
-        query = query.filter(Loan.instructor_id == current_user.id)
+        query = query.where(Loan.instructor_id == current_user.id)
     elif current_user.role == "admin":
         # Admin can see loans for their warehouse environment
         if current_user.environment_id:
-            query = query.filter(Loan.environment_id == current_user.environment_id)
+            query = query.where(Loan.environment_id == current_user.environment_id)
     elif current_user.role == "admin_general":
         # Admin general can see all loans in their center
         if current_user.environment_id:
             # Get the center_id through the environment relationship
-            admin_env = db.query(Environment).filter(Environment.id == current_user.environment_id).first()
+            admin_env = await db.get(Environment, current_user.environment_id)
             if admin_env:
                 # Get all warehouse environments in the same center
-                warehouse_envs = db.query(Environment).filter(
+                result = await db.execute(select(Environment.id).where(
                     and_(Environment.center_id == admin_env.center_id, Environment.is_warehouse == True)
-                ).all()
-                warehouse_ids = [env.id for env in warehouse_envs]
+                ))
+                warehouse_ids = result.scalars().all()
                 if warehouse_ids:
-                    query = query.filter(Loan.environment_id.in_(warehouse_ids))
+                    query = query.where(Loan.environment_id.in_(warehouse_ids))
     
     # Apply filters
     if status_filter:
-        query = query.filter(Loan.status == status_filter)
+        query = query.where(Loan.status == status_filter)
     if environment_id:
-        query = query.filter(Loan.environment_id == environment_id)
+        query = query.where(Loan.environment_id == environment_id)
     if instructor_id:
-        query = query.filter(Loan.instructor_id == instructor_id)
+        query = query.where(Loan.instructor_id == instructor_id)
     if priority:
-        query = query.filter(Loan.priority == priority)
+        query = query.where(Loan.priority == priority)
     
     # Get total count
-    total = query.count()
+    total = await _count(db, query)
     
     # Apply pagination
-    loans = query.order_by(desc(Loan.created_at)).offset((page - 1) * per_page).limit(per_page).all()
+    result = await db.execute(
+        query.order_by(desc(Loan.created_at)).offset((page - 1) * per_page).limit(per_page)
+    )
+    loans = result.scalars().all()
     
     # Get detailed loan data
     loan_responses = []
@@ -168,7 +173,7 @@ async def get_loans(
 @router.get("/warehouses", response_model=List[dict])
 async def get_available_warehouses(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get available warehouses for loan requests"""
     
@@ -179,7 +184,7 @@ async def get_available_warehouses(
         )
     
     # Get instructor's environment to find their center
-    instructor_env = db.query(Environment).filter(Environment.id == current_user.environment_id).first()
+    instructor_env = await db.get(Environment, current_user.environment_id) if current_user.environment_id else None
     if not instructor_env:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -187,13 +192,14 @@ async def get_available_warehouses(
         )
     
     # Get all warehouses in the same center
-    warehouses = db.query(Environment).filter(
+    result = await db.execute(select(Environment).where(
         and_(
             Environment.center_id == instructor_env.center_id,
             Environment.is_warehouse == True,
             Environment.is_active == True
         )
-    ).all()
+    ))
+    warehouses = result.scalars().all()
     
     return [
         {
@@ -209,38 +215,38 @@ async def get_available_warehouses(
 async def get_loan_stats(
     environment_id: Optional[UUID] = Query(None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get loan statistics"""
     
-    query = db.query(Loan)
+    query = select(Loan)
     
     if current_user.role == "instructor":
-        query = query.filter(Loan.instructor_id == current_user.id)
+        query = query.where(Loan.instructor_id == current_user.id)
     elif current_user.role == "admin":
         if current_user.environment_id:
-            query = query.filter(Loan.environment_id == current_user.environment_id)
+            query = query.where(Loan.environment_id == current_user.environment_id)
         elif environment_id:
-            query = query.filter(Loan.environment_id == environment_id)
+            query = query.where(Loan.environment_id == environment_id)
     elif current_user.role == "admin_general":
         if current_user.environment_id:
             # Get all warehouses in the same center
-            admin_env = db.query(Environment).filter(Environment.id == current_user.environment_id).first()
+            admin_env = await db.get(Environment, current_user.environment_id)
             if admin_env:
-                warehouse_envs = db.query(Environment).filter(
+                result = await db.execute(select(Environment.id).where(
                     and_(Environment.center_id == admin_env.center_id, Environment.is_warehouse == True)
-                ).all()
-                warehouse_ids = [env.id for env in warehouse_envs]
+                ))
+                warehouse_ids = result.scalars().all()
                 if warehouse_ids:
-                    query = query.filter(Loan.environment_id.in_(warehouse_ids))
+                    query = query.where(Loan.environment_id.in_(warehouse_ids))
     
-    total_loans = query.count()
-    pending_loans = query.filter(Loan.status == "pending").count()
-    approved_loans = query.filter(Loan.status == "approved").count()
-    active_loans = query.filter(Loan.status == "active").count()
-    overdue_loans = query.filter(Loan.status == "overdue").count()
-    returned_loans = query.filter(Loan.status == "returned").count()
-    rejected_loans = query.filter(Loan.status == "rejected").count()
+    total_loans = await _count(db, query)
+    pending_loans = await _count(db, query.where(Loan.status == "pending"))
+    approved_loans = await _count(db, query.where(Loan.status == "approved"))
+    active_loans = await _count(db, query.where(Loan.status == "active"))
+    overdue_loans = await _count(db, query.where(Loan.status == "overdue"))
+    returned_loans = await _count(db, query.where(Loan.status == "returned"))
+    rejected_loans = await _count(db, query.where(Loan.status == "rejected"))
     
     return LoanStatsResponse(
         total_loans=total_loans,
@@ -256,11 +262,11 @@ async def get_loan_stats(
 async def get_loan(
     loan_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a specific loan by ID"""
     
-    loan = db.query(Loan).filter(Loan.id == loan_id).first()
+    loan = await db.get(Loan, loan_id)
     if not loan:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -281,11 +287,11 @@ async def update_loan(
     loan_id: UUID,
     loan_update: LoanUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update a loan (approve, reject, return, etc.)"""
     
-    loan = db.query(Loan).filter(Loan.id == loan_id).first()
+    loan = await db.get(Loan, loan_id)
     if not loan:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -306,8 +312,8 @@ async def update_loan(
         setattr(loan, field, value)
     
     loan.updated_at = func.current_timestamp()
-    db.commit()
-    db.refresh(loan)
+    await db.commit()
+    await db.refresh(loan)
     
     return await _get_loan_with_details(loan_id, db)
 
@@ -315,11 +321,11 @@ async def update_loan(
 async def delete_loan(
     loan_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a loan (only if pending and by instructor)"""
     
-    loan = db.query(Loan).filter(Loan.id == loan_id).first()
+    loan = await db.get(Loan, loan_id)
     if not loan:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -333,18 +339,23 @@ async def delete_loan(
             detail="You can only delete your own pending loans"
         )
     
-    db.delete(loan)
-    db.commit()
+    await db.delete(loan)
+    await db.commit()
+
+async def _count(db: AsyncSession, query) -> int:
+    """Count the rows a select() would return"""
+    return await db.scalar(select(func.count()).select_from(query.subquery()))
 
-async def _get_loan_with_details(loan_id: UUID, db: Session) -> LoanResponse:
+async def _get_loan_with_details(loan_id: UUID, db: AsyncSession) -> LoanResponse:
     """Helper function to get loan with all related details"""
     
-    loan = db.query(Loan).options(
+    result = await db.execute(select(Loan).options(
         joinedload(Loan.instructor),
         joinedload(Loan.admin),
         joinedload(Loan.item),
         joinedload(Loan.environment)
-    ).filter(Loan.id == loan_id).first()
+    ).where(Loan.id == loan_id))
+    loan = result.scalars().first()
     
     if not loan:
         raise HTTPException(
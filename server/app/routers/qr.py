@@ -1,19 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Literal
 from datetime import datetime
 from uuid import UUID
 import hashlib
 import json
-from jose import jwt, JWTError
 
-from ..database import get_db
+from ..database import get_db, get_async_db
 from ..models.inventory_items import InventoryItem
 from ..models.environments import Environment
 from ..models.users import User
-from ..schemas.user import UserResponse
-from ..routers.auth import oauth2_scheme
+from ..schemas.user import UserResponse, TokenPrincipal
+from ..services.auth_service import link_user_environment
+from ..routers.auth import get_token_principal
 from ..config import settings
 
 router = APIRouter(tags=["qr"])
@@ -72,8 +74,8 @@ class QRScanRequest(BaseModel):
 @router.post("/scan")
 async def scan_qr(
     request: QRScanRequest,
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenPrincipal = Depends(get_token_principal)
 ):
     try:
         qr_payload = json.loads(request.qr_data)
@@ -95,43 +97,21 @@ async def scan_qr(
         if qr_type != "environment":
             raise HTTPException(status_code=400, detail="Solo se soportan QR de ambientes")
 
-        environment = db.query(Environment).filter(
+        result = await db.execute(select(Environment).where(
             Environment.id == UUID(entity_id),
             Environment.is_active == True
-        ).first()
+        ))
+        environment = result.scalars().first()
         if not environment:
             raise HTTPException(status_code=404, detail="Ambiente no encontrado")
 
-        try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-            user_id: str = payload.get("sub")
-            if user_id is None:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Token inválido",
-                    headers={"WWW-Authenticate": "Bearer"},
-                )
-        except JWTError:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token inválido o expirado",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-
-        current_user = db.query(User).filter(User.id == UUID(user_id)).first()
-        if not current_user:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado")
-
         if current_user.role not in ["instructor", "student", "supervisor"]:
             raise HTTPException(
                 status_code=403,
                 detail="Rol no autorizado para vincular ambientes"
             )
 
-        current_user.environment_id = environment.id
-        current_user.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(current_user)
+        user, access_token = await link_user_environment(db, current_user.id, environment, current_user.session_id)
 
         return {
             "status": "success",
@@ -141,7 +121,8 @@ async def scan_qr(
                 "location": environment.location,
                 "qr_code": environment.qr_code
             },
-            "user": UserResponse.from_orm(current_user)
+            "user": UserResponse.from_orm(user),
+            "access_token": access_token
         }
 
     except json.JSONDecodeError:
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, contains_eager
 from sqlalchemy import desc
 from uuid import UUID
 from datetime import datetime, timedelta
@@ -19,9 +19,13 @@ from ..schemas.generated_reports import GeneratedReportCreate, GeneratedReportRe
 
 router = APIRouter(tags=["reports"])
 
+# Excel y PDF se arman completos en memoria: tope de filas de auditoría para esos
+# formatos (el CSV se escribe fila por fila; exportación completa en /api/audit-logs/export)
+IN_MEMORY_AUDIT_MAX_ROWS = 1000
+
 
 @router.post("/generate", response_model=GeneratedReportResponse)
-async def generate_report(
+def generate_report(
     report_request: GeneratedReportCreate,
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
@@ -217,11 +221,12 @@ def get_reports_summary(
         "report_types": [{"type": rt.report_type, "count": rt.count} for rt in report_types]
     }
 
-async def _generate_report_file(report_id: UUID, report_request: dict, user_id: UUID):
+def _generate_report_file(report_id: UUID, report_request: dict, user_id: UUID):
     """Background task to generate report file"""
-    from ..database import SessionLocal
+    from ..database import SessionLocal, open_read_session
     
     db = SessionLocal()
+    read_db = open_read_session()
     try:
         report = db.query(GeneratedReport).filter(GeneratedReport.id == report_id).first()
         if not report:
@@ -239,7 +244,7 @@ async def _generate_report_file(report_id: UUID, report_request: dict, user_id:
             
             # Here you would implement the actual report generation logic
             # For now, we'll create a placeholder file
-            await _create_report_file(file_path, report_request, db)
+            _create_report_file(file_path, report_request, read_db)
             
             # Update report record
             report.file_path = str(file_path)
@@ -257,9 +262,10 @@ async def _generate_report_file(report_id: UUID, report_request: dict, user_id:
             print(f"Error generating report {report_id}: {e}")
             
     finally:
+        read_db.close()
         db.close()
 
-async def _create_report_file(file_path: Path, report_request: dict, db: Session):
+def _create_report_file(file_path: Path, report_request: dict, db: Session):
     """Create the actual report file based on request parameters"""
     
     report_type = report_request.get("report_type")
@@ -267,41 +273,43 @@ async def _create_report_file(file_path: Path, report_request: dict, db: Session
     parameters = report_request.get("parameters", {})
     
     if file_format == "csv":
-        await _generate_csv_report(file_path, report_type, parameters, db)
+        _generate_csv_report(file_path, report_type, parameters, db)
     elif file_format == "excel":
-        await _generate_excel_report(file_path, report_type, parameters, db)
+        _generate_excel_report(file_path, report_type, parameters, db)
     elif file_format == "pdf":
-        await _generate_pdf_report(file_path, report_type, parameters, db)
+        _generate_pdf_report(file_path, report_type, parameters, db)
     else:
         raise ValueError(f"Unsupported file format: {file_format}")
 
-async def _generate_csv_report(file_path: Path, report_type: str, parameters: dict, db: Session):
+def _generate_csv_report(file_path: Path, report_type: str, parameters: dict, db: Session):
     """Generate CSV report"""
     import csv
     
-    # Get data based on report type
-    data = await _get_report_data(report_type, parameters, db)
+    # Get data based on report type (el reporte de auditoría llega como iterador)
+    data = iter(_get_report_data(report_type, parameters, db))
+    first_row = next(data, None)
     
     with open(file_path, 'w', newline='', encoding='utf-8') as csvfile:
-        if not data:
+        if first_row is None:
             csvfile.write("No hay datos disponibles\n")
             return
         
         # Write headers
-        headers = list(data[0].keys()) if data else []
+        headers = list(first_row.keys())
         writer = csv.DictWriter(csvfile, fieldnames=headers)
         writer.writeheader()
         
         # Write data
+        writer.writerow(first_row)
         for row in data:
             writer.writerow(row)
 
-async def _generate_excel_report(file_path: Path, report_type: str, parameters: dict, db: Session):
+def _generate_excel_report(file_path: Path, report_type: str, parameters: dict, db: Session):
     """Generate Excel report"""
     import pandas as pd
     
-    # Get data based on report type
-    data = await _get_report_data(report_type, parameters, db)
+    # Get data based on report type; Excel y PDF necesitan todas las filas en memoria
+    data = list(_get_report_data(report_type, parameters, db, max_rows=IN_MEMORY_AUDIT_MAX_ROWS))
     
     if not data:
         # Create empty DataFrame with message
@@ -313,7 +321,7 @@ async def _generate_excel_report(file_path: Path, report_type: str, parameters:
     with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
         df.to_excel(writer, sheet_name=report_type.title(), index=False)
 
-async def _generate_pdf_report(file_path: Path, report_type: str, parameters: dict, db: Session):
+def _generate_pdf_report(file_path: Path, report_type: str, parameters: dict, db: Session):
     """Generate PDF report"""
     from reportlab.lib.pagesizes import letter, A4
     from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -321,8 +329,8 @@ async def _generate_pdf_report(file_path: Path, report_type: str, parameters: di
     from reportlab.lib import colors
     from reportlab.lib.units import inch
     
-    # Get data based on report type
-    data = await _get_report_data(report_type, parameters, db)
+    # Get data based on report type; Excel y PDF necesitan todas las filas en memoria
+    data = list(_get_report_data(report_type, parameters, db, max_rows=IN_MEMORY_AUDIT_MAX_ROWS))
     
     # Create PDF document
     doc = SimpleDocTemplate(str(file_path), pagesize=A4)
@@ -377,8 +385,8 @@ async def _generate_pdf_report(file_path: Path, report_type: str, parameters: di
     # Build PDF
     doc.build(story)
 
-async def _get_report_data(report_type: str, parameters: dict, db: Session):
-    """Get data for report generation based on type and parameters"""
+def _get_report_data(report_type: str, parameters: dict, db: Session, max_rows: Optional[int] = None):
+    """Get data for report generation based on type and parameters (max_rows limita el reporte de auditoría)"""
     
     # Import models
     from ..models.inventory_items import InventoryItem
@@ -468,7 +476,9 @@ async def _get_report_data(report_type: str, parameters: dict, db: Session):
         ]
     
     elif report_type == "audit":
-        query = db.query(AuditLog).join(User, AuditLog.user_id == User.id, isouter=True)
+        query = db.query(AuditLog).outerjoin(
+            User, AuditLog.user_id == User.id
+        ).options(contains_eager(AuditLog.user))
         
         if start_date:
             query = query.filter(AuditLog.created_at >= start_date)
@@ -478,13 +488,15 @@ async def _get_report_data(report_type: str, parameters: dict, db: Session):
         
         # Filter by environment if specified
         if environment_id and environment_id != 'all':
-            query = query.filter(
-                AuditLog.new_values.op('->>')('request').op('->>')('body').op('->>')('environment_id') == environment_id
-            )
+            query = query.filter(AuditLog.environment_id == environment_id)
         
-        audit_logs = query.order_by(AuditLog.created_at.desc()).limit(1000).all()
+        # Cursor del lado del servidor, se consume fila por fila; sin tope salvo max_rows
+        query = query.order_by(AuditLog.created_at.desc(), AuditLog.id.desc())
+        if max_rows is not None:
+            query = query.limit(max_rows)
+        audit_logs = query.execution_options(yield_per=1000)
         
-        return [
+        return (
             {
                 "Fecha y Hora": log.created_at.strftime('%d/%m/%Y %H:%M:%S'),
                 "Usuario": f"{log.user.first_name} {log.user.last_name}" if log.user else "Usuario desconocido",
@@ -495,11 +507,11 @@ async def _get_report_data(report_type: str, parameters: dict, db: Session):
                 "ID Entidad": str(log.entity_id) if log.entity_id else "N/A",
                 "Dirección IP": log.ip_address or "N/A",
                 "Estado": _get_action_status(log),
-                "Duración": f"{log.new_values.get('duration_seconds', 0):.2f}s" if log.new_values else "0.00s",
+                "Duración": f"{(log.duration_ms or 0) / 1000:.2f}s",
                 "Detalles": _get_action_details(log)
             }
             for log in audit_logs
-        ]
+        )
     
     return []
 
@@ -538,9 +550,8 @@ def _get_friendly_entity_name(entity_type: str) -> str:
 
 def _get_action_status(log: AuditLog) -> str:
     """Determine if action was successful or failed"""
-    if log.new_values and 'response' in log.new_values:
-        status_code = log.new_values['response'].get('status_code', 0)
-        if 200 <= status_code < 400:
+    if log.status_code is not None:
+        if 200 <= log.status_code < 400:
             return "Exitoso"
         else:
             return "Error"
@@ -548,24 +559,14 @@ def _get_action_status(log: AuditLog) -> str:
 
 def _get_action_details(log: AuditLog) -> str:
     """Get additional details about the action"""
-    if not log.new_values:
-        return ""
-    
     details = []
     
     # Add HTTP method and endpoint if available
-    if 'request' in log.new_values:
-        request = log.new_values['request']
-        method = request.get('method', '')
-        path = request.get('path', '')
-        if method and path:
-            details.append(f"{method} {path}")
+    if log.method and log.path:
+        details.append(f"{log.method} {log.path}")
     
     # Add response status if available
-    if 'response' in log.new_values:
-        response = log.new_values['response']
-        status_code = response.get('status_code')
-        if status_code:
-            details.append(f"HTTP {status_code}")
+    if log.status_code:
+        details.append(f"HTTP {log.status_code}")
     
     return " | ".join(details)
@@ -13,7 +13,7 @@ from ..models.users import User
 router = APIRouter(tags=["schedules"])
 
 @router.get("/", response_model=List[ScheduleResponse])
-async def get_schedules(
+def get_schedules(
     environment_id: Optional[UUID] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -53,7 +53,7 @@ async def get_schedules(
     return schedules
 
 @router.post("/", response_model=ScheduleResponse, status_code=status.HTTP_201_CREATED)
-async def create_schedule(
+def create_schedule(
     schedule_data: ScheduleCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -68,7 +68,7 @@ async def create_schedule(
     return new_schedule
 
 @router.put("/{schedule_id}", response_model=ScheduleResponse)
-async def update_schedule(
+def update_schedule(
     schedule_id: UUID,
     schedule_data: ScheduleUpdate,
     db: Session = Depends(get_db),
@@ -90,7 +90,7 @@ async def update_schedule(
     return schedule
 
 @router.delete("/{schedule_id}")
-async def delete_schedule(
+def delete_schedule(
     schedule_id: UUID,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
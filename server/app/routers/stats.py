@@ -1,104 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy import func, select
 from uuid import UUID
 from datetime import datetime, date, timedelta
-from typing import Optional
+from typing import List, Optional
 
-from ..database import get_db
+from ..database import get_read_db
 from ..models.inventory_checks import InventoryCheck
-from ..models.inventory_items import InventoryItem
+from ..models.environment_inventory_counters import EnvironmentInventoryCounters
 from ..models.maintenance_requests import MaintenanceRequest
 from ..models.environments import Environment
 from ..models.users import User
 from ..models.loans import Loan
-from ..routers.auth import get_current_user
+from ..routers.auth import get_token_principal
+from ..schemas.user import TokenPrincipal
+from ..schemas.stats import DashboardStatsResponse
+from ..services.stats_service import StatsService
 
 router = APIRouter(tags=["stats"])
 
-@router.get("/dashboard")
+# Límite de ids explícitos en /environments (un centro se pide por center_id)
+MAX_BATCH_ENVIRONMENTS = 200
+
+@router.get("/dashboard", response_model=DashboardStatsResponse)
 def get_dashboard_stats(
     environment_id: Optional[UUID] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: TokenPrincipal = Depends(get_token_principal)
 ):
     """Get general dashboard statistics"""
     
-    # Base query filters
-    inventory_query = db.query(InventoryItem)
-    checks_query = db.query(InventoryCheck)
-    maintenance_query = db.query(MaintenanceRequest)
-    
-    if environment_id:
-        inventory_query = inventory_query.filter(InventoryItem.environment_id == environment_id)
-        checks_query = checks_query.filter(InventoryCheck.environment_id == environment_id)
-        maintenance_query = maintenance_query.filter(MaintenanceRequest.environment_id == environment_id)
-    elif current_user.environment_id:
-        inventory_query = inventory_query.filter(InventoryItem.environment_id == current_user.environment_id)
-        checks_query = checks_query.filter(InventoryCheck.environment_id == current_user.environment_id)
-        maintenance_query = maintenance_query.filter(MaintenanceRequest.environment_id == current_user.environment_id)
-    
-    # Inventory statistics
-    total_items = inventory_query.count()
-    available_items = inventory_query.filter(InventoryItem.status == 'available').count()
-    in_use_items = inventory_query.filter(InventoryItem.status == 'in_use').count()
-    maintenance_items = inventory_query.filter(InventoryItem.status == 'maintenance').count()
-    damaged_items = inventory_query.filter(InventoryItem.status == 'damaged').count()
-    
-    # Total quantities including group items
-    total_quantity = db.query(func.sum(InventoryItem.quantity)).filter(
-        InventoryItem.environment_id == (environment_id or current_user.environment_id)
-    ).scalar() or 0
-    
-    damaged_quantity = db.query(func.sum(InventoryItem.quantity_damaged)).filter(
-        InventoryItem.environment_id == (environment_id or current_user.environment_id)
-    ).scalar() or 0
-    
-    missing_quantity = db.query(func.sum(InventoryItem.quantity_missing)).filter(
-        InventoryItem.environment_id == (environment_id or current_user.environment_id)
-    ).scalar() or 0
-    
-    # Verification statistics (last 30 days)
-    thirty_days_ago = date.today() - timedelta(days=30)
-    recent_checks = checks_query.filter(InventoryCheck.check_date >= thirty_days_ago).count()
-    completed_checks = checks_query.filter(
-        and_(InventoryCheck.check_date >= thirty_days_ago, InventoryCheck.status == 'complete')
-    ).count()
-    
-    # Maintenance statistics
-    pending_maintenance = maintenance_query.filter(MaintenanceRequest.status == 'pending').count()
-    in_progress_maintenance = maintenance_query.filter(MaintenanceRequest.status == 'in_progress').count()
-    
-    return {
-        "inventory": {
-            "total_items": total_items,
-            "total_quantity": total_quantity,
-            "available_items": available_items,
-            "in_use_items": in_use_items,
-            "maintenance_items": maintenance_items,
-            "damaged_items": damaged_items,
-            "damaged_quantity": damaged_quantity,
-            "missing_quantity": missing_quantity
-        },
-        "verifications": {
-            "recent_checks": recent_checks,
-            "completed_checks": completed_checks,
-            "completion_rate": round((completed_checks / recent_checks * 100) if recent_checks > 0 else 0, 2)
-        },
-        "maintenance": {
-            "pending_requests": pending_maintenance,
-            "in_progress_requests": in_progress_maintenance,
-            "total_active": pending_maintenance + in_progress_maintenance
-        }
-    }
+    return StatsService.get_dashboard_stats(db, environment_id or current_user.environment_id)
 
 @router.get("/inventory-checks")
 def get_inventory_check_stats(
     environment_id: Optional[UUID] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: TokenPrincipal = Depends(get_token_principal)
 ):
     """Get detailed inventory check statistics"""
     
@@ -150,63 +90,44 @@ def get_inventory_check_stats(
 @router.get("/environment/{environment_id}")
 def get_environment_stats(
     environment_id: UUID,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: TokenPrincipal = Depends(get_token_principal)
 ):
     """Get statistics for a specific environment"""
     
-    # Verify environment exists
-    environment = db.query(Environment).filter(Environment.id == environment_id).first()
-    if not environment:
+    results = StatsService.get_environments_stats(db, [environment_id], include_dashboard=False)
+    if not results:
         raise HTTPException(status_code=404, detail="Ambiente no encontrado")
     
-    # Inventory by category
-    categories = ['computer', 'projector', 'keyboard', 'mouse', 'tv', 'camera', 'microphone', 'tablet', 'other']
-    category_stats = {}
-    
-    for category in categories:
-        count = db.query(InventoryItem).filter(
-            and_(InventoryItem.environment_id == environment_id, InventoryItem.category == category)
-        ).count()
-        
-        quantity = db.query(func.sum(InventoryItem.quantity)).filter(
-            and_(InventoryItem.environment_id == environment_id, InventoryItem.category == category)
-        ).scalar() or 0
-        
-        category_stats[category] = {
-            "count": count,
-            "quantity": quantity
-        }
-    
-    # Recent activity (last 7 days)
-    week_ago = date.today() - timedelta(days=7)
-    recent_checks = db.query(InventoryCheck).filter(
-        and_(InventoryCheck.environment_id == environment_id, InventoryCheck.check_date >= week_ago)
-    ).count()
-    
-    recent_maintenance = db.query(MaintenanceRequest).filter(
-        and_(MaintenanceRequest.environment_id == environment_id, MaintenanceRequest.created_at >= datetime.combine(week_ago, datetime.min.time()))
-    ).count()
-    
-    return {
-        "environment": {
-            "id": environment.id,
-            "name": environment.name,
-            "location": environment.location
-        },
-        "category_distribution": category_stats,
-        "recent_activity": {
-            "checks_last_week": recent_checks,
-            "maintenance_requests_last_week": recent_maintenance
-        }
-    }
+    return results[0]
+
+@router.get("/environments")
+def get_environments_stats(
+    center_id: Optional[UUID] = None,
+    environment_ids: Optional[List[UUID]] = Query(None),
+    db: Session = Depends(get_read_db),
+    current_user: TokenPrincipal = Depends(get_token_principal)
+):
+    """Get statistics for several environments (a whole center or a list of ids) in one request"""
+    
+    if center_id:
+        scope = select(Environment.id).where(Environment.center_id == center_id)
+    elif environment_ids:
+        if len(environment_ids) > MAX_BATCH_ENVIRONMENTS:
+            raise HTTPException(status_code=400, detail=f"Máximo {MAX_BATCH_ENVIRONMENTS} ambientes por consulta")
+        scope = list(set(environment_ids))
+    else:
+        raise HTTPException(status_code=400, detail="Debe indicar center_id o environment_ids")
+    
+    return {"environments": StatsService.get_environments_stats(db, scope)}
 
 @router.get("/trends")
 def get_trends_stats(
     environment_id: Optional[UUID] = None,
     days: int = 30,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    granularity: str = Query("day", pattern="^(day|week|month)$"),
+    db: Session = Depends(get_read_db),
+    current_user: TokenPrincipal = Depends(get_token_principal)
 ):
     """Get trend statistics over time"""
     
@@ -214,37 +135,36 @@ def get_trends_stats(
         raise HTTPException(status_code=400, detail="Máximo 365 días permitidos")
     
     start_date = date.today() - timedelta(days=days)
+    end_date = start_date + timedelta(days=days - 1)
     
-    query = db.query(InventoryCheck)
+    filters = []
     if environment_id:
-        query = query.filter(InventoryCheck.environment_id == environment_id)
+        filters.append(InventoryCheck.environment_id == environment_id)
     elif current_user.environment_id:
-        query = query.filter(InventoryCheck.environment_id == current_user.environment_id)
+        filters.append(InventoryCheck.environment_id == current_user.environment_id)
     
-    # Daily verification counts
-    daily_stats = []
-    for i in range(days):
-        current_date = start_date + timedelta(days=i)
-        daily_count = query.filter(InventoryCheck.check_date == current_date).count()
-        daily_stats.append({
-            "date": current_date.isoformat(),
-            "verifications": daily_count
-        })
+    # Verificaciones por intervalo, en una sola consulta
+    series = StatsService.time_series(
+        db, InventoryCheck.check_date, start_date, end_date, granularity, filters
+    )
+    daily_stats = [{"date": point["date"], "verifications": point["count"]} for point in series]
+    total_verifications = sum(point["count"] for point in series)
     
     # Weekly averages
-    weekly_avg = sum(stat["verifications"] for stat in daily_stats) / (days / 7) if days >= 7 else 0
+    weekly_avg = total_verifications / (days / 7) if days >= 7 else 0
     
     return {
         "period_days": days,
+        "granularity": granularity,
         "daily_verifications": daily_stats,
         "weekly_average": round(weekly_avg, 2),
-        "total_period_verifications": sum(stat["verifications"] for stat in daily_stats)
+        "total_period_verifications": total_verifications
     }
 
 @router.get("/admin-dashboard")
 def get_admin_dashboard_stats(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: TokenPrincipal = Depends(get_token_principal)
 ):
     """Get comprehensive dashboard statistics for admin_general"""
     if current_user.role != "admin_general":
@@ -258,7 +178,7 @@ def get_admin_dashboard_stats(
     active_users = db.query(User).filter(User.is_active == True).count()
     
     # Equipment statistics (total inventory items across all environments)
-    total_equipment = db.query(func.sum(InventoryItem.quantity)).scalar() or 0
+    total_equipment = db.query(func.sum(EnvironmentInventoryCounters.total_quantity)).scalar() or 0
     
     # Environment statistics
     total_environments = db.query(Environment).filter(Environment.is_active == True).count()
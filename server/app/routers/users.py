@@ -1,22 +1,23 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_
+from sqlalchemy import select, func, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
 from uuid import UUID
 from typing import Optional, List
 import uuid
-import bcrypt
 
-from ..database import get_db
+from ..database import get_async_db
 from ..models.environments import Environment
 from ..models.users import User
 from ..models.inventory_items import InventoryItem
 from ..models.loans import Loan
-from ..schemas.user import UserResponse, UserCreate
-from ..routers.auth import oauth2_scheme, get_current_user
-from ..config import settings
-from jose import JWTError, jwt
+from ..schemas.user import UserResponse, UserCreate, TokenPrincipal
+from ..services.auth_service import link_user_environment, revoke_user_sessions
+from ..services.principal_cache import principal_cache
+from ..services.token_versions import bump_token_version
+from ..routers.auth import get_current_user, get_token_principal
+from ..utils.security import hash_password_async
 
 router = APIRouter(tags=["users"])
 
@@ -51,7 +52,7 @@ async def get_users(
     end_date: Optional[str] = Query(None),
     system_wide: Optional[bool] = Query(None),
     admin_access: Optional[bool] = Query(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get all users with filtering and pagination (admin_general only)"""
@@ -61,40 +62,41 @@ async def get_users(
             detail="Solo el administrador general puede acceder a todos los usuarios"
         )
     
-    query = db.query(User)
+    query = select(User)
     
     # Apply date filtering for statistics
     if start_date and end_date:
         try:
             start = datetime.fromisoformat(start_date)
             end = datetime.fromisoformat(end_date)
-            query = query.filter(User.created_at.between(start, end))
+            query = query.where(User.created_at.between(start, end))
         except ValueError:
             pass
     
     # Apply filters
     if role:
-        query = query.filter(User.role == role)
+        query = query.where(User.role == role)
     
     if is_active is not None:
-        query = query.filter(User.is_active == is_active)
+        query = query.where(User.is_active == is_active)
     
     if search:
+        # full_name y email tienen índices de trigramas
         search_filter = or_(
-            User.first_name.ilike(f"%{search}%"),
-            User.last_name.ilike(f"%{search}%"),
+            User.full_name.ilike(f"%{search}%"),
             User.email.ilike(f"%{search}%")
         )
-        query = query.filter(search_filter)
+        query = query.where(search_filter)
     
     # Apply pagination
-    users = query.offset(skip).limit(limit).all()
+    result = await db.execute(query.offset(skip).limit(limit))
+    users = result.scalars().all()
     
     return [UserResponse.from_orm(user) for user in users]
 
 @router.get("/stats", response_model=UserStatsResponse)
 async def get_user_stats(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get user statistics (admin_general only)"""
@@ -105,21 +107,21 @@ async def get_user_stats(
         )
     
     # Basic counts
-    total_users = db.query(User).count()
-    active_users = db.query(User).filter(User.is_active == True).count()
+    total_users = await db.scalar(select(func.count(User.id)))
+    active_users = await db.scalar(select(func.count(User.id)).where(User.is_active == True))
     inactive_users = total_users - active_users
     
     # Users by role
     roles = ['student', 'instructor', 'supervisor', 'admin', 'admin_general']
     users_by_role = {}
     for role in roles:
-        count = db.query(User).filter(User.role == role).count()
+        count = await db.scalar(select(func.count(User.id)).where(User.role == role))
         users_by_role[role] = count
     
     # Recent registrations (last 7 days)
     from datetime import timedelta
     week_ago = datetime.utcnow() - timedelta(days=7)
-    recent_registrations = db.query(User).filter(User.created_at >= week_ago).count()
+    recent_registrations = await db.scalar(select(func.count(User.id)).where(User.created_at >= week_ago))
     
     return UserStatsResponse(
         total_users=total_users,
@@ -132,7 +134,7 @@ async def get_user_stats(
 @router.get("/{user_id}", response_model=UserResponse)
 async def get_user(
     user_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get specific user by ID (admin_general only)"""
@@ -142,7 +144,7 @@ async def get_user(
             detail="Solo el administrador general puede acceder a información de usuarios"
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
@@ -151,7 +153,7 @@ async def get_user(
 @router.post("/", response_model=UserResponse)
 async def create_user(
     user_data: UserCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Create new user (admin_general only)"""
@@ -162,7 +164,8 @@ async def create_user(
         )
     
     # Check if email already exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    result = await db.execute(select(User).where(User.email == user_data.email))
+    existing_user = result.scalars().first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -170,7 +173,7 @@ async def create_user(
         )
     
     # Hash password
-    password_hash = bcrypt.hashpw(user_data.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    password_hash = await hash_password_async(user_data.password)
     
     # Create user
     new_user = User(
@@ -190,8 +193,8 @@ async def create_user(
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     return UserResponse.from_orm(new_user)
 
@@ -199,7 +202,7 @@ async def create_user(
 async def update_user(
     user_id: UUID,
     user_data: UserUpdateRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Update user (admin_general only)"""
@@ -209,7 +212,7 @@ async def update_user(
             detail="Solo el administrador general puede actualizar usuarios"
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
@@ -219,15 +222,20 @@ async def update_user(
         setattr(user, field, value)
     
     user.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(user)
+    if {"role", "is_active", "environment_id"} & update_data.keys():
+        bump_token_version(user)
+    if update_data.get("is_active") is False:
+        await revoke_user_sessions(db, user.id)
+    await db.commit()
+    await db.refresh(user)
+    principal_cache.invalidate_user(user.id)
     
     return UserResponse.from_orm(user)
 
 @router.delete("/{user_id}")
 async def delete_user(
     user_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Soft delete user (deactivate) (admin_general only)"""
@@ -237,21 +245,24 @@ async def delete_user(
             detail="Solo el administrador general puede eliminar usuarios"
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
     # Soft delete by deactivating
     user.is_active = False
     user.updated_at = datetime.utcnow()
-    db.commit()
+    bump_token_version(user)
+    await revoke_user_sessions(db, user.id)
+    await db.commit()
+    principal_cache.invalidate_user(user.id)
     
     return {"message": "Usuario desactivado exitosamente"}
 
 @router.post("/{user_id}/activate")
 async def activate_user(
     user_id: UUID,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Activate/reactivate user (admin_general only)"""
@@ -261,59 +272,39 @@ async def activate_user(
             detail="Solo el administrador general puede activar usuarios"
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
     user.is_active = True
     user.updated_at = datetime.utcnow()
-    db.commit()
+    bump_token_version(user)
+    await db.commit()
+    principal_cache.invalidate_user(user.id)
     
     return {"message": "Usuario activado exitosamente"}
 
 @router.post("/link-environment")
 async def link_environment(
     request: LinkEnvironmentRequest,
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: TokenPrincipal = Depends(get_token_principal)
 ):
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token inválido",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-    except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token inválido o expirado",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-
-    current_user = db.query(User).filter(User.id == uuid.UUID(user_id)).first()
-    if not current_user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado")
-
     if current_user.role not in ["instructor", "student", "supervisor"]:
         raise HTTPException(
             status_code=403,
             detail="Rol no autorizado para vincular ambientes"
         )
 
-    environment = db.query(Environment).filter(
+    result = await db.execute(select(Environment).where(
         Environment.id == request.environment_id,
         Environment.is_active == True
-    ).first()
+    ))
+    environment = result.scalars().first()
     if not environment:
         raise HTTPException(status_code=404, detail="Ambiente no encontrado")
 
-    current_user.environment_id = environment.id
-    current_user.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(current_user)
+    user, access_token = await link_user_environment(db, current_user.id, environment, current_user.session_id)
 
     return {
         "status": "success",
@@ -323,5 +314,6 @@ async def link_environment(
             "location": environment.location,
             "qr_code": environment.qr_code
         },
-        "user": UserResponse.from_orm(current_user)
+        "user": UserResponse.from_orm(user),
+        "access_token": access_token
     }
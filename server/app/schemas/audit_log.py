@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from typing import Optional, Dict, Any
 from datetime import datetime
 from uuid import UUID
@@ -19,19 +19,44 @@ class AuditLogCreate(AuditLogBase):
 class AuditLogResponse(AuditLogBase):
     id: UUID
     user_id: Optional[UUID]
+    environment_id: Optional[UUID] = None
+    center_id: Optional[UUID] = None
     created_at: datetime
+    method: Optional[str] = None
+    path: Optional[str] = None
+    status_code: Optional[int] = None
+    duration_ms: Optional[int] = None
+    severity: Optional[str] = None
+    search_rank: Optional[float] = None
     user_name: Optional[str] = None
     user_email: Optional[str] = None
 
     class Config:
         from_attributes = True
 
+    @model_validator(mode="after")
+    def _legacy_new_values(self):
+        """Expone los campos compactos también en new_values, con las claves que leen los clientes"""
+        if self.status_code is None and self.duration_ms is None:
+            return self
+        values = dict(self.new_values or {})
+        if self.method and self.path:
+            values.setdefault("request", {"method": self.method, "path": self.path})
+        if self.status_code is not None:
+            values.setdefault("response", {"status_code": self.status_code})
+        if self.duration_ms is not None:
+            values.setdefault("duration_seconds", self.duration_ms / 1000)
+        self.new_values = values
+        return self
+
 class AuditLogListResponse(BaseModel):
     logs: list[AuditLogResponse]
-    total: int
+    total: Optional[int] = None  # None si se pidió include_total=false
+    total_is_estimate: bool = False
     page: int
     per_page: int
-    total_pages: int
+    total_pages: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 class AuditLogStatsResponse(BaseModel):
     total_logs: int
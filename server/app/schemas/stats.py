@@ -0,0 +1,26 @@
+from pydantic import BaseModel
+
+class InventoryDashboardStats(BaseModel):
+    total_items: int
+    total_quantity: int
+    available_items: int
+    in_use_items: int
+    maintenance_items: int
+    damaged_items: int
+    damaged_quantity: int
+    missing_quantity: int
+
+class VerificationDashboardStats(BaseModel):
+    recent_checks: int
+    completed_checks: int
+    completion_rate: float
+
+class MaintenanceDashboardStats(BaseModel):
+    pending_requests: int
+    in_progress_requests: int
+    total_active: int
+
+class DashboardStatsResponse(BaseModel):
+    inventory: InventoryDashboardStats
+    verifications: VerificationDashboardStats
+    maintenance: MaintenanceDashboardStats
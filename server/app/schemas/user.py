@@ -27,6 +27,15 @@ class UserResponse(UserBase):
     class Config:
         from_attributes = True
 
+class TokenPrincipal(BaseModel):
+    """Usuario autenticado reconstruido desde los claims del token, sin consultar la BD"""
+    id: UUID
+    role: str
+    environment_id: Optional[UUID] = None
+    center_id: Optional[UUID] = None
+    is_active: bool = True
+    session_id: Optional[UUID] = None
+
 class LoginRequest(BaseModel):
     email: EmailStr
     password: str
@@ -34,8 +43,12 @@ class LoginRequest(BaseModel):
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
     user: UserResponse  # Incluimos la información completa del usuario
 
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
 class LinkEnvironmentRequest(BaseModel):
     environment_id: UUID
 
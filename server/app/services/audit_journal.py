@@ -0,0 +1,332 @@
+import base64
+import json
+import logging
+import os
+import struct
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos (un solo worker)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Directorio server/: base de AUDIT_JOURNAL_DIR cuando es relativo, independiente del cwd
+_SERVER_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_SLOT_PREFIX = "worker-"
+_SLOT_LOCK = ".lock"
+
+# Prefijo de cada registro: longitud del payload JSON, 4 bytes big-endian
+_LENGTH = struct.Struct(">I")
+_SEGMENT_PREFIX = "audit-"
+_SEGMENT_SUFFIX = ".seg"
+# Segmentos que el replay no pudo volcar tras varios intentos; no se vuelven a leer
+_QUARANTINE_SUFFIX = ".quarantine"
+# Filas que la BD rechazó por su contenido: una por línea, con el error, para revisión manual
+_DEAD_LETTER_FILE = "dead-letter.jsonl"
+
+# Campos de AuditLog que hay que reconstruir al leer el journal
+_UUID_FIELDS = ("id", "user_id", "entity_id", "environment_id", "center_id")
+_DATETIME_FIELDS = ("created_at",)
+_BYTES_FIELDS = ("request_body",)
+
+def _encode_json(row: Dict[str, Any]) -> Dict[str, Any]:
+    row = dict(row)
+    for field in _BYTES_FIELDS:
+        if row.get(field):
+            row[field] = base64.b64encode(row[field]).decode()
+    return row
+
+def _encode(row: Dict[str, Any]) -> bytes:
+    payload = json.dumps(_encode_json(row), default=str, separators=(",", ":")).encode()
+    return _LENGTH.pack(len(payload)) + payload
+
+def _decode(payload: bytes) -> Dict[str, Any]:
+    row = json.loads(payload)
+    for field in _UUID_FIELDS:
+        if row.get(field):
+            row[field] = uuid.UUID(row[field])
+    for field in _DATETIME_FIELDS:
+        if row.get(field):
+            row[field] = datetime.fromisoformat(row[field])
+    for field in _BYTES_FIELDS:
+        if row.get(field):
+            row[field] = base64.b64decode(row[field])
+    return row
+
+def _segment_number(name: str) -> Optional[int]:
+    if not (name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX)):
+        return None
+    try:
+        return int(name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)])
+    except ValueError:
+        return None
+
+class AuditJournal:
+    """
+    Journal local de solo-anexado para los eventos de auditoría que no se
+    pudieron escribir en la BD. Cada segmento es una secuencia de registros
+    <longitud><json>; append() hace un solo fsync por lote. Los segmentos se
+    rotan por tamaño y, una vez sellados, el replayer los vuelca a audit_logs
+    y los borra.
+
+    Con varios workers cada proceso usa su propio subdirectorio worker-N,
+    reservado con un flock que el sistema libera al morir el proceso; así un
+    worker nunca vuelca el segmento activo de otro. Al abrir, el journal
+    adopta los segmentos de todos los slots que no tienen dueño (workers
+    muertos, o el formato anterior sin slots) para volcarlos él mismo.
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int):
+        self.base_directory = os.path.join(_SERVER_DIR, directory)
+        self.directory: Optional[str] = None
+        self.segment_max_bytes = segment_max_bytes
+        self._lock = threading.Lock()
+        self._slot_lock = None
+        self._active = None
+        self._active_path: Optional[str] = None
+        self._active_size = 0
+        self._next_segment = 1
+        self.spilled = 0
+        self.replayed = 0
+        self.corrupt_records = 0
+        self.dead_lettered = 0
+        self.quarantined = 0
+        self.adopted = 0
+        self.rotations = 0
+        self.last_error: Optional[str] = None
+
+    def open(self) -> None:
+        """Reserva un slot y adopta los segmentos sin dueño; crea directorios y toma el flock"""
+        self.directory = self._claim_slot()
+        # También los números en cuarentena, para no reutilizarlos
+        existing = self._segment_numbers(include_quarantined=True)
+        self._next_segment = (existing[-1] + 1) if existing else 1
+        self._adopt_unowned_segments()
+
+    def close(self) -> None:
+        """Cierra el segmento activo y libera el slot"""
+        with self._lock:
+            if self._active is not None:
+                self._close_active_locked()
+            if self._slot_lock is not None:
+                self._slot_lock.close()
+                self._slot_lock = None
+
+    def _claim_slot(self) -> str:
+        """Reserva el primer subdirectorio worker-N libre y lo devuelve"""
+        os.makedirs(self.base_directory, exist_ok=True)
+        number = 0
+        while True:
+            slot = os.path.join(self.base_directory, f"{_SLOT_PREFIX}{number}")
+            os.makedirs(slot, exist_ok=True)
+            lock = self._try_lock_slot(slot)
+            if lock is None:
+                number += 1
+                continue
+            # El descriptor queda abierto hasta close() (o hasta que muera el proceso)
+            self._slot_lock = lock
+            return slot
+
+    @staticmethod
+    def _try_lock_slot(slot: str):
+        """Descriptor con el flock del slot, o None si otro proceso lo tiene"""
+        lock = open(os.path.join(slot, _SLOT_LOCK), "a")
+        if fcntl is None:
+            return lock
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return None
+        return lock
+
+    def _adopt_unowned_segments(self) -> None:
+        """
+        Mueve a este slot los segmentos sellados (y en cuarentena) de los slots
+        que se pueden bloquear, y los sueltos del directorio base; cada origen
+        en orden, renumerados después de los propios
+        """
+        sources = [self.base_directory]
+        for name in sorted(os.listdir(self.base_directory)):
+            path = os.path.join(self.base_directory, name)
+            if name.startswith(_SLOT_PREFIX) and os.path.isdir(path) and path != self.directory:
+                sources.append(path)
+
+        for source in sources:
+            lock = None
+            if source != self.base_directory:
+                lock = self._try_lock_slot(source)
+                if lock is None:
+                    # Slot de un worker vivo
+                    continue
+            try:
+                self._adopt_from(source)
+            finally:
+                if lock is not None:
+                    lock.close()
+
+    def _adopt_from(self, source: str) -> None:
+        segments = []
+        for name in os.listdir(source):
+            quarantined = name.endswith(_QUARANTINE_SUFFIX)
+            number = _segment_number(name[:-len(_QUARANTINE_SUFFIX)] if quarantined else name)
+            if number is not None:
+                segments.append((number, name, quarantined))
+
+        moved = 0
+        for _, name, quarantined in sorted(segments):
+            target = self._segment_path(self._next_segment) + (_QUARANTINE_SUFFIX if quarantined else "")
+            try:
+                os.replace(os.path.join(source, name), target)
+            except FileNotFoundError:
+                # Otro proceso adoptó el segmento suelto primero
+                continue
+            self._next_segment += 1
+            moved += 1
+            if not quarantined:
+                self.adopted += 1
+
+        # El dead-letter se mueve primero (atómico) para que dos procesos no lo copien ambos
+        adopted_dead_letter = os.path.join(self.directory, f"{_DEAD_LETTER_FILE}.adopted")
+        try:
+            os.replace(os.path.join(source, _DEAD_LETTER_FILE), adopted_dead_letter)
+        except FileNotFoundError:
+            pass
+        else:
+            with open(adopted_dead_letter, "rb") as adopted, open(os.path.join(self.directory, _DEAD_LETTER_FILE), "ab") as own:
+                own.write(adopted.read())
+                own.flush()
+                os.fsync(own.fileno())
+            os.remove(adopted_dead_letter)
+
+        if moved:
+            logger.warning(f"Journal de auditoría: {moved} segmentos de {source} adoptados en {self.directory}")
+
+    def append(self, rows: List[Dict[str, Any]]) -> None:
+        """Anexa el lote y lo fsyncea; bloqueante, llamar con asyncio.to_thread"""
+        data = b"".join(_encode(row) for row in rows)
+        with self._lock:
+            if self._active is None or self._active_size >= self.segment_max_bytes:
+                self._rotate_locked()
+            self._active.write(data)
+            self._active.flush()
+            os.fsync(self._active.fileno())
+            self._active_size += len(data)
+            self.spilled += len(rows)
+
+    def dead_letter(self, rows: List[Dict[str, Any]], error: str) -> None:
+        """Aparta filas que la BD no acepta; bloqueante, llamar con asyncio.to_thread"""
+        data = "".join(
+            json.dumps({"error": error, "row": _encode_json(row)}, default=str, separators=(",", ":")) + "\n"
+            for row in rows
+        ).encode()
+        with self._lock:
+            with open(os.path.join(self.directory, _DEAD_LETTER_FILE), "ab") as dead_letter:
+                dead_letter.write(data)
+                dead_letter.flush()
+                os.fsync(dead_letter.fileno())
+            self.dead_lettered += len(rows)
+
+    def has_pending(self) -> bool:
+        with self._lock:
+            return self._active_size > 0 or bool(self._sealed_segments_locked())
+
+    def seal(self) -> List[str]:
+        """Cierra el segmento activo y devuelve los segmentos sellados, en orden"""
+        with self._lock:
+            if self._active is not None and self._active_size > 0:
+                self._close_active_locked()
+            return self._sealed_segments_locked()
+
+    def read_segment(self, path: str) -> Iterator[Dict[str, Any]]:
+        with open(path, "rb") as segment:
+            while True:
+                header = segment.read(_LENGTH.size)
+                if not header:
+                    return
+                if len(header) < _LENGTH.size:
+                    self._record_corruption(path)
+                    return
+                (length,) = _LENGTH.unpack(header)
+                payload = segment.read(length)
+                if len(payload) < length:
+                    # Escritura incompleta (caída a mitad de un append): se descarta la cola
+                    self._record_corruption(path)
+                    return
+                try:
+                    yield _decode(payload)
+                except ValueError:
+                    self._record_corruption(path)
+
+    def remove_segment(self, path: str, replayed: int) -> None:
+        os.remove(path)
+        self.replayed += replayed
+
+    def quarantine(self, path: str) -> str:
+        """Aparta un segmento sellado que el replay no puede volcar; devuelve la nueva ruta"""
+        target = path + _QUARANTINE_SUFFIX
+        with self._lock:
+            os.replace(path, target)
+            self.quarantined += 1
+        return target
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            segments = self._sealed_segments_locked()
+            pending_bytes = sum(os.path.getsize(path) for path in segments) + self._active_size
+            return {
+                "directory": self.directory,
+                "pending_segments": len(segments) + (1 if self._active_size else 0),
+                "pending_bytes": pending_bytes,
+                "spilled": self.spilled,
+                "replayed": self.replayed,
+                "corrupt_records": self.corrupt_records,
+                "dead_lettered": self.dead_lettered,
+                "quarantined": self.quarantined,
+                "adopted": self.adopted,
+                "rotations": self.rotations,
+                "last_error": self.last_error,
+            }
+
+    def _record_corruption(self, path: str) -> None:
+        self.corrupt_records += 1
+        logger.warning(f"Registro incompleto o corrupto en el journal de auditoría: {path}")
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"{_SEGMENT_PREFIX}{number:010d}{_SEGMENT_SUFFIX}")
+
+    def _segment_numbers(self, include_quarantined: bool = False) -> List[int]:
+        numbers = []
+        for name in os.listdir(self.directory):
+            if include_quarantined and name.endswith(_QUARANTINE_SUFFIX):
+                name = name[:-len(_QUARANTINE_SUFFIX)]
+            number = _segment_number(name)
+            if number is not None:
+                numbers.append(number)
+        return sorted(numbers)
+
+    def _sealed_segments_locked(self) -> List[str]:
+        return [
+            path for path in (self._segment_path(n) for n in self._segment_numbers())
+            if path != self._active_path
+        ]
+
+    def _close_active_locked(self) -> None:
+        self._active.close()
+        self._active = None
+        self._active_path = None
+        self._active_size = 0
+
+    def _rotate_locked(self) -> None:
+        if self._active is not None:
+            self._close_active_locked()
+            self.rotations += 1
+        self._active_path = self._segment_path(self._next_segment)
+        self._next_segment += 1
+        self._active = open(self._active_path, "ab")
+        self._active_size = 0
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from ..database import async_engine
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "audit_logs"
+# Una partición por mes: audit_logs_2026_10 cubre [2026-10-01, 2026-11-01)
+_PARTITION_NAME = re.compile(rf"^{PARENT_TABLE}_(\d{{4}})_(\d{{2}})$")
+# Recibe las filas de meses sin partición para que el INSERT no falle
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_{month.year:04d}_{month.month:02d}"
+
+def list_partitions(conn: Connection) -> List[date]:
+    """Meses con partición creada, en orden"""
+    names = conn.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        WHERE parent.relname = :parent
+    """), {"parent": PARENT_TABLE}).scalars()
+
+    months = []
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+def create_partition(conn: Connection, month: date) -> str:
+    """
+    Crea la partición del mes. Si la DEFAULT ya tiene filas de ese mes, Postgres
+    rechazaría el CREATE ... PARTITION OF: se crea suelta, se mueven las filas
+    y se adjunta (el ATTACH agrega PK, índices y FK de audit_logs).
+    """
+    name = partition_name(month)
+    bounds = f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    in_month = f"created_at >= '{month.isoformat()}' AND created_at < '{add_months(month, 1).isoformat()}'"
+    if not conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_month})")).scalar():
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} FOR VALUES {bounds}"))
+        return name
+
+    conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_month} RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    )).rowcount
+    conn.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES {bounds}"))
+    logger.warning(f"{moved} eventos de auditoría movidos de {DEFAULT_PARTITION} a {name}")
+    return name
+
+def default_partition_months(conn: Connection) -> List[date]:
+    """Meses con filas en la partición DEFAULT (normalmente ninguno)"""
+    months = conn.execute(text(
+        f"SELECT DISTINCT date_trunc('month', created_at)::date FROM {DEFAULT_PARTITION}"
+    )).scalars()
+    return sorted(months)
+
+def ensure_partitions(conn: Connection, months_ahead: int, today: Optional[date] = None) -> List[str]:
+    """
+    Crea las particiones del mes actual y de los months_ahead siguientes que
+    falten, y las de los meses que hayan caído en la partición DEFAULT
+    """
+    existing = set(list_partitions(conn))
+    current = month_start(today or date.today())
+    months = {add_months(current, offset) for offset in range(months_ahead + 1)}
+    months.update(default_partition_months(conn))
+    return [create_partition(conn, month) for month in sorted(months - existing)]
+
+def drop_partitions_before(conn: Connection, cutoff: datetime) -> Dict[str, Any]:
+    """
+    Retención por particiones: desvincula y borra los meses que terminan antes
+    del corte. Solo toca el catálogo, así que el costo no depende de cuántas
+    filas haya; el mes que contiene al corte se conserva completo. En la misma
+    transacción recorta el rollup horario (y la DEFAULT) al mismo límite, para
+    que las estadísticas no cuenten eventos que ya no existen.
+    """
+    # DETACH toma un lock exclusivo breve sobre audit_logs; no esperar detrás de lecturas largas
+    conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+
+    dropped = []
+    estimated_rows = 0
+    for month in list_partitions(conn):
+        if datetime.combine(add_months(month, 1), datetime.min.time()) > cutoff:
+            break
+        name = partition_name(month)
+        # Estimación del planner en vez de count(*), que recorrería la partición
+        estimated_rows += conn.execute(
+            text("SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE relname = :name"),
+            {"name": name},
+        ).scalar() or 0
+        conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+        conn.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+        kept_from = add_months(month, 1)
+
+    deleted_stats_rows = 0
+    if dropped:
+        conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE created_at < :kept_from"), {"kept_from": kept_from})
+        deleted_stats_rows = conn.execute(
+            text("DELETE FROM audit_stats_hourly WHERE hour < :kept_from"), {"kept_from": kept_from}
+        ).rowcount
+
+    return {"dropped_partitions": dropped, "estimated_rows": estimated_rows, "deleted_stats_rows": deleted_stats_rows}
+
+def _maintain(conn: Connection, months_ahead: int, retention_days: int) -> None:
+    created = ensure_partitions(conn, months_ahead)
+    if created:
+        logger.info(f"Particiones de auditoría creadas: {', '.join(created)}")
+    if retention_days > 0:
+        result = drop_partitions_before(conn, datetime.now() - timedelta(days=retention_days))
+        if result["dropped_partitions"]:
+            logger.info(f"Particiones de auditoría eliminadas por retención: {', '.join(result['dropped_partitions'])}")
+
+async def maintain_partitions(months_ahead: int, retention_days: int) -> None:
+    async with async_engine.begin() as conn:
+        await conn.run_sync(_maintain, months_ahead, retention_days)
+
+async def maintain_partitions_periodically(interval: float, months_ahead: int, retention_days: int) -> None:
+    while True:
+        try:
+            await maintain_partitions(months_ahead, retention_days)
+        except Exception as e:
+            logger.warning(f"No se pudo mantener las particiones de audit_logs: {e!r}")
+        await asyncio.sleep(interval)
@@ -1,13 +1,34 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func, and_, or_
-from typing import List, Optional, Dict, Any, Tuple
+import csv
+import io
+import json
+
+from sqlalchemy.orm import Session, joinedload, contains_eager, undefer
+from sqlalchemy import desc, func, and_, or_, tuple_, select
+from typing import List, Optional, Dict, Any, Tuple, Iterable, Iterator
 from datetime import datetime, date, timedelta
 from uuid import UUID
 
 from ..models.audit_logs import AuditLog
 from ..models.users import User
+from ..config import settings
+from ..utils.pagination import encode_cursor, decode_cursor, estimate_count
+from ..utils.audit_severity import classify_severity
+from ..utils.audit_payload import decode_request_body
+from .audit_partitions import drop_partitions_before
+from .audit_stats import get_statistics, hourly_increments, rollup_upsert
 from ..schemas.audit_log import AuditLogCreate, AuditLogResponse, AuditLogListResponse, AuditLogStatsResponse
 
+# Filas por viaje al cursor del servidor (y por trozo del CSV)
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FIELDS = (
+    'id', 'timestamp', 'user_id', 'user_name', 'user_email', 'action', 'entity_type',
+    'entity_id', 'environment_id', 'center_id', 'old_values', 'new_values', 'method', 'path', 'status_code', 'duration_ms',
+    'severity', 'ip_address', 'user_agent', 'session_id', 'request_body'
+)
+
+ACTIVITY_GRANULARITIES = ('hour', 'day', 'week')
+
 class AuditService:
     """
     Servicio para gestión completa de logs de auditoría
@@ -31,10 +52,15 @@ class AuditService:
             new_values=audit_data.new_values,
             ip_address=ip_address or audit_data.ip_address,
             user_agent=user_agent or audit_data.user_agent,
-            session_id=audit_data.session_id
+            session_id=audit_data.session_id,
+            severity=classify_severity(audit_data.action)
         )
         
         db.add(audit_log)
+        db.flush()
+        db.execute(rollup_upsert(), hourly_increments(
+            [(audit_log.created_at, audit_log.action, audit_log.user_id, audit_log.severity)]
+        ))
         db.commit()
         db.refresh(audit_log)
         return audit_log
@@ -44,15 +70,25 @@ class AuditService:
         db: Session,
         page: int = 1,
         per_page: int = 20,
-        filters: Optional[Dict[str, Any]] = None
-    ) -> Tuple[List[AuditLog], int]:
-        """Obtener logs de auditoría con paginación y filtros"""
-        query = db.query(AuditLog).join(User, AuditLog.user_id == User.id, isouter=True)
+        filters: Optional[Dict[str, Any]] = None,
+        cursor: Optional[str] = None,
+        include_total: bool = True
+    ) -> Tuple[List[AuditLog], Optional[int], bool, Optional[str]]:
+        """
+        Obtener logs de auditoría paginados por keyset sobre (created_at, id).
+        Devuelve (logs, total, total_estimado, siguiente_cursor). Sin cursor se
+        mantiene la paginación por página (OFFSET) para clientes anteriores.
+        Con search el resultado es rankeado y acotado (ver _search_audit_logs).
+        """
+        query = db.query(AuditLog)
         
         # Aplicar filtros
         if filters:
             if filters.get('action'):
-                query = query.filter(AuditLog.action.ilike(f"%{filters['action']}%"))
+                query = query.filter(AuditLog.action == filters['action'])
+            
+            if filters.get('action_contains'):
+                query = query.filter(AuditLog.action.ilike(f"%{filters['action_contains']}%"))
             
             if filters.get('user_id'):
                 query = query.filter(AuditLog.user_id == filters['user_id'])
@@ -60,186 +96,191 @@ class AuditService:
             if filters.get('entity_type'):
                 query = query.filter(AuditLog.entity_type == filters['entity_type'])
             
+            if filters.get('environment_id'):
+                query = query.filter(AuditLog.environment_id == filters['environment_id'])
+            
+            if filters.get('center_id'):
+                query = query.filter(AuditLog.center_id == filters['center_id'])
+            
             if filters.get('start_date'):
                 query = query.filter(AuditLog.created_at >= filters['start_date'])
             
             if filters.get('end_date'):
-                end_datetime = datetime.combine(filters['end_date'], datetime.max.time())
-                query = query.filter(AuditLog.created_at <= end_datetime)
+                query = query.filter(AuditLog.created_at < filters['end_date'] + timedelta(days=1))
             
             if filters.get('search'):
                 search_term = f"%{filters['search']}%"
+                # Usuarios resueltos aparte (tabla chica, índices de trigramas) y
+                # filtrados por user_id, sin JOIN contra todo el historial
+                matching_users = select(User.id).where(
+                    or_(User.full_name.ilike(search_term), User.email.ilike(search_term))
+                )
                 query = query.filter(
                     or_(
                         AuditLog.action.ilike(search_term),
                         AuditLog.entity_type.ilike(search_term),
-                        func.concat(User.first_name, ' ', User.last_name).ilike(search_term),
-                        User.email.ilike(search_term)
+                        AuditLog.user_id.in_(matching_users)
                     )
                 )
+                return AuditService._search_audit_logs(db, query, filters['search'], page, per_page)
         
-        # Contar total
-        total = query.count()
+        # Total opcional: exacto si el planner estima pocas filas, si no la estimación
+        total = None
+        total_is_estimate = False
+        if include_total:
+            total = estimate_count(query)
+            if total <= settings.AUDIT_EXACT_COUNT_THRESHOLD:
+                total = query.order_by(None).count()
+            else:
+                total_is_estimate = True
         
-        # Aplicar paginación
-        logs = query.order_by(desc(AuditLog.created_at)).offset((page - 1) * per_page).limit(per_page).all()
+        page_query = query.options(joinedload(AuditLog.user)).order_by(
+            desc(AuditLog.created_at), desc(AuditLog.id)
+        )
+        if cursor:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+            page_query = page_query.filter(
+                tuple_(AuditLog.created_at, AuditLog.id) < tuple_(cursor_created_at, cursor_id)
+            )
+        elif page > 1:
+            page_query = page_query.offset((page - 1) * per_page)
+        
+        # Una fila extra indica si hay página siguiente
+        logs = page_query.limit(per_page + 1).all()
+        next_cursor = None
+        if len(logs) > per_page:
+            logs = logs[:per_page]
+            next_cursor = encode_cursor(logs[-1].created_at, logs[-1].id)
         
-        return logs, total
+        return logs, total, total_is_estimate, next_cursor
     
     @staticmethod
-    def get_audit_statistics(
+    def _search_audit_logs(
         db: Session,
-        days: int = 30,
-        user_id: Optional[UUID] = None
-    ) -> Dict[str, Any]:
-        """Obtener estadísticas de auditoría"""
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days)
-        
-        base_query = db.query(AuditLog).filter(AuditLog.created_at >= start_date)
-        
-        if user_id:
-            base_query = base_query.filter(AuditLog.user_id == user_id)
+        query,
+        term: str,
+        page: int,
+        per_page: int
+    ) -> Tuple[List[AuditLog], Optional[int], bool, Optional[str]]:
+        """
+        Búsqueda rankeada: toma las AUDIT_SEARCH_MAX_RESULTS coincidencias más
+        recientes, las ordena por relevancia (word_similarity de pg_trgm) y pagina
+        por página dentro de ese conjunto acotado. El costo no crece con el historial.
+        """
+        limit = settings.AUDIT_SEARCH_MAX_RESULTS
+        candidates = query.with_entities(
+            AuditLog.id, AuditLog.created_at, AuditLog.action, AuditLog.entity_type, AuditLog.user_id
+        ).order_by(
+            desc(AuditLog.created_at), desc(AuditLog.id)
+        ).limit(limit).subquery()
         
-        # Estadísticas básicas
-        total_logs = base_query.count()
-        today_logs = base_query.filter(func.date(AuditLog.created_at) == date.today()).count()
+        rank = func.greatest(
+            func.word_similarity(term, candidates.c.action),
+            func.word_similarity(term, candidates.c.entity_type),
+            func.coalesce(func.word_similarity(term, User.full_name), 0),
+            func.coalesce(func.word_similarity(term, User.email), 0)
+        ).label('rank')
+        ranked = db.query(candidates.c.id, candidates.c.created_at, rank).outerjoin(
+            User, User.id == candidates.c.user_id
+        ).order_by(
+            desc('rank'), desc(candidates.c.created_at), desc(candidates.c.id)
+        ).offset((page - 1) * per_page).limit(per_page).all()
         
-        # Clasificación por severidad (basada en tipo de acción)
-        warning_actions = ['delete', 'update', 'modify', 'change', 'remove']
-        error_actions = ['error', 'fail', 'exception', 'reject']
-        success_actions = ['create', 'login', 'approve', 'complete', 'success']
+        total = db.query(func.count()).select_from(candidates).scalar()
         
-        warning_logs = base_query.filter(
-            func.lower(AuditLog.action).op('~')(f"({'|'.join(warning_actions)})")
-        ).count()
-        
-        error_logs = base_query.filter(
-            func.lower(AuditLog.action).op('~')(f"({'|'.join(error_actions)})")
-        ).count()
-        
-        success_logs = base_query.filter(
-            func.lower(AuditLog.action).op('~')(f"({'|'.join(success_actions)})")
-        ).count()
-        
-        info_logs = total_logs - warning_logs - error_logs - success_logs
-        
-        # Top acciones
-        top_actions = db.query(
-            AuditLog.action,
-            func.count(AuditLog.id).label('count')
-        ).filter(
-            AuditLog.created_at >= start_date
-        ).group_by(AuditLog.action).order_by(desc('count')).limit(10).all()
-        
-        # Top usuarios
-        top_users = db.query(
-            User.first_name,
-            User.last_name,
-            User.email,
-            func.count(AuditLog.id).label('count')
-        ).join(
-            AuditLog, User.id == AuditLog.user_id
-        ).filter(
-            AuditLog.created_at >= start_date
-        ).group_by(
-            User.id, User.first_name, User.last_name, User.email
-        ).order_by(desc('count')).limit(10).all()
-        
-        # Actividad por día
-        daily_activity = db.query(
-            func.date(AuditLog.created_at).label('date'),
-            func.count(AuditLog.id).label('count')
-        ).filter(
-            AuditLog.created_at >= start_date
-        ).group_by(func.date(AuditLog.created_at)).order_by('date').all()
-        
-        # Actividad por hora (últimas 24 horas)
-        last_24h = datetime.now() - timedelta(hours=24)
-        hourly_activity = db.query(
-            func.extract('hour', AuditLog.created_at).label('hour'),
-            func.count(AuditLog.id).label('count')
-        ).filter(
-            AuditLog.created_at >= last_24h
-        ).group_by(func.extract('hour', AuditLog.created_at)).order_by('hour').all()
+        if not ranked:
+            return [], total, total >= limit, None
         
-        return {
-            'total_logs': total_logs,
-            'today_logs': today_logs,
-            'warning_logs': warning_logs,
-            'error_logs': error_logs,
-            'info_logs': info_logs,
-            'success_logs': success_logs,
-            'top_actions': [{'action': action, 'count': count} for action, count in top_actions],
-            'top_users': [
-                {
-                    'name': f"{first_name} {last_name}",
-                    'email': email,
-                    'count': count
-                }
-                for first_name, last_name, email, count in top_users
-            ],
-            'daily_activity': [
-                {
-                    'date': date_val.isoformat() if date_val else None,
-                    'count': count
-                }
-                for date_val, count in daily_activity
-            ],
-            'hourly_activity': [
-                {
-                    'hour': int(hour) if hour else 0,
-                    'count': count
-                }
-                for hour, count in hourly_activity
-            ]
+        logs_by_key = {
+            (log.id, log.created_at): log
+            for log in db.query(AuditLog).options(joinedload(AuditLog.user)).filter(
+                tuple_(AuditLog.id, AuditLog.created_at).in_([(row.id, row.created_at) for row in ranked])
+            )
         }
+        logs = []
+        for row in ranked:
+            log = logs_by_key.get((row.id, row.created_at))
+            if log is not None:
+                log.search_rank = round(float(row.rank), 4)
+                logs.append(log)
+        
+        # Con el tope alcanzado el total es "al menos"; sin cursor, se pagina por página
+        return logs, total, total >= limit, None
+    
+    @staticmethod
+    def get_audit_statistics(
+        db: Session,
+        days: int = 30,
+        user_id: Optional[UUID] = None
+    ) -> Dict[str, Any]:
+        """Obtener estadísticas de auditoría (desde el rollup audit_stats_hourly)"""
+        return get_statistics(db, days=days, user_id=user_id)
     
     @staticmethod
     def get_user_activity(
         db: Session,
         user_id: UUID,
-        days: int = 30
+        days: int = 30,
+        granularity: str = 'day'
     ) -> Dict[str, Any]:
-        """Obtener actividad específica de un usuario"""
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days)
+        """
+        Obtener actividad específica de un usuario. Todo se agrega en SQL sobre
+        el índice (user_id, created_at, id); solo viajan los conteos y 10 filas.
+        granularity agrupa la actividad por 'hour', 'day' o 'week'.
+        """
+        if granularity not in ACTIVITY_GRANULARITIES:
+            raise ValueError(f"Granularidad no soportada: {granularity}")
         
-        user_logs = db.query(AuditLog).filter(
-            and_(
-                AuditLog.user_id == user_id,
-                AuditLog.created_at >= start_date
-            )
-        ).order_by(desc(AuditLog.created_at)).all()
+        start_date = datetime.now() - timedelta(days=days)
+        user_filter = and_(
+            AuditLog.user_id == user_id,
+            AuditLog.created_at >= start_date
+        )
         
         # Estadísticas del usuario
-        total_actions = len(user_logs)
-        unique_actions = len(set(log.action for log in user_logs))
-        unique_entities = len(set(log.entity_type for log in user_logs))
+        total_actions, unique_actions, unique_entities = db.query(
+            func.count(),
+            func.count(func.distinct(AuditLog.action)),
+            func.count(func.distinct(AuditLog.entity_type))
+        ).filter(user_filter).one()
         
         # Acciones más frecuentes
-        action_counts = {}
-        for log in user_logs:
-            action_counts[log.action] = action_counts.get(log.action, 0) + 1
+        top_actions = db.query(
+            AuditLog.action,
+            func.count().label('count')
+        ).filter(user_filter).group_by(AuditLog.action).order_by(desc('count')).limit(5).all()
         
-        top_actions = sorted(action_counts.items(), key=lambda x: x[1], reverse=True)[:5]
+        # Actividad por intervalo
+        bucket = func.date_trunc(granularity, AuditLog.created_at).label('bucket')
+        activity = db.query(
+            bucket,
+            func.count().label('count')
+        ).filter(user_filter).group_by(bucket).order_by(bucket).all()
         
-        # Actividad por día
-        daily_counts = {}
-        for log in user_logs:
-            day = log.created_at.date()
-            daily_counts[day] = daily_counts.get(day, 0) + 1
+        recent_logs = db.query(
+            AuditLog.id,
+            AuditLog.action,
+            AuditLog.entity_type,
+            AuditLog.created_at,
+            AuditLog.ip_address
+        ).filter(user_filter).order_by(desc(AuditLog.created_at), desc(AuditLog.id)).limit(10).all()
+        
+        activity_data = [
+            {
+                'date': bucket_start.date().isoformat() if granularity == 'day' else bucket_start.isoformat(),
+                'count': count
+            }
+            for bucket_start, count in activity
+        ]
         
-        return {
+        result = {
             'user_id': str(user_id),
             'total_actions': total_actions,
             'unique_actions': unique_actions,
             'unique_entities': unique_entities,
             'top_actions': [{'action': action, 'count': count} for action, count in top_actions],
-            'daily_activity': [
-                {'date': day.isoformat(), 'count': count}
-                for day, count in sorted(daily_counts.items())
-            ],
+            'granularity': granularity,
+            'activity': activity_data,
             'recent_logs': [
                 {
                     'id': str(log.id),
@@ -248,9 +289,13 @@ class AuditService:
                     'created_at': log.created_at.isoformat(),
                     'ip_address': log.ip_address
                 }
-                for log in user_logs[:10]
+                for log in recent_logs
             ]
         }
+        if granularity == 'day':
+            # Clave anterior, para los clientes que ya la leen
+            result['daily_activity'] = activity_data
+        return result
     
     @staticmethod
     def get_entity_audit_trail(
@@ -270,37 +315,43 @@ class AuditService:
     def cleanup_old_logs(
         db: Session,
         days_to_keep: int = 90
-    ) -> int:
-        """Limpiar logs antiguos para mantener el rendimiento"""
+    ) -> Dict[str, Any]:
+        """Eliminar las particiones mensuales que quedaron fuera de la retención"""
         cutoff_date = datetime.now() - timedelta(days=days_to_keep)
         
-        deleted_count = db.query(AuditLog).filter(
-            AuditLog.created_at < cutoff_date
-        ).delete()
+        # DETACH + DROP de particiones completas en vez de un DELETE fila por fila
+        result = drop_partitions_before(db.connection(), cutoff_date)
         
         db.commit()
-        return deleted_count
+        return result
     
     @staticmethod
     def export_audit_logs(
         db: Session,
         start_date: date,
-        end_date: date,
-        format: str = 'json'
-    ) -> List[Dict[str, Any]]:
-        """Exportar logs de auditoría para reportes externos"""
-        logs = db.query(AuditLog).join(
-            User, AuditLog.user_id == User.id, isouter=True
+        end_date: date
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Exportar logs de auditoría para reportes externos, fila por fila.
+        Usa un cursor del lado del servidor (yield_per) con el usuario en el
+        mismo JOIN, así la memoria no depende del tamaño del rango.
+        """
+        logs = db.query(AuditLog).outerjoin(
+            User, AuditLog.user_id == User.id
+        ).options(
+            contains_eager(AuditLog.user),
+            undefer(AuditLog.request_body)
         ).filter(
             and_(
                 AuditLog.created_at >= start_date,
-                AuditLog.created_at <= datetime.combine(end_date, datetime.max.time())
+                AuditLog.created_at < end_date + timedelta(days=1)
             )
-        ).order_by(desc(AuditLog.created_at)).all()
+        ).order_by(
+            desc(AuditLog.created_at), desc(AuditLog.id)
+        ).execution_options(yield_per=EXPORT_BATCH_SIZE)
         
-        exported_logs = []
         for log in logs:
-            log_data = {
+            yield {
                 'id': str(log.id),
                 'timestamp': log.created_at.isoformat(),
                 'user_id': str(log.user_id) if log.user_id else None,
@@ -309,12 +360,49 @@ class AuditService:
                 'action': log.action,
                 'entity_type': log.entity_type,
                 'entity_id': str(log.entity_id) if log.entity_id else None,
+                'environment_id': str(log.environment_id) if log.environment_id else None,
+                'center_id': str(log.center_id) if log.center_id else None,
                 'old_values': log.old_values,
                 'new_values': log.new_values,
+                'method': log.method,
+                'path': log.path,
+                'status_code': log.status_code,
+                'duration_ms': log.duration_ms,
+                'severity': log.severity,
                 'ip_address': log.ip_address,
                 'user_agent': log.user_agent,
-                'session_id': log.session_id
+                'session_id': log.session_id,
+                'request_body': decode_request_body(log.request_body)
             }
-            exported_logs.append(log_data)
+    
+    @staticmethod
+    def encode_export(rows: Iterable[Dict[str, Any]], format: str = 'json') -> Iterator[str]:
+        """Serializa la exportación en trozos: json (arreglo), ndjson o csv"""
+        if format == 'ndjson':
+            for row in rows:
+                yield json.dumps(row, default=str, ensure_ascii=False) + "\n"
+            return
+        
+        if format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_FIELDS)
+            for count, row in enumerate(rows, start=1):
+                writer.writerow([
+                    json.dumps(row[field], default=str, ensure_ascii=False) if isinstance(row[field], (dict, list)) else row[field]
+                    for field in EXPORT_FIELDS
+                ])
+                if count % EXPORT_BATCH_SIZE == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+            return
         
-        return exported_logs
+        # json: mismo arreglo que antes, pero emitido elemento por elemento
+        yield "["
+        separator = ""
+        for row in rows:
+            yield separator + json.dumps(row, default=str, ensure_ascii=False)
+            separator = ","
+        yield "]"
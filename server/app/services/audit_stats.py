@@ -0,0 +1,87 @@
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from ..utils.audit_severity import classify_action_severity
+from ..models.audit_stats_hourly import AuditStatsHourly, ANONYMOUS_USER_KEY
+
+def truncate_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+def hourly_increments(rows: Iterable) -> List[Dict[str, Any]]:
+    """Agrupa filas (created_at, action, user_id, severity) en incrementos del rollup"""
+    counts: Counter = Counter()
+    for created_at, action, user_id, severity in rows:
+        counts[(truncate_hour(created_at), action, user_id, severity or classify_action_severity(action))] += 1
+    # Orden fijo de claves: dos writers que tocan las mismas filas las bloquean
+    # en el mismo orden y no se interbloquean
+    keys = sorted(counts, key=lambda key: (key[0], key[1], str(key[2]), key[3]))
+    return [
+        {"hour": hour, "action": action, "user_id": user_id, "severity": severity, "count": counts[(hour, action, user_id, severity)]}
+        for hour, action, user_id, severity in keys
+    ]
+
+def rollup_upsert():
+    """INSERT ... ON CONFLICT que suma los incrementos a audit_stats_hourly"""
+    table = AuditStatsHourly.__table__
+    statement = pg_insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.hour, table.c.action, table.c.severity, ANONYMOUS_USER_KEY],
+        set_={"count": table.c.count + statement.excluded.count},
+    )
+
+# Una sola lectura del rollup (la CTE se materializa una vez) para todo el panel
+STATISTICS_SQL = text("""
+    WITH window_stats AS MATERIALIZED (
+        SELECT hour, action, user_id, severity, count
+        FROM audit_stats_hourly
+        WHERE hour >= :start AND (CAST(:user_id AS uuid) IS NULL OR user_id = CAST(:user_id AS uuid))
+    )
+    SELECT
+        (SELECT COALESCE(sum(count), 0) FROM window_stats) AS total_logs,
+        (SELECT COALESCE(sum(count), 0) FROM window_stats WHERE hour >= :today) AS today_logs,
+        (SELECT COALESCE(json_object_agg(severity, total), '{}')
+            FROM (SELECT severity, sum(count) AS total FROM window_stats GROUP BY severity) s) AS severities,
+        (SELECT COALESCE(json_agg(t), '[]')
+            FROM (SELECT action, sum(count) AS count FROM window_stats
+                  GROUP BY action ORDER BY count DESC LIMIT 10) t) AS top_actions,
+        (SELECT COALESCE(json_agg(t), '[]')
+            FROM (SELECT u.first_name || ' ' || u.last_name AS name, u.email, sum(w.count) AS count
+                  FROM window_stats w JOIN users u ON u.id = w.user_id
+                  GROUP BY u.id, u.first_name, u.last_name, u.email ORDER BY count DESC LIMIT 10) t) AS top_users,
+        (SELECT COALESCE(json_agg(t ORDER BY t.date), '[]')
+            FROM (SELECT to_char(hour, 'YYYY-MM-DD') AS date, sum(count) AS count FROM window_stats
+                  GROUP BY 1) t) AS daily_activity,
+        (SELECT COALESCE(json_agg(t ORDER BY t.hour), '[]')
+            FROM (SELECT extract(hour FROM hour)::int AS hour, sum(count) AS count FROM window_stats
+                  WHERE hour >= :last_24h GROUP BY 1) t) AS hourly_activity
+""")
+
+def get_statistics(db: Session, days: int, user_id: Optional[UUID] = None) -> Dict[str, Any]:
+    """Estadísticas del panel de auditoría desde el rollup por hora"""
+    now = datetime.now()
+    row = db.execute(STATISTICS_SQL, {
+        "start": truncate_hour(now - timedelta(days=days)),
+        "today": datetime.combine(date.today(), datetime.min.time()),
+        "last_24h": truncate_hour(now - timedelta(hours=24)),
+        "user_id": str(user_id) if user_id else None,
+    }).mappings().one()
+
+    severities = {severity: int(count) for severity, count in row["severities"].items()}
+    return {
+        'total_logs': int(row["total_logs"]),
+        'today_logs': int(row["today_logs"]),
+        'warning_logs': severities.get("warning", 0),
+        'error_logs': severities.get("error", 0),
+        'info_logs': severities.get("info", 0),
+        'success_logs': severities.get("success", 0),
+        'top_actions': [{'action': t["action"], 'count': int(t["count"])} for t in row["top_actions"]],
+        'top_users': [{'name': t["name"], 'email': t["email"], 'count': int(t["count"])} for t in row["top_users"]],
+        'daily_activity': [{'date': t["date"], 'count': int(t["count"])} for t in row["daily_activity"]],
+        'hourly_activity': [{'hour': t["hour"], 'count': int(t["count"])} for t in row["hourly_activity"]],
+    }
@@ -0,0 +1,358 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import String, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError, InterfaceError, OperationalError
+
+from ..config import settings
+from ..database import async_engine
+from ..models.audit_logs import AuditLog
+from ..models.environments import Environment
+from ..utils.audit_severity import classify_severity
+from .audit_journal import AuditJournal
+from .audit_stats import hourly_increments, rollup_upsert
+
+logger = logging.getLogger(__name__)
+
+# Columnas String(n) de audit_logs; un valor más largo haría fallar todo el INSERT multi-fila
+_BOUNDED_COLUMNS = {
+    column.name: column.type.length
+    for column in AuditLog.__table__.columns
+    if isinstance(column.type, String) and column.type.length
+}
+
+# Errores por el contenido de una fila (no por la BD): se aíslan fila por fila
+_ROW_ERRORS = (DataError, IntegrityError)
+
+def _is_outage(error: Exception) -> bool:
+    """La BD no está disponible (conexión o timeout), a diferencia de un error por los datos"""
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+    return isinstance(error, (OperationalError, InterfaceError, asyncio.TimeoutError, OSError))
+
+def clamp_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Recorta los campos de texto al ancho de su columna (varios vienen de headers del cliente)"""
+    for name, length in _BOUNDED_COLUMNS.items():
+        value = row.get(name)
+        if isinstance(value, str) and len(value) > length:
+            row[name] = value[:length]
+    return row
+
+class AuditLogWriter:
+    """
+    Cola en proceso para los logs de auditoría. Un flusher en segundo plano
+    agrupa las filas y las inserta con un INSERT multi-fila por lote (por
+    tamaño o por ventana de tiempo), en vez de una transacción por request.
+
+    Si la BD falla o tarda más de write_timeout, el lote va al journal local y
+    el writer pasa a modo degradado: los lotes siguientes van directo al journal
+    (sin esperar a una BD enferma) hasta que el replayer lo vacía. Si la cola
+    está llena, submit() espera hasta enqueue_timeout y luego también usa el
+    journal; solo se descarta si el journal falla.
+
+    Una fila que la BD rechaza por su contenido (DataError/IntegrityError) no
+    es una caída: el lote se reintenta fila por fila y las rechazadas van al
+    dead-letter del journal, sin pasar a modo degradado. Solo los errores de
+    conexión o timeout activan el journal; un segmento que falla por otra causa
+    en max_replay_attempts replays seguidos se pone en cuarentena.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        flush_interval: float,
+        max_queue: int,
+        enqueue_timeout: float,
+        journal_dir: str,
+        journal_segment_bytes: int,
+        write_timeout: float,
+        replay_interval: float,
+        max_replay_attempts: int,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.enqueue_timeout = enqueue_timeout
+        self.journal_dir = journal_dir
+        self.journal_segment_bytes = journal_segment_bytes
+        # Se abre en start(): reservar el slot (flock) y adoptar segmentos es cosa
+        # del proceso que corre el writer, no de cualquiera que importe el módulo
+        self.journal: Optional[AuditJournal] = None
+        self.write_timeout = write_timeout
+        self.replay_interval = replay_interval
+        self.max_replay_attempts = max_replay_attempts
+        self._replay_failures: Dict[str, int] = {}
+        self.degraded = False
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._replay_task: Optional[asyncio.Task] = None
+        self._last_drop_warning = 0.0
+        # ambiente -> centro, para completar center_id sin consultar por evento
+        self._environment_centers: Dict[Any, Any] = {}
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.spilled = 0
+        self.failed = 0
+        self.dead_lettered = 0
+        self.batches = 0
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self.journal = AuditJournal(self.journal_dir, self.journal_segment_bytes)
+        self.journal.open()
+        self.degraded = self.journal.has_pending()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+        self._replay_task = asyncio.create_task(self._replay_periodically())
+
+    async def stop(self) -> None:
+        """Detiene el flusher y el replayer y escribe (o manda al journal) lo que quede en la cola"""
+        if self._task is None:
+            return
+        for task in (self._task, self._replay_task):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._replay_task = None
+
+        while not self._queue.empty():
+            await self._write_batch(self._take_batch([]))
+        # Sin cola, submit() descarta en vez de escribir a un journal cerrado
+        self._queue = None
+        # Libera el slot; lo que quede sellado lo adopta el próximo proceso
+        self.journal.close()
+
+    async def submit(self, row: Dict[str, Any]) -> bool:
+        clamp_row(row)
+        if self._queue is None:
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            # Backpressure: el request ya respondió, así que esperar un poco es barato
+            try:
+                await asyncio.wait_for(self._queue.put(row), timeout=self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                if await self._spill([row]):
+                    return True
+                self._record_drop()
+                return False
+        self.enqueued += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "spilled": self.spilled,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "dead_lettered": self.dead_lettered,
+            "batches": self.batches,
+            "degraded": self.degraded,
+            "journal": self.journal.stats() if self.journal is not None else None,
+        }
+
+    def _record_drop(self) -> None:
+        self.dropped += 1
+        now = time.monotonic()
+        if now - self._last_drop_warning >= 10:
+            self._last_drop_warning = now
+            logger.warning(f"Cola de auditoría llena ({self.max_queue}); {self.dropped} eventos descartados en total")
+
+    def _take_batch(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                self._take_batch(batch)
+                remaining = deadline - loop.time()
+                if len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._write_batch(batch)
+
+    async def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        if not batch:
+            return
+        if self.degraded:
+            # Hay eventos pendientes en el journal: mantener el orden y no esperar a la BD
+            await self._spill(batch)
+            return
+        try:
+            self.written += await self._write_rows(batch)
+            self.batches += 1
+        except Exception as e:
+            if not _is_outage(e):
+                # No es una caída: reintentarlo desde el journal fallaría igual
+                await self._dead_letter(batch, e)
+                return
+            logger.warning(f"No se pudo escribir un lote de {len(batch)} logs de auditoría, se envía al journal: {e!r}")
+            self.journal.last_error = repr(e)
+            self.degraded = True
+            await self._spill(batch)
+
+    async def _write_rows(self, rows: List[Dict[str, Any]]) -> int:
+        """
+        Inserta el lote en una transacción. Si la BD rechaza alguna fila por su
+        contenido, reintenta fila por fila y manda las rechazadas al dead-letter.
+        Los demás errores (conexión, timeout) se propagan. Devuelve las filas escritas.
+        """
+        try:
+            await asyncio.wait_for(self._insert(rows), timeout=self.write_timeout)
+            return len(rows)
+        except _ROW_ERRORS as e:
+            if len(rows) == 1:
+                await self._dead_letter(rows, e)
+                return 0
+
+        written = 0
+        for row in rows:
+            try:
+                await asyncio.wait_for(self._insert([row]), timeout=self.write_timeout)
+                written += 1
+            except _ROW_ERRORS as e:
+                await self._dead_letter([row], e)
+        return written
+
+    async def _dead_letter(self, rows: List[Dict[str, Any]], error: Exception) -> None:
+        logger.error(f"La BD rechazó {len(rows)} logs de auditoría, se apartan al dead-letter: {error!r}")
+        try:
+            await asyncio.to_thread(self.journal.dead_letter, rows, repr(error))
+            self.dead_lettered += len(rows)
+        except Exception as e:
+            self.failed += len(rows)
+            logger.error(f"No se pudo escribir {len(rows)} logs de auditoría en el dead-letter: {e!r}")
+
+    async def _insert(self, batch: List[Dict[str, Any]]) -> None:
+        for row in batch:
+            # Filas del journal escritas antes de que existieran las columnas
+            if "severity" not in row:
+                row["severity"] = classify_severity(row["action"], row.get("status_code"))
+            row.setdefault("environment_id", None)
+            row.setdefault("center_id", None)
+
+        # ON CONFLICT DO NOTHING: un lote que expiró por timeout pudo haber
+        # quedado escrito, y el replay puede reintentar un segmento a medias.
+        # RETURNING devuelve solo las filas realmente insertadas, así el rollup
+        # por hora se actualiza en la misma transacción sin contar duplicados
+        statement = pg_insert(AuditLog.__table__).on_conflict_do_nothing(
+            index_elements=["id", "created_at"]
+        ).returning(AuditLog.created_at, AuditLog.action, AuditLog.user_id, AuditLog.severity)
+        async with async_engine.begin() as conn:
+            await self._fill_center_ids(conn, batch)
+            # executemany de SQLAlchemy 2.0 se traduce en INSERT ... VALUES multi-fila
+            inserted = (await conn.execute(statement, batch)).all()
+            increments = hourly_increments(inserted)
+            if increments:
+                await conn.execute(rollup_upsert(), increments)
+
+    async def _fill_center_ids(self, conn, batch: List[Dict[str, Any]]) -> None:
+        """Completa center_id desde environment_id; los ambientes no cambian de centro"""
+        missing = {
+            row["environment_id"] for row in batch
+            if row["environment_id"] and not row["center_id"] and row["environment_id"] not in self._environment_centers
+        }
+        if missing:
+            result = await conn.execute(
+                select(Environment.id, Environment.center_id).where(Environment.id.in_(missing))
+            )
+            found = dict(result.all())
+            # Los ambientes inexistentes también se recuerdan, para no consultarlos en cada lote
+            self._environment_centers.update({environment_id: found.get(environment_id) for environment_id in missing})
+        for row in batch:
+            if row["environment_id"] and not row["center_id"]:
+                row["center_id"] = self._environment_centers.get(row["environment_id"])
+
+    async def _spill(self, batch: List[Dict[str, Any]]) -> bool:
+        try:
+            await asyncio.to_thread(self.journal.append, batch)
+            self.spilled += len(batch)
+            return True
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"No se pudo escribir {len(batch)} logs de auditoría en el journal: {e!r}")
+            return False
+
+    async def replay(self) -> int:
+        """Vuelca los segmentos sellados del journal a audit_logs; devuelve las filas escritas"""
+        replayed = 0
+        failed = set()
+        try:
+            while True:
+                segments = [path for path in await asyncio.to_thread(self.journal.seal) if path not in failed]
+                if not segments:
+                    break
+                for path in segments:
+                    try:
+                        replayed += await self._replay_segment(path)
+                    except Exception as e:
+                        if _is_outage(e):
+                            raise
+                        failed.add(path)
+                        self._record_replay_failure(path, e)
+            # Un segmento que falló y aún no está en cuarentena se reintenta en la siguiente pasada
+            self.degraded = bool(failed) and self.journal.has_pending()
+            if replayed:
+                logger.info(f"Journal de auditoría vaciado: {replayed} eventos escritos en la BD")
+        except Exception as e:
+            self.journal.last_error = repr(e)
+            logger.warning(f"La BD sigue sin aceptar el journal de auditoría: {e!r}")
+        return replayed
+
+    async def _replay_segment(self, path: str) -> int:
+        rows = await asyncio.to_thread(lambda: list(self.journal.read_segment(path)))
+        for start in range(0, len(rows), self.batch_size):
+            await self._write_rows(rows[start:start + self.batch_size])
+        self.journal.remove_segment(path, len(rows))
+        self._replay_failures.pop(path, None)
+        return len(rows)
+
+    def _record_replay_failure(self, path: str, error: Exception) -> None:
+        attempts = self._replay_failures.get(path, 0) + 1
+        self.journal.last_error = repr(error)
+        if attempts < self.max_replay_attempts:
+            self._replay_failures[path] = attempts
+            logger.warning(f"No se pudo volcar el segmento {path} (intento {attempts}): {error!r}")
+            return
+        self._replay_failures.pop(path, None)
+        quarantined = self.journal.quarantine(path)
+        logger.error(f"Segmento {path} en cuarentena tras {attempts} intentos fallidos ({quarantined}): {error!r}")
+
+    async def _replay_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.replay_interval)
+            if self.degraded or self.journal.has_pending():
+                await self.replay()
+
+audit_writer = AuditLogWriter(
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+    max_queue=settings.AUDIT_QUEUE_SIZE,
+    enqueue_timeout=settings.AUDIT_ENQUEUE_TIMEOUT,
+    journal_dir=settings.AUDIT_JOURNAL_DIR,
+    journal_segment_bytes=settings.AUDIT_JOURNAL_SEGMENT_BYTES,
+    write_timeout=settings.AUDIT_WRITE_TIMEOUT,
+    replay_interval=settings.AUDIT_JOURNAL_REPLAY_INTERVAL,
+    max_replay_attempts=settings.AUDIT_JOURNAL_MAX_REPLAY_ATTEMPTS,
+)
@@ -1,41 +1,44 @@
 from fastapi import HTTPException, status
+from sqlalchemy import event, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from datetime import datetime
-from typing import cast
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple, cast
+from uuid import UUID
+from ..config import settings
 from ..models.users import User
+from ..models.environments import Environment
+from ..models.user_sessions import UserSession
 from ..schemas.user import LoginRequest, TokenResponse, UserResponse
-from ..utils.security import verify_password, create_access_token
+from ..services.principal_cache import principal_cache
+from ..services.session_revocations import revoked_sessions
+from ..services.token_versions import token_versions
+from ..utils.security import (
+    verify_and_update_password_async,
+    create_access_token,
+    create_refresh_token,
+    hash_refresh_token,
+    TOKEN_FORMAT,
+)
 
-def authenticate_user(db: Session, login_request: LoginRequest) -> TokenResponse:
-    user = db.query(User).filter(User.email == login_request.email).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Correo o contraseña incorrectos",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    if not verify_password(login_request.password, cast(str, user.password_hash)):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Correo o contraseña incorrectos",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    if not cast(bool, user.is_active):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="La cuenta de usuario está inactiva",
-        )
-    
-    access_token = create_access_token(data={"sub": str(user.id), "role": cast(str, user.role)})
-    
-    db.query(User).filter(User.id == user.id).update({"last_login": datetime.utcnow()})
-    db.commit()
-    
+def user_token_claims(user: User, center_id: Optional[UUID], session_id: Optional[UUID] = None) -> dict:
+    """Claims del access token: suficientes para autorizar por ambiente/centro sin consultar la BD"""
+    return {
+        "fmt": TOKEN_FORMAT,
+        "sub": str(user.id),
+        "role": cast(str, user.role),
+        "env": str(user.environment_id) if user.environment_id else None,
+        "ctr": str(center_id) if center_id else None,
+        "act": bool(user.is_active),
+        "ver": user.token_version or 0,
+        "sid": str(session_id) if session_id else None,
+    }
+
+def _token_response(user: User, access_token: str, refresh_token: Optional[str] = None) -> TokenResponse:
     return TokenResponse(
         access_token=access_token,
         token_type="bearer",
+        refresh_token=refresh_token,
         user=UserResponse(
             id=user.id,
             email=user.email,
@@ -52,4 +55,170 @@ def authenticate_user(db: Session, login_request: LoginRequest) -> TokenResponse
             updated_at=user.updated_at,
             environment_id=user.environment_id
         )
-    )
\ No newline at end of file
+    )
+
+async def authenticate_user(
+    db: AsyncSession,
+    login_request: LoginRequest,
+    ip_address: Optional[str] = None,
+    user_agent: Optional[str] = None,
+) -> TokenResponse:
+    result = await db.execute(
+        select(User, Environment.center_id)
+        .outerjoin(Environment, User.environment_id == Environment.id)
+        .where(User.email == login_request.email)
+    )
+    row = result.first()
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Correo o contraseña incorrectos",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user, center_id = row
+
+    verified, new_hash = await verify_and_update_password_async(
+        login_request.password, cast(str, user.password_hash)
+    )
+    if not verified:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Correo o contraseña incorrectos",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    if not cast(bool, user.is_active):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="La cuenta de usuario está inactiva",
+        )
+
+    refresh_token, refresh_token_hash = create_refresh_token()
+    session = UserSession(
+        user_id=user.id,
+        refresh_token_hash=refresh_token_hash,
+        ip_address=ip_address,
+        user_agent=user_agent,
+        expires_at=datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+    db.add(session)
+    await db.flush()
+    access_token = create_access_token(data=user_token_claims(user, center_id, session.id))
+
+    login_values = {"last_login": datetime.utcnow()}
+    if new_hash:
+        # Migración transparente de bcrypt (o costos argon2 viejos) al esquema actual
+        login_values["password_hash"] = new_hash
+    await db.execute(update(User).where(User.id == user.id).values(**login_values))
+    await db.commit()
+
+    return _token_response(user, access_token, refresh_token)
+
+async def refresh_session(db: AsyncSession, refresh_token: str) -> TokenResponse:
+    """
+    Emite un access token nuevo (con los claims actuales del usuario) y rota el
+    refresh token. El FOR UPDATE evita que dos refresh concurrentes usen el mismo token.
+    """
+    result = await db.execute(
+        select(UserSession, User, Environment.center_id)
+        .join(User, UserSession.user_id == User.id)
+        .outerjoin(Environment, User.environment_id == Environment.id)
+        .where(UserSession.refresh_token_hash == hash_refresh_token(refresh_token))
+        .with_for_update(of=UserSession)
+    )
+    row = result.first()
+    now = datetime.utcnow()
+    if not row or row[0].revoked_at is not None or row[0].expires_at <= now:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Sesión inválida o expirada",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    session, user, center_id = row
+
+    if not cast(bool, user.is_active):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="La cuenta de usuario está inactiva",
+        )
+
+    new_refresh_token, new_refresh_token_hash = create_refresh_token()
+    session.refresh_token_hash = new_refresh_token_hash
+    session.last_used_at = now
+    await db.commit()
+
+    access_token = create_access_token(data=user_token_claims(user, center_id, session.id))
+    return _token_response(user, access_token, new_refresh_token)
+
+async def revoke_session(db: AsyncSession, session_id: UUID) -> None:
+    result = await db.execute(
+        update(UserSession)
+        .where(UserSession.id == session_id, UserSession.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+        .returning(UserSession.user_id)
+    )
+    user_id = result.scalar()
+    await db.commit()
+
+    revoked_sessions.add(session_id)
+    if user_id is not None:
+        principal_cache.invalidate_user(user_id)
+
+async def revoke_user_sessions(db: AsyncSession, user_id: UUID, keep_session_id: Optional[UUID] = None) -> List[UUID]:
+    """Revoca todas las sesiones activas del usuario (salvo keep_session_id); el commit queda a cargo del llamador"""
+    query = (
+        update(UserSession)
+        .where(UserSession.user_id == user_id, UserSession.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+        .returning(UserSession.id)
+    )
+    if keep_session_id is not None:
+        query = query.where(UserSession.id != keep_session_id)
+    session_ids = list((await db.execute(query)).scalars().all())
+
+    # El set en memoria se actualiza recién con el commit del llamador; si hace
+    # rollback las sesiones siguen activas
+    db.info.setdefault(_PENDING_REVOCATIONS, []).append((user_id, session_ids))
+    return session_ids
+
+_PENDING_REVOCATIONS = "pending_session_revocations"
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_revocations(session: Session) -> None:
+    for user_id, session_ids in session.info.pop(_PENDING_REVOCATIONS, ()):
+        for session_id in session_ids:
+            revoked_sessions.add(session_id)
+        principal_cache.invalidate_user(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_revocations(session: Session) -> None:
+    session.info.pop(_PENDING_REVOCATIONS, None)
+
+async def link_user_environment(
+    db: AsyncSession,
+    user_id: UUID,
+    environment: Environment,
+    session_id: Optional[UUID] = None,
+) -> Tuple[User, str]:
+    """
+    Vincula el usuario al ambiente en un solo UPDATE ... RETURNING e invalida
+    los claims anteriores. Devuelve el usuario y un access token con el nuevo ambiente.
+    """
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            environment_id=environment.id,
+            token_version=User.token_version + 1,
+            updated_at=datetime.utcnow(),
+        )
+        .returning(User)
+    )
+    user = result.scalars().first()
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado")
+    await db.commit()
+
+    token_versions.set(user.id, user.token_version)
+    principal_cache.invalidate_user(user.id)
+    return user, create_access_token(data=user_token_claims(user, environment.center_id, session_id))
@@ -0,0 +1,238 @@
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set
+from uuid import UUID
+
+from sqlalchemy import case, event, func, or_, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, attributes
+from sqlalchemy.orm.base import PASSIVE_NO_INITIALIZE
+
+from ..database import async_engine
+from ..models.environments import Environment
+from ..models.environment_inventory_counters import EnvironmentInventoryCounters
+from ..models.inventory_items import InventoryItem
+
+logger = logging.getLogger(__name__)
+
+# Mismos valores que check_status de inventory_items; cada uno tiene su columna <status>_items
+ITEM_STATUSES = ("available", "in_use", "maintenance", "damaged", "lost", "missing", "good")
+
+COUNTER_COLUMNS = (
+    "total_items",
+    *(f"{status}_items" for status in ITEM_STATUSES),
+    "total_quantity",
+    "damaged_quantity",
+    "missing_quantity",
+    "good_quantity",
+)
+
+# Atributos del ítem que afectan los contadores
+TRACKED_ATTRIBUTES = ("environment_id", "status", "quantity", "quantity_damaged", "quantity_missing")
+
+def item_contribution(status: str, quantity: int, quantity_damaged: int, quantity_missing: int) -> Dict[str, int]:
+    """Aporte de un ítem a los contadores de su ambiente"""
+    quantity_damaged = quantity_damaged or 0
+    quantity_missing = quantity_missing or 0
+    contribution = dict.fromkeys(COUNTER_COLUMNS, 0)
+    contribution["total_items"] = 1
+    if status in ITEM_STATUSES:
+        contribution[f"{status}_items"] = 1
+    contribution["total_quantity"] = quantity or 0
+    contribution["damaged_quantity"] = quantity_damaged
+    contribution["missing_quantity"] = quantity_missing
+    # Igual que calculate_verification_totals: una cantidad en 0 cuenta como 1
+    contribution["good_quantity"] = max((quantity or 1) - quantity_damaged - quantity_missing, 0)
+    return contribution
+
+def _item_values(item: InventoryItem, original: bool) -> Optional[Dict[str, Any]]:
+    """
+    Valores del ítem antes (original) o después del flush, desde el historial de
+    atributos y sin disparar cargas. None si alguno no estaba cargado.
+    """
+    values = {}
+    for key in TRACKED_ATTRIBUTES:
+        history = attributes.get_history(item, key, passive=PASSIVE_NO_INITIALIZE)
+        if original and history.deleted:
+            value = history.deleted[0]
+        elif not original and history.added:
+            value = history.added[0]
+        elif history.unchanged:
+            value = history.unchanged[0]
+        else:
+            # No estaba cargado (p. ej. asignado después de un expire)
+            return None
+        values[key] = value
+    return values
+
+def _accumulate(deltas: Dict[UUID, Dict[str, int]], values: Dict[str, Any], sign: int) -> None:
+    if values["environment_id"] is None:
+        return
+    contribution = item_contribution(
+        values["status"], values["quantity"], values["quantity_damaged"], values["quantity_missing"]
+    )
+    delta = deltas.setdefault(values["environment_id"], dict.fromkeys(COUNTER_COLUMNS, 0))
+    for column, value in contribution.items():
+        delta[column] += sign * value
+
+def apply_deltas(conn: Connection, deltas: Dict[UUID, Dict[str, int]]) -> None:
+    """Suma los deltas a los contadores con un upsert; crea la fila del ambiente si no existe"""
+    rows = [
+        {"environment_id": environment_id, **delta}
+        # Orden fijo de ambientes: dos transacciones concurrentes bloquean en el mismo orden
+        for environment_id, delta in sorted(deltas.items(), key=lambda item: str(item[0]))
+        if any(delta.values())
+    ]
+    if not rows:
+        return
+    table = EnvironmentInventoryCounters.__table__
+    statement = pg_insert(table)
+    conn.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.environment_id],
+        set_={
+            **{column: table.c[column] + statement.excluded[column] for column in COUNTER_COLUMNS},
+            "updated_at": func.current_timestamp(),
+        },
+    ), rows)
+
+@event.listens_for(Session, "after_flush")
+def _update_inventory_counters(session: Session, flush_context) -> None:
+    """
+    Aplica a environment_inventory_counters los cambios de ítems del flush, en la
+    misma transacción. Si falta el valor previo de algún atributo, los ambientes
+    afectados se recalculan desde inventory_items.
+    """
+    deltas: Dict[UUID, Dict[str, int]] = {}
+    stale: Set[UUID] = set()
+
+    for item in session.new:
+        if not isinstance(item, InventoryItem):
+            continue
+        after = _item_values(item, original=False)
+        if after is None:
+            # Atributo sin valor en el objeto (p. ej. default del servidor): recalcular el ambiente
+            if item.__dict__.get("environment_id") is not None:
+                stale.add(item.__dict__["environment_id"])
+            continue
+        _accumulate(deltas, after, 1)
+
+    for item in session.dirty:
+        if not isinstance(item, InventoryItem):
+            continue
+        if not any(
+            attributes.get_history(item, key, passive=PASSIVE_NO_INITIALIZE).has_changes()
+            for key in TRACKED_ATTRIBUTES
+        ):
+            continue
+        before, after = _item_values(item, original=True), _item_values(item, original=False)
+        if before is None or after is None:
+            stale.update(
+                environment_id for environment_id in (item.__dict__.get("environment_id"), before and before["environment_id"])
+                if environment_id is not None
+            )
+            continue
+        _accumulate(deltas, before, -1)
+        _accumulate(deltas, after, 1)
+
+    for item in session.deleted:
+        if not isinstance(item, InventoryItem):
+            continue
+        before = _item_values(item, original=True)
+        if before is None:
+            if item.__dict__.get("environment_id") is not None:
+                stale.add(item.__dict__["environment_id"])
+            continue
+        _accumulate(deltas, before, -1)
+
+    if not deltas and not stale:
+        return
+    conn = session.connection()
+    for environment_id in stale:
+        deltas.pop(environment_id, None)
+    apply_deltas(conn, deltas)
+    if stale:
+        reconcile_counters(conn, stale)
+
+def actual_counters(environment_ids: Optional[Iterable[UUID]] = None):
+    """Contadores recalculados desde inventory_items (la fuente de verdad), por ambiente"""
+    quantity = case((InventoryItem.quantity == 0, 1), else_=InventoryItem.quantity)
+    query = select(
+        InventoryItem.environment_id,
+        func.count().label("total_items"),
+        *(func.count().filter(InventoryItem.status == status).label(f"{status}_items") for status in ITEM_STATUSES),
+        func.coalesce(func.sum(InventoryItem.quantity), 0).label("total_quantity"),
+        func.coalesce(func.sum(InventoryItem.quantity_damaged), 0).label("damaged_quantity"),
+        func.coalesce(func.sum(InventoryItem.quantity_missing), 0).label("missing_quantity"),
+        func.coalesce(func.sum(func.greatest(
+            quantity - InventoryItem.quantity_damaged - InventoryItem.quantity_missing, 0
+        )), 0).label("good_quantity"),
+    ).where(InventoryItem.environment_id.isnot(None)).group_by(InventoryItem.environment_id)
+    if environment_ids is not None:
+        query = query.where(InventoryItem.environment_id.in_(list(environment_ids)))
+    return query
+
+def reconcile_counters(conn: Connection, environment_ids: Optional[Iterable[UUID]] = None) -> List[UUID]:
+    """
+    Compara los contadores con inventory_items y corrige los que difieren (o
+    faltan) con un solo INSERT ... ON CONFLICT. Devuelve los ambientes corregidos.
+    """
+    table = EnvironmentInventoryCounters.__table__
+    if environment_ids is not None:
+        environment_ids = sorted(environment_ids, key=str)
+
+    # Bloquea primero los contadores: las transacciones que ya los tocaron
+    # terminan antes de tomar la foto de inventory_items, y las que lleguen
+    # después suman su delta sobre el valor corregido
+    locked = select(table.c.environment_id).order_by(table.c.environment_id).with_for_update()
+    if environment_ids is not None:
+        locked = locked.where(table.c.environment_id.in_(environment_ids))
+    conn.execute(locked)
+
+    actual = actual_counters(environment_ids).subquery("actual")
+    source = (
+        select(
+            Environment.id,
+            *(func.coalesce(actual.c[column], 0) for column in COUNTER_COLUMNS),
+        )
+        .select_from(Environment.__table__.outerjoin(actual, actual.c.environment_id == Environment.id))
+        # Ambientes con ítems o con fila de contadores; los vacíos sin fila no son deriva
+        .where(or_(actual.c.environment_id.isnot(None), Environment.id.in_(select(table.c.environment_id))))
+    )
+    if environment_ids is not None:
+        source = source.where(Environment.id.in_(environment_ids))
+
+    statement = pg_insert(table).from_select(["environment_id", *COUNTER_COLUMNS], source)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.environment_id],
+        set_={
+            **{column: statement.excluded[column] for column in COUNTER_COLUMNS},
+            "updated_at": func.current_timestamp(),
+        },
+        where=tuple_(*(table.c[column] for column in COUNTER_COLUMNS)).is_distinct_from(
+            tuple_(*(statement.excluded[column] for column in COUNTER_COLUMNS))
+        ),
+    )
+    return list(conn.execute(statement.returning(table.c.environment_id)).scalars())
+
+def _reconcile_all(conn: Connection) -> List[UUID]:
+    # No esperar detrás de escrituras largas; se reintenta en la siguiente pasada
+    conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+    return reconcile_counters(conn)
+
+async def reconcile_inventory_counters() -> List[UUID]:
+    async with async_engine.begin() as conn:
+        return await conn.run_sync(_reconcile_all)
+
+async def reconcile_inventory_counters_periodically(interval: float) -> None:
+    while True:
+        try:
+            repaired = await reconcile_inventory_counters()
+            if repaired:
+                logger.warning(
+                    f"Contadores de inventario corregidos en {len(repaired)} ambientes: "
+                    f"{', '.join(str(environment_id) for environment_id in repaired)}"
+                )
+        except Exception as e:
+            logger.warning(f"No se pudo reconciliar los contadores de inventario: {e!r}")
+        await asyncio.sleep(interval)
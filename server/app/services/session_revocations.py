@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import select
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models.user_sessions import UserSession
+from ..services.principal_cache import principal_cache
+
+logger = logging.getLogger(__name__)
+
+# Solape entre sincronizaciones para tolerar relojes desfasados entre app y BD
+_SYNC_OVERLAP = timedelta(minutes=1)
+
+class RevokedSessionSet:
+    """
+    Sesiones revocadas, en memoria, para rechazar access tokens con una
+    búsqueda O(1) por el claim "sid". Solo hace falta recordar una revocación
+    mientras pueda existir un access token emitido antes de ella, es decir
+    durante ACCESS_TOKEN_EXPIRE_MINUTES; después se descarta.
+    """
+
+    def __init__(self, retention: timedelta):
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._revoked: Dict[str, datetime] = {}
+        self._synced_until: Optional[datetime] = None
+
+    def __contains__(self, session_id) -> bool:
+        return str(session_id) in self._revoked
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def add(self, session_id, revoked_at: Optional[datetime] = None) -> None:
+        with self._lock:
+            self._revoked[str(session_id)] = revoked_at or datetime.utcnow()
+
+    def prune(self) -> None:
+        cutoff = datetime.utcnow() - self.retention
+        with self._lock:
+            for session_id in [sid for sid, revoked_at in self._revoked.items() if revoked_at < cutoff]:
+                del self._revoked[session_id]
+
+    async def sync(self) -> int:
+        """Carga incremental: sesiones revocadas desde la última sincronización"""
+        started_at = datetime.utcnow()
+        since = self._synced_until or started_at - self.retention
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(UserSession.id, UserSession.user_id, UserSession.revoked_at)
+                .where(UserSession.revoked_at >= since)
+            )).all()
+
+        for session_id, user_id, revoked_at in rows:
+            if session_id not in self:
+                self.add(session_id, revoked_at)
+                # Revocada en otro worker: sacar de la caché los tokens del usuario
+                principal_cache.invalidate_user(user_id)
+        self.prune()
+        self._synced_until = started_at - _SYNC_OVERLAP
+        return len(rows)
+
+revoked_sessions = RevokedSessionSet(
+    retention=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES) + _SYNC_OVERLAP
+)
+
+async def sync_revoked_sessions_periodically(interval: float):
+    while True:
+        try:
+            await revoked_sessions.sync()
+        except Exception as e:
+            logger.warning(f"No se pudo sincronizar las sesiones revocadas: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,302 @@
+from datetime import date, datetime, timedelta
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from uuid import UUID
+
+from sqlalchemy import CheckConstraint, Select, func, select, true
+from sqlalchemy.orm import Session
+
+from ..models.environments import Environment
+from ..models.environment_inventory_counters import EnvironmentInventoryCounters
+from ..models.inventory_checks import InventoryCheck
+from ..models.inventory_items import InventoryItem
+from ..models.maintenance_requests import MaintenanceRequest
+from ..schemas.stats import (
+    DashboardStatsResponse,
+    InventoryDashboardStats,
+    VerificationDashboardStats,
+    MaintenanceDashboardStats
+)
+
+# Días que cuentan como verificaciones "recientes" en el dashboard
+RECENT_CHECKS_DAYS = 30
+
+# Ventana de la actividad reciente en las estadísticas por ambiente
+RECENT_ACTIVITY_DAYS = 7
+
+# Granularidades de time_series (valores válidos de date_trunc)
+TIME_SERIES_GRANULARITIES = ("day", "week", "month")
+
+def check_constraint_values(table, name: str) -> Tuple[str, ...]:
+    """Valores permitidos por un CHECK (col IN ('a', 'b', ...)) del modelo"""
+    for constraint in table.constraints:
+        if isinstance(constraint, CheckConstraint) and constraint.name == name:
+            return tuple(re.findall(r"'([^']*)'", str(constraint.sqltext)))
+    raise LookupError(f"{table.name} no tiene el constraint {name}")
+
+# Fuente única: el CHECK de inventory_items.category
+INVENTORY_CATEGORIES = check_constraint_values(InventoryItem.__table__, "check_category")
+
+# Ambientes a agregar por lote: lista de ids o un select de ids (p. ej. los de un centro)
+EnvironmentScope = Union[Sequence[UUID], Select]
+
+def _percentage(part: int, total: int) -> float:
+    return round((part / total * 100) if total > 0 else 0, 2)
+
+def _scoped(query, column, environment_id: Optional[UUID], environment_ids: Optional[EnvironmentScope]):
+    """Filtra por un ambiente, o agrupa por ambiente dentro del lote environment_ids"""
+    if environment_ids is not None:
+        return query.add_columns(column.label("environment_id")).where(column.in_(environment_ids)).group_by(column)
+    if environment_id:
+        return query.where(column == environment_id)
+    return query
+
+def _dashboard_from_row(row) -> DashboardStatsResponse:
+    # En el lote los ambientes sin filas llegan con NULL desde el LEFT JOIN
+    values = {key: value or 0 for key, value in row.items()}
+    return DashboardStatsResponse(
+        inventory=InventoryDashboardStats(
+            total_items=values["total_items"],
+            total_quantity=values["total_quantity"],
+            available_items=values["available_items"],
+            in_use_items=values["in_use_items"],
+            maintenance_items=values["maintenance_items"],
+            damaged_items=values["damaged_items"],
+            damaged_quantity=values["damaged_quantity"],
+            missing_quantity=values["missing_quantity"],
+        ),
+        verifications=VerificationDashboardStats(
+            recent_checks=values["recent_checks"],
+            completed_checks=values["completed_checks"],
+            completion_rate=_percentage(values["completed_checks"], values["recent_checks"]),
+        ),
+        maintenance=MaintenanceDashboardStats(
+            pending_requests=values["pending_requests"],
+            in_progress_requests=values["in_progress_requests"],
+            total_active=values["pending_requests"] + values["in_progress_requests"],
+        ),
+    )
+
+def bucket_start(value: date, granularity: str) -> date:
+    """Inicio del intervalo que contiene value, igual que date_trunc (semanas desde el lunes)"""
+    if granularity == "week":
+        return value - timedelta(days=value.weekday())
+    if granularity == "month":
+        return value.replace(day=1)
+    return value
+
+def next_bucket(value: date, granularity: str) -> date:
+    if granularity == "week":
+        return value + timedelta(days=7)
+    if granularity == "month":
+        return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return value + timedelta(days=1)
+
+class StatsService:
+    """
+    Agregaciones de estadísticas. El inventario se lee de environment_inventory_counters
+    (una fila por ambiente); el resto de tablas se agrega en una sola pasada con
+    COUNT/SUM ... FILTER (WHERE ...) y las tablas se combinan en un único SELECT,
+    así cada endpoint es un solo viaje a la base de datos. Con environment_ids
+    las mismas agregaciones se agrupan por ambiente (GROUP BY environment_id).
+    """
+
+    @staticmethod
+    def inventory_aggregates(environment_id: Optional[UUID] = None, environment_ids: Optional[EnvironmentScope] = None):
+        """Una fila con conteos por estado y sumas de cantidades, desde los contadores por ambiente"""
+        counters = EnvironmentInventoryCounters
+        query = select(
+            func.coalesce(func.sum(counters.total_items), 0).label("total_items"),
+            func.coalesce(func.sum(counters.total_quantity), 0).label("total_quantity"),
+            func.coalesce(func.sum(counters.available_items), 0).label("available_items"),
+            func.coalesce(func.sum(counters.in_use_items), 0).label("in_use_items"),
+            func.coalesce(func.sum(counters.maintenance_items), 0).label("maintenance_items"),
+            func.coalesce(func.sum(counters.damaged_items), 0).label("damaged_items"),
+            func.coalesce(func.sum(counters.damaged_quantity), 0).label("damaged_quantity"),
+            func.coalesce(func.sum(counters.missing_quantity), 0).label("missing_quantity"),
+        )
+        query = _scoped(query, counters.environment_id, environment_id, environment_ids)
+        return query.subquery("inventory")
+
+    @staticmethod
+    def check_aggregates(
+        environment_id: Optional[UUID] = None,
+        since: Optional[date] = None,
+        environment_ids: Optional[EnvironmentScope] = None
+    ):
+        query = select(
+            func.count().label("recent_checks"),
+            func.count().filter(InventoryCheck.status == "complete").label("completed_checks"),
+        )
+        query = _scoped(query, InventoryCheck.environment_id, environment_id, environment_ids)
+        if since:
+            query = query.where(InventoryCheck.check_date >= since)
+        return query.subquery("checks")
+
+    @staticmethod
+    def maintenance_aggregates(environment_id: Optional[UUID] = None, environment_ids: Optional[EnvironmentScope] = None):
+        query = select(
+            func.count().filter(MaintenanceRequest.status == "pending").label("pending_requests"),
+            func.count().filter(MaintenanceRequest.status == "in_progress").label("in_progress_requests"),
+        ).where(MaintenanceRequest.status.in_(("pending", "in_progress")))
+        query = _scoped(query, MaintenanceRequest.environment_id, environment_id, environment_ids)
+        return query.subquery("maintenance")
+
+    @staticmethod
+    def recent_activity_aggregates(environment_ids: EnvironmentScope, since: date):
+        """Verificaciones y solicitudes de mantenimiento desde since, por ambiente"""
+        checks = _scoped(
+            select(func.count().label("checks_last_week")).where(InventoryCheck.check_date >= since),
+            InventoryCheck.environment_id, None, environment_ids
+        ).subquery("recent_checks")
+        maintenance = _scoped(
+            select(func.count().label("maintenance_requests_last_week")).where(
+                MaintenanceRequest.created_at >= datetime.combine(since, datetime.min.time())
+            ),
+            MaintenanceRequest.environment_id, None, environment_ids
+        ).subquery("recent_maintenance")
+        return checks, maintenance
+
+    @staticmethod
+    def time_series(
+        db: Session,
+        column,
+        start: date,
+        end: date,
+        granularity: str = "day",
+        filters: Iterable = ()
+    ) -> List[Dict[str, Any]]:
+        """
+        Conteo de filas por intervalo entre start y end (inclusive) en una sola
+        consulta GROUP BY date_trunc; los intervalos sin filas se completan con 0.
+        column es la fecha a agrupar (Date o TIMESTAMP) y filters se aplica
+        tal cual, así sirve para verificaciones, préstamos, mantenimiento o auditoría.
+        """
+        if granularity not in TIME_SERIES_GRANULARITIES:
+            raise ValueError(f"Granularidad no soportada: {granularity}")
+
+        bucket = func.date_trunc(granularity, column).label("bucket")
+        rows = db.execute(
+            select(bucket, func.count())
+            .where(column >= start, column < end + timedelta(days=1), *filters)
+            .group_by(bucket)
+        ).all()
+        counts = {bucket_value.date(): count for bucket_value, count in rows}
+
+        series = []
+        current = bucket_start(start, granularity)
+        while current <= end:
+            series.append({"date": current.isoformat(), "count": counts.get(current, 0)})
+            current = next_bucket(current, granularity)
+        return series
+
+    @staticmethod
+    def category_distributions(db: Session, environment_ids: EnvironmentScope) -> Dict[UUID, Dict[str, Dict[str, int]]]:
+        """
+        Conteo y cantidades por ambiente y categoría en un solo GROUP BY. Solo
+        aparecen los ambientes con ítems; las categorías sin ítems quedan en 0.
+        """
+        rows = db.execute(
+            select(
+                InventoryItem.environment_id,
+                InventoryItem.category,
+                func.count(),
+                func.coalesce(func.sum(InventoryItem.quantity), 0),
+                func.coalesce(func.sum(InventoryItem.quantity_damaged), 0),
+                func.coalesce(func.sum(InventoryItem.quantity_missing), 0),
+            )
+            .where(InventoryItem.environment_id.in_(environment_ids))
+            .group_by(InventoryItem.environment_id, InventoryItem.category)
+        ).all()
+
+        distributions: Dict[UUID, Dict[str, Dict[str, int]]] = {}
+        for environment_id, category, count, quantity, damaged, missing in rows:
+            distribution = distributions.setdefault(environment_id, StatsService.empty_category_distribution())
+            distribution[category] = {"count": count, "quantity": quantity, "damaged": damaged, "missing": missing}
+        return distributions
+
+    @staticmethod
+    def empty_category_distribution() -> Dict[str, Dict[str, int]]:
+        return {
+            category: {"count": 0, "quantity": 0, "damaged": 0, "missing": 0}
+            for category in INVENTORY_CATEGORIES
+        }
+
+    @staticmethod
+    def category_distribution(db: Session, environment_id: UUID) -> Dict[str, Dict[str, int]]:
+        """Distribución por categoría de un ambiente; las categorías sin ítems quedan en 0"""
+        distributions = StatsService.category_distributions(db, [environment_id])
+        return distributions.get(environment_id) or StatsService.empty_category_distribution()
+
+    @staticmethod
+    def get_dashboard_stats(db: Session, environment_id: Optional[UUID] = None) -> DashboardStatsResponse:
+        """Dashboard general en un solo SELECT (cada subconsulta agrega una tabla y devuelve una fila)"""
+        inventory = StatsService.inventory_aggregates(environment_id)
+        checks = StatsService.check_aggregates(
+            environment_id, since=date.today() - timedelta(days=RECENT_CHECKS_DAYS)
+        )
+        maintenance = StatsService.maintenance_aggregates(environment_id)
+
+        row = db.execute(
+            select(inventory, checks, maintenance).select_from(
+                inventory.join(checks, true()).join(maintenance, true())
+            )
+        ).mappings().one()
+        return _dashboard_from_row(row)
+
+    @staticmethod
+    def get_environments_stats(
+        db: Session,
+        environment_ids: EnvironmentScope,
+        include_dashboard: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        Estadísticas de varios ambientes (p. ej. todos los de un centro) en dos
+        consultas: los agregados del dashboard y de actividad reciente agrupados
+        por ambiente y unidos a environments, y la distribución por categoría.
+        Cada elemento combina la forma de /environment/{id} con la del dashboard;
+        con include_dashboard=False no se calculan las subconsultas del dashboard
+        y los elementos no traen la clave "dashboard".
+        """
+        today = date.today()
+        recent_checks, recent_maintenance = StatsService.recent_activity_aggregates(
+            environment_ids, since=today - timedelta(days=RECENT_ACTIVITY_DAYS)
+        )
+        aggregates = [recent_checks, recent_maintenance]
+        if include_dashboard:
+            aggregates += [
+                StatsService.inventory_aggregates(environment_ids=environment_ids),
+                StatsService.check_aggregates(
+                    since=today - timedelta(days=RECENT_CHECKS_DAYS), environment_ids=environment_ids
+                ),
+                StatsService.maintenance_aggregates(environment_ids=environment_ids),
+            ]
+        joined = Environment.__table__
+        for subquery in aggregates:
+            joined = joined.outerjoin(subquery, subquery.c.environment_id == Environment.id)
+
+        rows = db.execute(
+            select(
+                Environment.id, Environment.name, Environment.location,
+                *(column for subquery in aggregates for column in subquery.c if column.key != "environment_id")
+            )
+            .select_from(joined)
+            .where(Environment.id.in_(environment_ids))
+            .order_by(Environment.name)
+        ).mappings().all()
+        distributions = StatsService.category_distributions(db, environment_ids)
+
+        results = []
+        for row in rows:
+            values = dict(row)
+            environment = {key: values.pop(key) for key in ("id", "name", "location")}
+            activity = {key: values.pop(key) or 0 for key in ("checks_last_week", "maintenance_requests_last_week")}
+            stats = {
+                "environment": environment,
+                "category_distribution": distributions.get(environment["id"]) or StatsService.empty_category_distribution(),
+                "recent_activity": activity,
+            }
+            if include_dashboard:
+                stats["dashboard"] = _dashboard_from_row(values)
+            results.append(stats)
+        return results
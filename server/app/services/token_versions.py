@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+
+from ..database import AsyncSessionLocal
+from ..models.users import User
+
+logger = logging.getLogger(__name__)
+
+# Solape entre sincronizaciones para tolerar relojes desfasados entre app y BD
+_SYNC_OVERLAP = timedelta(minutes=1)
+
+class TokenVersionMap:
+    """
+    Versión vigente de los claims de cada usuario, en memoria.
+    Un token cuyo claim "ver" es menor que la versión vigente tiene claims
+    obsoletos (rol, ambiente o estado cambiaron) y no puede autorizar por sí solo.
+    Solo se guardan los usuarios con versión > 0, así que el mapa es pequeño.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+        self._synced_until: Optional[datetime] = None
+
+    def get(self, user_id) -> int:
+        return self._versions.get(str(user_id), 0)
+
+    def set(self, user_id, version: int) -> None:
+        with self._lock:
+            # Nunca retroceder: otro worker pudo haber visto una versión mayor
+            key = str(user_id)
+            if version > self._versions.get(key, 0):
+                self._versions[key] = version
+
+    def is_current(self, user_id, version: int) -> bool:
+        return version >= self.get(user_id)
+
+    async def sync(self) -> int:
+        """Carga incremental desde la tabla users (usuarios modificados desde la última sincronización)"""
+        started_at = datetime.utcnow()
+        query = select(User.id, User.token_version).where(User.token_version > 0)
+        if self._synced_until is not None:
+            query = query.where(User.updated_at >= self._synced_until)
+
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(query)).all()
+
+        for user_id, version in rows:
+            self.set(user_id, version)
+        self._synced_until = started_at - _SYNC_OVERLAP
+        return len(rows)
+
+token_versions = TokenVersionMap()
+
+_PENDING_TOKEN_VERSIONS = "pending_token_versions"
+
+def bump_token_version(user: User) -> None:
+    """Marca como obsoletos los claims de los tokens ya emitidos para el usuario (antes del commit)"""
+    user.token_version = (user.token_version or 0) + 1
+    # El mapa en memoria se actualiza recién con el commit del llamador; si hace
+    # rollback quedaría por delante de la BD y rechazaría los tokens vigentes
+    object_session(user).info.setdefault(_PENDING_TOKEN_VERSIONS, []).append((user.id, user.token_version))
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_token_versions(session: Session) -> None:
+    for user_id, version in session.info.pop(_PENDING_TOKEN_VERSIONS, ()):
+        token_versions.set(user_id, version)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_token_versions(session: Session) -> None:
+    session.info.pop(_PENDING_TOKEN_VERSIONS, None)
+
+async def sync_token_versions_periodically(interval: float):
+    while True:
+        try:
+            await token_versions.sync()
+        except Exception as e:
+            logger.warning(f"No se pudo sincronizar las versiones de token: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,47 @@
+import json
+import zlib
+from typing import Any, Dict, Optional
+
+# Los bloques zlib con compresión por defecto empiezan con 0x78; un JSON nunca
+_ZLIB_HEADER = 0x78
+
+def encode_request_body(data: Any, max_bytes: int, compress: bool) -> Optional[bytes]:
+    """Serializa el cuerpo ya filtrado para audit_logs.request_body: JSON truncado y, si se pide, zlib"""
+    if data is None:
+        return None
+    raw = json.dumps(data, default=str, separators=(",", ":")).encode()
+    if len(raw) > max_bytes:
+        raw = raw[:max_bytes]
+    return zlib.compress(raw) if compress else raw
+
+def decode_request_body(raw: Optional[bytes]) -> Any:
+    """Inverso de encode_request_body; un JSON truncado se devuelve como texto"""
+    if not raw:
+        return None
+    if raw[0] == _ZLIB_HEADER:
+        raw = zlib.decompress(raw)
+    text = raw.decode(errors="ignore")
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+def with_request_body(new_values: Optional[Dict[str, Any]], raw: Optional[bytes]) -> Optional[Dict[str, Any]]:
+    """
+    Agrega el cuerpo guardado a new_values.request (body y query_params), con
+    la forma que tenía antes del formato compacto
+    """
+    decoded = decode_request_body(raw)
+    if decoded is None:
+        return new_values
+    values = dict(new_values or {})
+    request = dict(values.get("request") or {})
+    if isinstance(decoded, dict):
+        request["body"] = decoded.get("body")
+        if decoded.get("query"):
+            request["query_params"] = decoded["query"]
+    else:
+        # JSON truncado: se muestra como texto
+        request["body"] = decoded
+    values["request"] = request
+    return values
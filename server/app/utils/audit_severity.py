@@ -0,0 +1,23 @@
+from functools import lru_cache
+from typing import Optional
+
+# Severidad por palabras de la acción, en orden de precedencia
+SEVERITY_KEYWORDS = (
+    ("error", ("error", "fail", "exception", "reject")),
+    ("warning", ("delete", "update", "modify", "change", "remove")),
+    ("success", ("create", "login", "approve", "complete", "success")),
+)
+
+@lru_cache(maxsize=1024)
+def classify_action_severity(action: str) -> str:
+    lowered = action.lower()
+    for severity, keywords in SEVERITY_KEYWORDS:
+        if any(keyword in lowered for keyword in keywords):
+            return severity
+    return "info"
+
+def classify_severity(action: str, status_code: Optional[int] = None) -> str:
+    """Severidad que se guarda con el log; una respuesta 4xx/5xx es un error"""
+    if status_code is not None and status_code >= 400:
+        return "error"
+    return classify_action_severity(action)
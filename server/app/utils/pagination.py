@@ -0,0 +1,32 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Tuple
+from uuid import UUID
+
+from sqlalchemy.orm import Query
+
+def encode_cursor(created_at: datetime, row_id: UUID) -> str:
+    """Cursor opaco con la posición (created_at, id) de la última fila entregada"""
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """Inverso de encode_cursor; lanza ValueError si el cursor no es válido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), UUID(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Cursor inválido") from e
+
+def estimate_count(query: Query) -> int:
+    """Filas que el planner estima para la consulta, sin ejecutarla (EXPLAIN)"""
+    session = query.session
+    compiled = query.statement.compile(dialect=session.get_bind().dialect)
+    plan: Any = session.connection().exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+class PoolStats:
+    """Contadores acumulados de checkouts, tiempos de espera y timeouts de un pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.slow_checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_checkout(self, wait: float, slow: bool) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if slow:
+                self.slow_checkouts += 1
+
+    def record_timeout(self, wait: float) -> None:
+        with self._lock:
+            self.timeouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "slow_checkouts": self.slow_checkouts,
+                "avg_wait_ms": round(self.total_wait / attempts * 1000, 3) if attempts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+            }
+
+class _InstrumentedPoolMixin:
+    """Mide la espera de cada checkout y registra en logs las esperas lentas y los timeouts"""
+
+    # Umbral (segundos) a partir del cual un checkout se registra como lento
+    slow_checkout = 0.5
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self):
+        # engine.dispose() recrea el pool: se conservan umbral y contadores
+        new_pool = super().recreate()
+        new_pool.slow_checkout = self.slow_checkout
+        new_pool.stats = self.stats
+        return new_pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            wait = time.perf_counter() - start
+            self.stats.record_timeout(wait)
+            logger.warning(
+                "Pool de conexiones agotado tras %.3fs (%s)", wait, self.status()
+            )
+            raise
+
+        wait = time.perf_counter() - start
+        slow = wait >= self.slow_checkout
+        self.stats.record_checkout(wait, slow)
+        if slow:
+            logger.warning(
+                "Checkout lento del pool de conexiones: %.3fs (%s)", wait, self.status()
+            )
+        return connection
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+class InstrumentedAsyncAdaptedQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+def pool_status(engine: Engine) -> Dict[str, Any]:
+    """Estado actual del pool de un motor más los contadores acumulados"""
+    pool = engine.pool
+    status = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+        })
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        status.update(stats.snapshot())
+    return status
+
+async def log_pool_status_periodically(engines: Dict[str, Engine], interval: int) -> None:
+    """Escribe en el log el estado de cada pool cada `interval` segundos"""
+    while True:
+        await asyncio.sleep(interval)
+        for name, pool_engine in engines.items():
+            logger.info("Pool de conexiones %s: %s", name, pool_status(pool_engine))
@@ -1,11 +1,34 @@
 from passlib.context import CryptContext
 from jose import JWTError, jwt # type: ignore
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from fastapi import HTTPException, status
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
+import asyncio
+import hashlib
+import secrets
+import threading
 from ..config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# argon2id para hashes nuevos; los bcrypt existentes siguen verificando y se
+# rehashean en el siguiente login exitoso (needs_update / verify_and_update)
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=settings.ARGON2_TIME_COST,
+    argon2__memory_cost=settings.ARGON2_MEMORY_COST,
+    argon2__parallelism=settings.ARGON2_PARALLELISM,
+)
+
+# Pool acotado para el hash de contraseñas: argon2 (argon2-cffi) libera el GIL, así que el
+# trabajo corre en paralelo sin bloquear el event loop
+_password_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash",
+)
+_password_pending = 0
+_password_pending_lock = threading.Lock()
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -13,13 +36,57 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verifica y, si el hash usa un esquema o costo obsoleto, devuelve el hash nuevo"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+async def _run_password_task(func, *args):
+    global _password_pending
+    with _password_pending_lock:
+        if _password_pending >= settings.PASSWORD_HASH_MAX_PENDING:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Servicio ocupado, intente de nuevo en unos segundos",
+                headers={"Retry-After": "1"},
+            )
+        _password_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_password_executor, func, *args)
+    finally:
+        with _password_pending_lock:
+            _password_pending -= 1
+
+async def hash_password_async(password: str) -> str:
+    """hash_password ejecutado en el pool de hash, para handlers async"""
+    return await _run_password_task(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password ejecutado en el pool de hash, para handlers async"""
+    return await _run_password_task(verify_password, plain_password, hashed_password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """verify_and_update_password ejecutado en el pool de hash, para handlers async"""
+    return await _run_password_task(verify_and_update_password, plain_password, hashed_password)
+
+# Formato de claims: sub, role, env, ctr, act, ver (versión de token del usuario) y sid (sesión)
+TOKEN_FORMAT = 2
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(days=settings.ACCESS_TOKEN_EXPIRE)
+    expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
+def create_refresh_token() -> Tuple[str, str]:
+    """Refresh token opaco; devuelve (token, hash) y solo el hash se guarda en la BD"""
+    token = secrets.token_urlsafe(32)
+    return token, hash_refresh_token(token)
+
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
 def decode_access_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
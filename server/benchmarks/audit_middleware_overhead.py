@@ -0,0 +1,117 @@
+"""
+Benchmark del costo por request de AuditMiddleware sobre POST /api/inventory-checks/.
+
+Monta una app mínima con la misma ruta (sin base de datos: el handler solo
+valida el cuerpo) y la ejecuta por ASGI directo, con y sin el middleware.
+La escritura del log se reemplaza por una no-op para medir solo el middleware.
+
+    cd server
+    python -m benchmarks.audit_middleware_overhead --requests 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+
+# Valores mínimos para que Settings() cargue fuera de un despliegue real
+for key, value in {
+    "DATABASE_HOST": "localhost",
+    "DATABASE_PORT": "5432",
+    "DATABASE_USER": "bench",
+    "DATABASE_PASSWORD": "bench",
+    "DATABASE_NAME": "bench",
+    "SECRET_KEY": "bench-secret",
+}.items():
+    os.environ.setdefault(key, value)
+
+from fastapi import FastAPI  # noqa: E402
+
+from app.middleware.audit_middleware import AuditMiddleware  # noqa: E402
+from app.schemas.inventory_check import InventoryCheckCreateRequest  # noqa: E402
+
+async def _noop_audit_write(self, *args, **kwargs):
+    return None
+
+def _build_app(with_audit: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/api/inventory-checks/")
+    async def create_inventory_check(request: InventoryCheckCreateRequest):
+        return {"id": str(uuid.uuid4()), "environment_id": str(request.environment_id), "status": "pending"}
+
+    if with_audit:
+        AuditMiddleware._create_audit_log_async = _noop_audit_write
+        app.add_middleware(AuditMiddleware)
+    return app
+
+async def _call(app, body: bytes):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/api/inventory-checks/",
+        "raw_path": b"/api/inventory-checks/",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"authorization", b"Bearer bench"),
+            (b"user-agent", b"bench"),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return {"type": "http.disconnect"}
+
+    status = None
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    assert status == 200, status
+
+async def _run(app, body: bytes, requests: int) -> float:
+    for _ in range(100):
+        await _call(app, body)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await _call(app, body)
+    return (time.perf_counter() - start) / requests
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    body = json.dumps({
+        "environment_id": str(uuid.uuid4()),
+        "schedule_id": str(uuid.uuid4()),
+        "student_id": str(uuid.uuid4()),
+        "cleaning_notes": "x" * 200,
+    }).encode()
+
+    baseline = asyncio.run(_run(_build_app(False), body, args.requests))
+    audited = asyncio.run(_run(_build_app(True), body, args.requests))
+
+    print(f"{'app':<18}{'µs/request':>12}")
+    print(f"{'sin auditoría':<18}{baseline * 1e6:>12.1f}")
+    print(f"{'AuditMiddleware':<18}{audited * 1e6:>12.1f}")
+    print(f"{'overhead':<18}{(audited - baseline) * 1e6:>12.1f}")
+
+if __name__ == "__main__":
+    main()
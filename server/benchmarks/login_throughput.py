@@ -0,0 +1,75 @@
+"""
+Benchmark de throughput de login: verificación de contraseñas en el event loop
+(como antes) frente al pool acotado de security.verify_password_async.
+
+Mide logins por segundo y el peor retraso del event loop mientras llega una
+ráfaga de logins concurrentes. No requiere base de datos.
+
+    cd server
+    python -m benchmarks.login_throughput --logins 64 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import time
+
+# Valores mínimos para que Settings() cargue fuera de un despliegue real
+for key, value in {
+    "DATABASE_HOST": "localhost",
+    "DATABASE_PORT": "5432",
+    "DATABASE_USER": "bench",
+    "DATABASE_PASSWORD": "bench",
+    "DATABASE_NAME": "bench",
+    "SECRET_KEY": "bench-secret",
+}.items():
+    os.environ.setdefault(key, value)
+
+from app.utils.security import hash_password, verify_password, verify_password_async  # noqa: E402
+
+async def _loop_lag_probe(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """Devuelve el mayor retraso observado al despertar del event loop"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+async def _run(mode: str, password: str, hashed: str, logins: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login():
+        async with semaphore:
+            if mode == "inline":
+                return verify_password(password, hashed)
+            return await verify_password_async(password, hashed)
+
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_loop_lag_probe(stop))
+    await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    worst_lag = await probe
+    assert all(results)
+    return logins / elapsed, worst_lag
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    password = "benchmark-password"
+    hashed = hash_password(password)
+
+    print(f"{'modo':<10}{'logins/s':>12}{'max lag loop (ms)':>20}")
+    for mode in ("inline", "pool"):
+        throughput, worst_lag = asyncio.run(_run(mode, password, hashed, args.logins, args.concurrency))
+        print(f"{mode:<10}{throughput:>12.1f}{worst_lag * 1000:>20.1f}")
+
+if __name__ == "__main__":
+    main()
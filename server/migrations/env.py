@@ -9,7 +9,8 @@ from app.config import settings
 # Modelos del sistema
 from app.models import users, centers, environments, inventory_items, schedules, inventory_checks, inventory_check_items
 from app.models import supervisor_reviews, loans, maintenance_requests, maintenance_history, notifications
-from app.models import system_alerts, alert_settings, generated_reports, feedback, audit_logs, user_settings
+from app.models import system_alerts, alert_settings, generated_reports, feedback, audit_logs, user_settings, user_sessions, audit_stats_hourly
+from app.models import environment_inventory_counters
 
 config = context.config
 if config.config_file_name is not None:
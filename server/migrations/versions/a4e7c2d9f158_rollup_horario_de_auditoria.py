@@ -0,0 +1,85 @@
+"""rollup horario de auditoria
+
+Revision ID: a4e7c2d9f158
+Revises: f2b8d4c6a913
+Create Date: 2026-10-17 18:21:37.640218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4e7c2d9f158'
+down_revision: Union[str, Sequence[str], None] = 'f2b8d4c6a913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+# Misma clasificación que app/utils/audit_severity.py
+SEVERITY_CASE = """
+    CASE
+        WHEN status_code >= 400 THEN 'error'
+        WHEN lower(action) ~ '(error|fail|exception|reject)' THEN 'error'
+        WHEN lower(action) ~ '(delete|update|modify|change|remove)' THEN 'warning'
+        WHEN lower(action) ~ '(create|login|approve|complete|success)' THEN 'success'
+        ELSE 'info'
+    END
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('audit_logs', sa.Column('severity', sa.String(length=10), nullable=True))
+    op.create_table('audit_stats_hourly',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('hour', sa.TIMESTAMP(), nullable=False),
+    sa.Column('action', sa.String(length=100), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=True),
+    sa.Column('severity', sa.String(length=10), nullable=False),
+    sa.Column('count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ux_audit_stats_hourly_key', 'audit_stats_hourly', ['hour', 'action', 'severity', sa.text("COALESCE(user_id, '00000000-0000-0000-0000-000000000000'::uuid)")], unique=True)
+
+    # Severidad de los logs existentes, por lotes fuera de la transacción
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        last_id = None
+        while True:
+            if last_id is None:
+                ids = conn.execute(
+                    sa.text("SELECT id FROM audit_logs ORDER BY id LIMIT :limit"),
+                    {"limit": BACKFILL_BATCH_SIZE},
+                ).scalars().all()
+            else:
+                ids = conn.execute(
+                    sa.text("SELECT id FROM audit_logs WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                    {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE},
+                ).scalars().all()
+            if not ids:
+                break
+            conn.execute(
+                sa.text(f"UPDATE audit_logs SET severity = {SEVERITY_CASE} WHERE id = ANY(:ids)"),
+                {"ids": list(ids)},
+            )
+            last_id = ids[-1]
+
+    # Rollup inicial; desde aquí lo mantiene el writer de auditoría
+    op.execute("""
+        INSERT INTO audit_stats_hourly (hour, action, user_id, severity, count)
+        SELECT date_trunc('hour', created_at), action, user_id, severity, count(*)
+        FROM audit_logs
+        GROUP BY 1, 2, 3, 4
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ux_audit_stats_hourly_key', table_name='audit_stats_hourly')
+    op.drop_table('audit_stats_hourly')
+    op.drop_column('audit_logs', 'severity')
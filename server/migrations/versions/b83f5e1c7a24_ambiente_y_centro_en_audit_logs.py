@@ -0,0 +1,84 @@
+"""ambiente y centro en audit_logs
+
+Revision ID: b83f5e1c7a24
+Revises: a4e7c2d9f158
+Create Date: 2026-10-17 20:05:51.294476
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b83f5e1c7a24'
+down_revision: Union[str, Sequence[str], None] = 'a4e7c2d9f158'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+# Ambiente del historial: el que quedó en new_values (cuerpo de la request),
+# la propia entidad si es un ambiente, o en último caso el ambiente actual del
+# usuario. El centro sale del ambiente. new_values deja de guardar el ambiente.
+BACKFILL_SQL = sa.text("""
+    WITH resolved AS (
+        SELECT a.id, a.created_at, COALESCE(
+            CASE WHEN a.new_values->>'environment_id' ~* '^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$'
+                 THEN (a.new_values->>'environment_id')::uuid END,
+            CASE WHEN a.entity_type = 'environment' THEN a.entity_id END,
+            u.environment_id
+        ) AS environment_id
+        FROM audit_logs a
+        LEFT JOIN users u ON u.id = a.user_id
+        WHERE a.id = ANY(:ids)
+    )
+    UPDATE audit_logs SET
+        environment_id = resolved.environment_id,
+        center_id = environments.center_id,
+        new_values = audit_logs.new_values - 'environment_id'
+    FROM resolved
+    LEFT JOIN environments ON environments.id = resolved.environment_id
+    WHERE audit_logs.id = resolved.id AND audit_logs.created_at = resolved.created_at
+""")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('audit_logs', sa.Column('environment_id', sa.UUID(), nullable=True))
+    op.add_column('audit_logs', sa.Column('center_id', sa.UUID(), nullable=True))
+    op.create_index('ix_audit_logs_environment_id_created_at_id', 'audit_logs', ['environment_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_audit_logs_center_id_created_at_id', 'audit_logs', ['center_id', 'created_at', 'id'], unique=False)
+
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        last_id = None
+        while True:
+            if last_id is None:
+                ids = conn.execute(
+                    sa.text("SELECT id FROM audit_logs ORDER BY id LIMIT :limit"),
+                    {"limit": BACKFILL_BATCH_SIZE},
+                ).scalars().all()
+            else:
+                ids = conn.execute(
+                    sa.text("SELECT id FROM audit_logs WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                    {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE},
+                ).scalars().all()
+            if not ids:
+                break
+            conn.execute(BACKFILL_SQL, {"ids": list(ids)})
+            last_id = ids[-1]
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("""
+        UPDATE audit_logs
+        SET new_values = COALESCE(new_values, '{}'::jsonb) || jsonb_build_object('environment_id', environment_id::text)
+        WHERE environment_id IS NOT NULL
+    """)
+    op.drop_index('ix_audit_logs_center_id_created_at_id', table_name='audit_logs')
+    op.drop_index('ix_audit_logs_environment_id_created_at_id', table_name='audit_logs')
+    op.drop_column('audit_logs', 'center_id')
+    op.drop_column('audit_logs', 'environment_id')
@@ -0,0 +1,38 @@
+"""busqueda por trigramas
+
+Revision ID: c6d1f9a3e852
+Revises: b83f5e1c7a24
+Create Date: 2026-10-17 21:48:09.716203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6d1f9a3e852'
+down_revision: Union[str, Sequence[str], None] = 'b83f5e1c7a24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.add_column('users', sa.Column('full_name', sa.String(length=201), sa.Computed("first_name || ' ' || last_name", persisted=True), nullable=True))
+    op.create_index('ix_users_full_name_trgm', 'users', ['full_name'], unique=False, postgresql_using='gin', postgresql_ops={'full_name': 'gin_trgm_ops'})
+    op.create_index('ix_users_email_trgm', 'users', ['email'], unique=False, postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'})
+    op.create_index('ix_audit_logs_action_trgm', 'audit_logs', ['action'], unique=False, postgresql_using='gin', postgresql_ops={'action': 'gin_trgm_ops'})
+    op.create_index('ix_audit_logs_entity_type_trgm', 'audit_logs', ['entity_type'], unique=False, postgresql_using='gin', postgresql_ops={'entity_type': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_audit_logs_entity_type_trgm', table_name='audit_logs', postgresql_using='gin', postgresql_ops={'entity_type': 'gin_trgm_ops'})
+    op.drop_index('ix_audit_logs_action_trgm', table_name='audit_logs', postgresql_using='gin', postgresql_ops={'action': 'gin_trgm_ops'})
+    op.drop_index('ix_users_email_trgm', table_name='users', postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'})
+    op.drop_index('ix_users_full_name_trgm', table_name='users', postgresql_using='gin', postgresql_ops={'full_name': 'gin_trgm_ops'})
+    op.drop_column('users', 'full_name')
+    # La extensión se deja instalada: otras bases u objetos pueden usarla
@@ -0,0 +1,64 @@
+"""contadores de inventario por ambiente
+
+Revision ID: d4a8e2b6c197
+Revises: c6d1f9a3e852
+Create Date: 2026-10-17 23:12:51.304729
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a8e2b6c197'
+down_revision: Union[str, Sequence[str], None] = 'c6d1f9a3e852'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COUNTER_COLUMNS = (
+    'total_items', 'available_items', 'in_use_items', 'maintenance_items', 'damaged_items',
+    'lost_items', 'missing_items', 'good_items',
+    'total_quantity', 'damaged_quantity', 'missing_quantity', 'good_quantity',
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('environment_inventory_counters',
+    sa.Column('environment_id', sa.UUID(), nullable=False),
+    *[sa.Column(column, sa.Integer(), server_default='0', nullable=False) for column in COUNTER_COLUMNS],
+    sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+    sa.ForeignKeyConstraint(['environment_id'], ['environments.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('environment_id')
+    )
+
+    # Carga inicial; desde aquí los mantiene la app (services/inventory_counters.py)
+    op.execute(f"""
+        INSERT INTO environment_inventory_counters (environment_id, {', '.join(COUNTER_COLUMNS)})
+        SELECT
+            environment_id,
+            count(*),
+            count(*) FILTER (WHERE status = 'available'),
+            count(*) FILTER (WHERE status = 'in_use'),
+            count(*) FILTER (WHERE status = 'maintenance'),
+            count(*) FILTER (WHERE status = 'damaged'),
+            count(*) FILTER (WHERE status = 'lost'),
+            count(*) FILTER (WHERE status = 'missing'),
+            count(*) FILTER (WHERE status = 'good'),
+            COALESCE(sum(quantity), 0),
+            COALESCE(sum(quantity_damaged), 0),
+            COALESCE(sum(quantity_missing), 0),
+            COALESCE(sum(GREATEST(
+                CASE WHEN quantity = 0 THEN 1 ELSE quantity END - quantity_damaged - quantity_missing, 0
+            )), 0)
+        FROM inventory_items
+        WHERE environment_id IS NOT NULL
+        GROUP BY environment_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('environment_inventory_counters')
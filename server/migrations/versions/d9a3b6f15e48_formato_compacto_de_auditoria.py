@@ -0,0 +1,83 @@
+"""formato compacto de auditoria
+
+Revision ID: d9a3b6f15e48
+Revises: c41f8e0b2d77
+Create Date: 2026-10-17 11:26:05.381207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9a3b6f15e48'
+down_revision: Union[str, Sequence[str], None] = 'c41f8e0b2d77'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Filas por lote del backfill; cada lote se confirma por separado
+BACKFILL_BATCH_SIZE = 5000
+
+# Pasa los campos de new_values a las columnas tipadas, guarda query y cuerpo
+# en request_body (JSON sin comprimir) y deja en new_values solo la descripción
+# y el ambiente. Los headers de respuesta se descartan.
+BACKFILL_SQL = sa.text("""
+    UPDATE audit_logs SET
+        method = left(new_values->'request'->>'method', 10),
+        path = left(new_values->'request'->>'path', 255),
+        status_code = (new_values->'response'->>'status_code')::smallint,
+        duration_ms = round((new_values->>'duration_seconds')::numeric * 1000)::integer,
+        request_body = CASE
+            WHEN new_values->'request'->'body' IS NULL OR new_values->'request'->'body' = 'null'::jsonb THEN NULL
+            ELSE convert_to(jsonb_build_object(
+                'query', new_values->'request'->'query_params',
+                'body', new_values->'request'->'body'
+            )::text, 'UTF8')
+        END,
+        new_values = jsonb_strip_nulls(jsonb_build_object(
+            'description', new_values->'description',
+            'environment_id', new_values->'request'->'body'->>'environment_id'
+        ))
+    WHERE id = ANY(:ids) AND new_values ? 'request'
+""")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('audit_logs', sa.Column('method', sa.String(length=10), nullable=True))
+    op.add_column('audit_logs', sa.Column('path', sa.String(length=255), nullable=True))
+    op.add_column('audit_logs', sa.Column('status_code', sa.SmallInteger(), nullable=True))
+    op.add_column('audit_logs', sa.Column('duration_ms', sa.Integer(), nullable=True))
+    op.add_column('audit_logs', sa.Column('request_body', sa.LargeBinary(), nullable=True))
+
+    # Backfill por lotes con keyset sobre id, fuera de la transacción de la
+    # migración para no mantener bloqueadas todas las filas hasta el final
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        last_id = None
+        while True:
+            if last_id is None:
+                ids = conn.execute(
+                    sa.text("SELECT id FROM audit_logs ORDER BY id LIMIT :limit"),
+                    {"limit": BACKFILL_BATCH_SIZE},
+                ).scalars().all()
+            else:
+                ids = conn.execute(
+                    sa.text("SELECT id FROM audit_logs WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                    {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE},
+                ).scalars().all()
+            if not ids:
+                break
+            conn.execute(BACKFILL_SQL, {"ids": list(ids)})
+            last_id = ids[-1]
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('audit_logs', 'request_body')
+    op.drop_column('audit_logs', 'duration_ms')
+    op.drop_column('audit_logs', 'status_code')
+    op.drop_column('audit_logs', 'path')
+    op.drop_column('audit_logs', 'method')
@@ -0,0 +1,138 @@
+"""particionar audit_logs por mes
+
+Revision ID: e5c1a7f3b920
+Revises: d9a3b6f15e48
+Create Date: 2026-10-17 15:02:44.518930
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5c1a7f3b920'
+down_revision: Union[str, Sequence[str], None] = 'd9a3b6f15e48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Meses futuros que se crean de una vez; después los mantiene la app
+MONTHS_AHEAD = 3
+COPY_BATCH_SIZE = 5000
+
+COLUMNS = (
+    "id, user_id, action, entity_type, entity_id, old_values, new_values, ip_address, "
+    "user_agent, session_id, method, path, status_code, duration_ms, request_body"
+)
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _audit_log_columns():
+    return [
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('user_id', sa.UUID(), nullable=True),
+        sa.Column('action', sa.String(length=100), nullable=False),
+        sa.Column('entity_type', sa.String(length=50), nullable=False),
+        sa.Column('entity_id', sa.UUID(), nullable=True),
+        sa.Column('old_values', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('new_values', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('ip_address', postgresql.INET(), nullable=True),
+        sa.Column('user_agent', sa.Text(), nullable=True),
+        sa.Column('session_id', sa.String(length=100), nullable=True),
+        sa.Column('method', sa.String(length=10), nullable=True),
+        sa.Column('path', sa.String(length=255), nullable=True),
+        sa.Column('status_code', sa.SmallInteger(), nullable=True),
+        sa.Column('duration_ms', sa.Integer(), nullable=True),
+        sa.Column('request_body', sa.LargeBinary(), nullable=True),
+    ]
+
+
+def _copy_in_batches(source: str, created_at: str) -> None:
+    """
+    Copia source a audit_logs por lotes con keyset sobre id, fuera de la
+    transacción de la migración. ON CONFLICT hace que repetir un lote no duplique.
+    """
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        last_id = None
+        while True:
+            if last_id is None:
+                ids = conn.execute(
+                    sa.text(f"SELECT id FROM {source} ORDER BY id LIMIT :limit"),
+                    {"limit": COPY_BATCH_SIZE},
+                ).scalars().all()
+            else:
+                ids = conn.execute(
+                    sa.text(f"SELECT id FROM {source} WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                    {"last_id": last_id, "limit": COPY_BATCH_SIZE},
+                ).scalars().all()
+            if not ids:
+                break
+            conn.execute(
+                sa.text(
+                    f"INSERT INTO audit_logs ({COLUMNS}, created_at) "
+                    f"SELECT {COLUMNS}, {created_at} FROM {source} WHERE id = ANY(:ids) "
+                    f"ON CONFLICT DO NOTHING"
+                ),
+                {"ids": list(ids)},
+            )
+            last_id = ids[-1]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # La tabla actual se renombra (junto con su PK, cuyo índice ocupa el nombre)
+    # y se copia a la particionada por lotes
+    op.rename_table('audit_logs', 'audit_logs_unpartitioned')
+    op.execute('ALTER INDEX audit_logs_pkey RENAME TO audit_logs_unpartitioned_pkey')
+
+    op.create_table('audit_logs',
+    *_audit_log_columns(),
+    sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id', 'created_at'),
+    postgresql_partition_by='RANGE (created_at)'
+    )
+
+    conn = op.get_bind()
+    oldest = conn.execute(sa.text("SELECT min(created_at) FROM audit_logs_unpartitioned")).scalar()
+    today = date.today()
+    month = date(oldest.year, oldest.month, 1) if oldest else date(today.year, today.month, 1)
+    last = _add_months(date(today.year, today.month, 1), MONTHS_AHEAD)
+    while month <= last:
+        following = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE audit_logs_{month.year:04d}_{month.month:02d} PARTITION OF audit_logs "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+        )
+        month = following
+    # Red de seguridad para filas fuera de los meses creados (reloj adelantado,
+    # mantenimiento atrasado); la app las mueve a su mes al crear la partición
+    op.execute("CREATE TABLE audit_logs_default PARTITION OF audit_logs DEFAULT")
+
+    # Filas sin fecha (created_at era nullable) quedan en el mes actual
+    _copy_in_batches('audit_logs_unpartitioned', 'COALESCE(created_at, CURRENT_TIMESTAMP)')
+    op.drop_table('audit_logs_unpartitioned')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.rename_table('audit_logs', 'audit_logs_partitioned')
+    op.execute('ALTER TABLE audit_logs_partitioned RENAME CONSTRAINT audit_logs_pkey TO audit_logs_partitioned_pkey')
+
+    op.create_table('audit_logs',
+    *_audit_log_columns(),
+    sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    _copy_in_batches('audit_logs_partitioned', 'created_at')
+    # Borra la tabla particionada junto con todas sus particiones
+    op.drop_table('audit_logs_partitioned')
@@ -0,0 +1,35 @@
+"""indices de paginacion de auditoria
+
+Revision ID: f2b8d4c6a913
+Revises: e5c1a7f3b920
+Create Date: 2026-10-17 16:40:12.073315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b8d4c6a913'
+down_revision: Union[str, Sequence[str], None] = 'e5c1a7f3b920'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # En una tabla particionada el índice del padre se crea en cada partición
+    op.create_index('ix_audit_logs_created_at_id', 'audit_logs', ['created_at', 'id'], unique=False)
+    op.create_index('ix_audit_logs_user_id_created_at_id', 'audit_logs', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_audit_logs_entity_type_created_at_id', 'audit_logs', ['entity_type', 'created_at', 'id'], unique=False)
+    op.create_index('ix_audit_logs_action_created_at_id', 'audit_logs', ['action', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_audit_logs_action_created_at_id', table_name='audit_logs')
+    op.drop_index('ix_audit_logs_entity_type_created_at_id', table_name='audit_logs')
+    op.drop_index('ix_audit_logs_user_id_created_at_id', table_name='audit_logs')
+    op.drop_index('ix_audit_logs_created_at_id', table_name='audit_logs')
@@ -0,0 +1,76 @@
+"""
+Calibra los costos de argon2id para un presupuesto de latencia por hash en el
+hardware actual y muestra las variables a copiar en el .env.
+
+    cd server
+    python -m scripts.calibrate_argon2 --target-ms 250 --memory-mib 64 --parallelism 4
+
+Sube ARGON2_TIME_COST hasta alcanzar el presupuesto; si con time_cost=1 ya se
+excede, reduce la memoria a la mitad (mínimo --min-memory-mib).
+"""
+import argparse
+import statistics
+import time
+
+from argon2 import PasswordHasher, Type
+
+def _median_hash_ms(time_cost: int, memory_kib: int, parallelism: int, samples: int) -> float:
+    hasher = PasswordHasher(
+        time_cost=time_cost,
+        memory_cost=memory_kib,
+        parallelism=parallelism,
+        type=Type.ID,
+    )
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        hasher.hash("calibration-password")
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def calibrate(target_ms: float, memory_kib: int, min_memory_kib: int, parallelism: int, samples: int, max_time_cost: int):
+    while True:
+        elapsed = _median_hash_ms(1, memory_kib, parallelism, samples)
+        print(f"  t=1 m={memory_kib // 1024}MiB p={parallelism}: {elapsed:.1f} ms")
+        if elapsed <= target_ms or memory_kib // 2 < min_memory_kib:
+            break
+        memory_kib //= 2
+
+    time_cost = 1
+    while time_cost < max_time_cost:
+        candidate = _median_hash_ms(time_cost + 1, memory_kib, parallelism, samples)
+        print(f"  t={time_cost + 1} m={memory_kib // 1024}MiB p={parallelism}: {candidate:.1f} ms")
+        if candidate > target_ms:
+            break
+        time_cost += 1
+        elapsed = candidate
+
+    return time_cost, memory_kib, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--memory-mib", type=int, default=64)
+    parser.add_argument("--min-memory-mib", type=int, default=8)
+    parser.add_argument("--parallelism", type=int, default=4)
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--max-time-cost", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"Calibrando argon2id para ~{args.target_ms:.0f} ms por hash...")
+    time_cost, memory_kib, elapsed = calibrate(
+        args.target_ms,
+        args.memory_mib * 1024,
+        args.min_memory_mib * 1024,
+        args.parallelism,
+        args.samples,
+        args.max_time_cost,
+    )
+
+    print(f"\nResultado: {elapsed:.1f} ms por hash\n")
+    print(f"ARGON2_TIME_COST={time_cost}")
+    print(f"ARGON2_MEMORY_COST={memory_kib}")
+    print(f"ARGON2_PARALLELISM={args.parallelism}")
+
+if __name__ == "__main__":
+    main()